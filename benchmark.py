@@ -0,0 +1,310 @@
+import argparse
+import cProfile
+import io
+import json
+import logging
+import pstats
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import single_month_backtest_copy2 as backtest
+from option_chain import OptionChainIndex
+from pnl_recorder import PNL_WRITERS, PnlRecorder
+from position_journal import PositionJournal
+from run_backtest import MONTH_FORMAT
+from strategy_config import DEFAULT_CONFIG
+
+BENCH_MONTH = 'MAR_2024'
+BENCH_EXPIRY = '28MAR24'
+
+# Strikes listed on each side of the ATM and trading days per size
+SIZES = {
+    'small': {'strikes': 20, 'days': 1},
+    'medium': {'strikes': 40, 'days': 3},
+    'large': {'strikes': 80, 'days': 5},
+}
+
+
+def normal_cdf(x):
+    # Abramowitz-Stegun 7.1.26; plenty for synthetic prices and avoids a scipy dependency
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    erf = 1 - t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429)))) * np.exp(-z * z)
+    return 0.5 * (1 + np.sign(x) * erf)
+
+
+def write_synthetic_month(root, month_name=BENCH_MONTH, expiry_date=BENCH_EXPIRY, days=1, strikes=20, seed=0, drop=0.02, spot=22000.0):
+    # Index and option day files in the vendor layout (<root>/index/<month>/, <root>/options/<month>/):
+    # a random-walk NIFTY spot, Black-Scholes-style NIFTY and BANKNIFTY option closes around the
+    # opening ATM, sorted by ticker then time, with `drop` of the option bars missing at random
+    rng = np.random.default_rng(seed)
+    index_dir = Path(root) / 'index' / month_name
+    option_dir = Path(root) / 'options' / month_name
+    index_dir.mkdir(parents=True, exist_ok=True)
+    option_dir.mkdir(parents=True, exist_ok=True)
+    times = pd.date_range('2000-01-01 09:15:59', '2000-01-01 15:29:59', freq='min').strftime('%H:%M:%S').to_numpy()
+    n_bars = len(times)
+    expiry = datetime.strptime(expiry_date, '%d%b%y')
+
+    day = datetime.strptime(month_name, MONTH_FORMAT)
+    written = 0
+    while written < days:
+        if day.weekday() < 5:
+            path = spot * np.exp(np.cumsum(rng.normal(0, 0.0008, n_bars)))
+            spot = path[-1]
+            date_str, file_date = day.strftime('%d/%m/%Y'), day.strftime('%d%m%Y')
+            pd.DataFrame({'Ticker': 'NIFTY', 'Date': date_str, 'Time': times, 'Open': path, 'High': path, 'Low': path,
+                          'Close': np.round(path, 2)}).to_csv(index_dir / f'NIFTY_GFDLCM_INDICES_{file_date}.csv', index=False)
+
+            frames = []
+            atm = round(path[0] / 50) * 50
+            sigma = 0.15 * np.sqrt(max((expiry - day).days + 1, 1) / 365)
+            for underlying, scale in (('BANKNIFTY', 2.1), ('NIFTY', 1.0)):
+                underlying_path = path * scale
+                for strike in range(atm - strikes * 50, atm + strikes * 50 + 1, 50):
+                    strike = int(strike * scale) if underlying == 'BANKNIFTY' else strike
+                    d1 = (np.log(underlying_path / strike) + 0.5 * sigma ** 2) / sigma
+                    call = underlying_path * normal_cdf(d1) - strike * normal_cdf(d1 - sigma)
+                    for option_type, price in (('CE', call), ('PE', call - underlying_path + strike)):
+                        price = np.maximum(np.round(price, 2), 0.05)
+                        # The first bars are always present so the fly can be opened at the entry time
+                        keep = (rng.random(n_bars) > drop) | (np.arange(n_bars) < 7)
+                        frames.append(pd.DataFrame({
+                            'Ticker': f'{underlying}{expiry_date}{strike}{option_type}.NFO', 'Date': date_str, 'Time': times[keep],
+                            'Open': price[keep], 'High': price[keep], 'Low': price[keep], 'Close': price[keep],
+                            'Volume': 100, 'Open Interest': 1000,
+                        }))
+            frames.append(pd.DataFrame({'Ticker': 'NIFTY-I.NFO', 'Date': date_str, 'Time': times, 'Open': path, 'High': path,
+                                        'Low': path, 'Close': np.round(path, 2), 'Volume': 1, 'Open Interest': 1}))
+            pd.concat(frames).sort_values(['Ticker', 'Time'], kind='stable').to_csv(
+                option_dir / f'NIFTY_GFDLNFO_NIFTY_BANKNIFTY_{file_date}.csv', index=False)
+            written += 1
+        day += timedelta(days=1)
+    return Path(root) / 'index', Path(root) / 'options'
+
+
+class BenchmarkData:
+    # Everything the benchmarks share for one size: the parsed days and the opened iron fly
+
+    def __init__(self, root, size, seed=0):
+        params = SIZES[size]
+        self.size = size
+        self.index_dir, self.option_dir = write_synthetic_month(Path(root) / size, days=params['days'], strikes=params['strikes'], seed=seed)
+        index_file, first_option_file = backtest.find_first_matching_csv(self.index_dir, self.option_dir, BENCH_MONTH)
+        self.option_files = backtest.find_all_matching_option_files(self.option_dir, BENCH_MONTH)
+        self.index_df = backtest.load_and_preprocess(index_file, DEFAULT_CONFIG.entry_time)
+        self.days = [backtest.load_and_preprocess(f, DEFAULT_CONFIG.entry_time) for f in self.option_files]
+        self.rows = sum(len(df) for df in self.days)
+        exit_time = pd.to_datetime(DEFAULT_CONFIG.exit_time).time()
+        self.bars = sum(df.loc[df['Time'] <= exit_time, 'Time'].nunique() for df in self.days)
+        self.first_chain = OptionChainIndex(self.days[0])
+        self.result = None
+
+    def open_fly(self):
+        return backtest.open_iron_fly(self.index_df, self.first_chain, BENCH_EXPIRY)
+
+    def run_month(self, monitor):
+        position_book, strikes = self.open_fly()
+        journal, recorder = PositionJournal(None), PnlRecorder(None)
+        for option_file, option_df in zip(self.option_files, self.days):
+            monitor(position_book, option_df, option_file, strikes['ce_buy'], strikes['pe_buy'], strikes['ce_sell'], strikes['pe_sell'],
+                    BENCH_EXPIRY, BENCH_MONTH, journal, recorder)
+            recorder.flush()
+        return position_book, recorder.to_frame()
+
+    def month_result(self):
+        # Vectorized run of the month, kept as the input of the writer benchmarks
+        if self.result is None:
+            self.result = self.run_month(backtest.monitor_positions_vectorized)
+        return self.result
+
+
+def bench_load(data, workdir):
+    for option_file in data.option_files:
+        backtest.load_and_preprocess(option_file, DEFAULT_CONFIG.entry_time)
+    return data.rows, 'rows'
+
+
+def make_bench_lookups(n_lookups=20000):
+    def bench_get_current_price(data, workdir):
+        _, strikes = data.open_fly()
+        legs = [(strikes['ce_sell'], 'CE'), (strikes['pe_sell'], 'PE'), (strikes['ce_buy'], 'CE'), (strikes['pe_buy'], 'PE')]
+        rng = np.random.default_rng(1)
+        times = data.days[0]['Time'].unique()
+        picks = zip(rng.integers(0, len(legs), n_lookups), rng.integers(0, len(times), n_lookups))
+        for leg, at in picks:
+            strike, option_type = legs[leg]
+            backtest.get_current_price(data.first_chain, strike, option_type, BENCH_EXPIRY, times[at], 'benchmark')
+        return n_lookups, 'lookups'
+    return bench_get_current_price
+
+
+def bench_monitor_loop(data, workdir):
+    data.run_month(backtest.monitor_positions)
+    return data.bars, 'bars'
+
+
+def bench_monitor_vectorized(data, workdir):
+    data.run_month(backtest.monitor_positions_vectorized)
+    return data.bars, 'bars'
+
+
+def make_bench_writer(pnl_format):
+    def bench_writer(data, workdir):
+        _, pnl_df = data.month_result()
+        path = Path(workdir) / f'bench_pnl.{pnl_format}'
+        if pnl_format == 'csv':
+            pnl_df.to_csv(path, index=False)
+        else:
+            PNL_WRITERS[pnl_format](pnl_df, path)
+        return len(pnl_df), 'rows'
+    return bench_writer
+
+
+def bench_positions_json(data, workdir):
+    # Final positions json plus a journal with a day-end checkpoint per day, as run_option_files writes them
+    position_book, _ = data.month_result()
+    journal = PositionJournal(Path(workdir) / 'bench.journal.jsonl')
+    for n_day in range(len(data.days)):
+        journal.snapshot(position_book, checkpoint={'completed_files': [f.name for f in data.option_files[:n_day + 1]], 'pnl_rows': 0})
+    journal.close()
+    with open(Path(workdir) / 'bench_positions.json', 'w') as f:
+        json.dump(position_book.to_dict(), f, indent=4)
+    return len(position_book), 'positions'
+
+
+BENCHMARKS = {
+    'load_and_preprocess': bench_load,
+    'get_current_price': make_bench_lookups(),
+    'monitor_positions': bench_monitor_loop,
+    'monitor_positions_vectorized': bench_monitor_vectorized,
+    'write_xlsx': make_bench_writer('xlsx'),
+    'write_parquet': make_bench_writer('parquet'),
+    'write_csv': make_bench_writer('csv'),
+    'write_positions_json': bench_positions_json,
+}
+
+
+def profile_call(profiler, func, args, profile_path):
+    # One extra, profiled run of a benchmark; the report lands next to the results
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.runcall(func, *args)
+        profile.dump_stats(f'{profile_path}.prof')
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(15)
+        logging.info(f"cProfile for {profile_path.name}:\n{out.getvalue()}")
+    elif profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logging.error("pyinstrument is not installed; run with --profile cprofile or pip install pyinstrument")
+            return
+        profile = Profiler()
+        profile.start()
+        func(*args)
+        profile.stop()
+        with open(f'{profile_path}.html', 'w') as f:
+            f.write(profile.output_html())
+        logging.info(f"pyinstrument for {profile_path.name}:\n{profile.output_text()}")
+
+
+def run_benchmark(name, data, workdir, repeat=3, profiler=None, profile_dir=None):
+    func = BENCHMARKS[name]
+    func(data, workdir)  # warm-up: imports, caches and the lazily built inputs of the writer benchmarks
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        units, unit = func(data, workdir)
+        timings.append(time.perf_counter() - started)
+
+    # Peak memory comes from a separate run since tracemalloc slows the timed ones down
+    tracemalloc.start()
+    func(data, workdir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if profiler:
+        profile_call(profiler, func, (data, workdir), Path(profile_dir) / f'{name}_{data.size}')
+
+    best = min(timings)
+    return {
+        'benchmark': name,
+        'size': data.size,
+        'seconds': round(best, 6),
+        'units': units,
+        'unit': unit,
+        'per_second': round(units / best, 1) if best > 0 else None,
+        'peak_mb': round(peak / 2 ** 20, 2),
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    # Flags every benchmark that got slower than the stored baseline by more than `tolerance`
+    stored = {(row['benchmark'], row['size']): row for row in baseline.get('results', [])}
+    regressions = []
+    for row in results:
+        base = stored.get((row['benchmark'], row['size']))
+        if base is None or not base['seconds']:
+            row['vs_baseline'] = None
+            continue
+        row['vs_baseline'] = round(row['seconds'] / base['seconds'], 3)
+        if row['vs_baseline'] > 1 + tolerance:
+            regressions.append(row)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the backtest hot path on synthetic data.')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=None, help='where the synthetic data is written (default: a temporary directory)')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown vs baseline reported as a regression')
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None)
+    parser.add_argument('--profile-dir', default='profiles')
+    parser.add_argument('--output', default=None, help='optional CSV of the results')
+    args = parser.parse_args()
+
+    backtest.setup_logging('benchmark.log', console_level='INFO')
+    if args.profile:
+        Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_root = Path(args.data_dir or tmp)
+        results = []
+        for size in args.sizes:
+            data = BenchmarkData(data_root, size)
+            logging.info(f"{size}: {len(data.days)} days, {data.rows} option rows, {data.bars} bars")
+            for name in args.benchmarks:
+                results.append(run_benchmark(name, data, tmp, args.repeat, args.profile, args.profile_dir))
+
+    regressions = []
+    if Path(args.baseline).exists() and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+
+    table = pd.DataFrame(results)
+    logging.info(f"Benchmark results:\n{table.to_string(index=False)}")
+    if args.output:
+        table.to_csv(args.output, index=False)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'results': results}, f, indent=4)
+        logging.info(f"Saved baseline to {args.baseline}")
+    for row in regressions:
+        logging.error(f"Regression: {row['benchmark']} ({row['size']}) took {row['vs_baseline']}x the baseline time")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+import argparse
+import heapq
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import single_month_backtest_copy2 as backtest
+from cost_model import COST_MODELS, NO_COSTS, load_cost_model
+from pnl_metrics import monthly_metrics, trade_costs, trade_pnl
+
+TRADE_COLUMNS = ['strike', 'optiontype', 'BUY/SELL', 'price', 'current_price', 'Datetime']
+# Kept next to the trades for their PnL and costs, not written to combined_pnl_reports.csv
+QTY_COLUMN = 'qty'
+
+
+def parse_datetimes(values):
+    # Position dates come as '03/07/2023 09:20:59' (day first) or ISO '2023-07-03 09:20:59'
+    values = pd.Series(values, dtype=str)
+    day_first = values.str[2:3] == '/'
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    if day_first.any():
+        parsed[day_first] = pd.to_datetime(values[day_first], format='%d/%m/%Y %H:%M:%S')
+    if (~day_first).any():
+        parsed[~day_first] = pd.to_datetime(values[~day_first], format='ISO8601')
+    return parsed
+
+
+def positions_to_trades(position_dict):
+    # One trade row per position: strike, type, side, entry / last price, open time and the
+    # position's lot size (None in files that predate it)
+    return pd.DataFrame([{
+        'strike': pos['strike'],
+        'optiontype': pos['option_type'],
+        'BUY/SELL': 'BUY' if 'buy' in key else 'SELL',
+        'price': pos['entry_price'],
+        'current_price': pos['current_price'],
+        'Datetime': f"{pos['date']} {pos['time']}",
+        QTY_COLUMN: pos.get('qty'),
+    } for key, pos in position_dict.items()], columns=TRADE_COLUMNS + [QTY_COLUMN])
+
+
+def read_month_trades(position_file):
+    # Runs in a worker: one month's trades with normalized datetimes, in time order
+    try:
+        with open(position_file) as f:
+            trades = positions_to_trades(json.load(f))
+        trades['Datetime'] = parse_datetimes(trades['Datetime'])
+        # Positions are stored in the order they were opened, so this is normally a no-op
+        if not trades['Datetime'].is_monotonic_increasing:
+            trades = trades.sort_values('Datetime', kind='stable').reset_index(drop=True)
+        return trades
+    except Exception as e:
+        logging.error(f"Error reading positions file: {position_file} - {e}")
+        return pd.DataFrame(columns=TRADE_COLUMNS + [QTY_COLUMN])
+
+
+def merge_sorted(frames):
+    # Merge frames that are each sorted by Datetime. Months that don't overlap are simply
+    # concatenated in order; only overlapping runs go through a k-way heap merge. Ties keep
+    # frame order, then row order.
+    frames = sorted((df for df in frames if not df.empty), key=lambda df: df['Datetime'].iloc[0])
+    if not frames:
+        return pd.DataFrame(columns=TRADE_COLUMNS + [QTY_COLUMN])
+    ordered = []
+    group = [frames[0]]
+    group_end = frames[0]['Datetime'].iloc[-1]
+    for df in frames[1:]:
+        if df['Datetime'].iloc[0] >= group_end:
+            ordered.append(merge_group(group))
+            group, group_end = [df], df['Datetime'].iloc[-1]
+        else:
+            group.append(df)
+            group_end = max(group_end, df['Datetime'].iloc[-1])
+    ordered.append(merge_group(group))
+    return pd.concat(ordered, ignore_index=True)
+
+
+def merge_group(frames):
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat(frames, ignore_index=True)
+    offsets = np.cumsum([0] + [len(df) for df in frames[:-1]])
+    keys = [zip(df['Datetime'].to_numpy(), range(offset, offset + len(df))) for df, offset in zip(frames, offsets)]
+    order = [row for _, row in heapq.merge(*keys)]
+    return combined.iloc[order]
+
+
+def consolidate(pnl_dir, output_dir, months=None, workers=None, qty=25, cost_model=NO_COSTS):
+    # position jsons -> combined trade table, monthly PnL and metrics, without intermediate CSVs.
+    # Monthly PnL is reported gross, with the cost model's costs and net of them side by side;
+    # combined_metrics.json is over the gross PnL, combined_metrics_net.json over the net.
+    position_files = sorted(Path(pnl_dir).glob('*_positions.json'))
+    if months is not None:
+        position_files = [f for f in position_files if f.name[:-len('_positions.json')] in months]
+    if not position_files:
+        logging.error(f"No position files found in: {pnl_dir}")
+        return None
+
+    if workers == 1:
+        frames = [read_month_trades(f) for f in position_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(read_month_trades, position_files))
+    trades = merge_sorted(frames).reset_index(drop=True)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    trades[TRADE_COLUMNS].to_csv(output_dir / 'combined_pnl_reports.csv', index=False)
+
+    # PnL for each trade based on BUY or SELL action, scaling by its position's lot size (qty
+    # only for positions that do not record one)
+    pnl = trade_pnl(trades, qty)
+    costs = trade_costs(trades, qty, cost_model)
+    trade_months = trades['Datetime'].dt.to_period('M')
+    monthly_pnl = pnl.groupby(trade_months).sum()
+    monthly_costs = costs.groupby(trade_months).sum()
+    monthly = pd.DataFrame({'PnL': monthly_pnl, 'Costs': monthly_costs, 'NetPnL': monthly_pnl - monthly_costs})
+    monthly.rename_axis('Month').reset_index().to_csv(output_dir / 'monthly_pnl.csv', index=False)
+
+    metrics = monthly_metrics(monthly_pnl)
+    with open(output_dir / 'combined_metrics.json', 'w') as f:
+        json.dump(metrics, f, indent=4)
+    with open(output_dir / 'combined_metrics_net.json', 'w') as f:
+        json.dump(monthly_metrics(monthly['NetPnL']), f, indent=4)
+    return trades, monthly_pnl, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consolidate the per-month position files into the combined trade table, monthly PnL and metrics.')
+    parser.add_argument('--pnl-dir', default=backtest.output_dir, help='directory of <MONTH>_positions.json files')
+    parser.add_argument('--output-dir', default=None, help='where the combined outputs go (default: parent of --pnl-dir)')
+    parser.add_argument('--months', nargs='*', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--qty', type=int, default=25, help='lot size of positions whose file does not record one (see underlyings.py)')
+    parser.add_argument('--costs', default='nse', help=f"cost model for the net PnL: {', '.join(COST_MODELS)} or a JSON file of CostModel fields (see cost_model.py)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    started = time.perf_counter()
+    result = consolidate(args.pnl_dir, args.output_dir or Path(args.pnl_dir).parent, args.months, args.workers, args.qty, load_cost_model(args.costs))
+    if result is not None:
+        trades, monthly_pnl, _ = result
+        logging.info(f"Consolidated {len(trades)} trades over {len(monthly_pnl)} months in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import single_month_backtest_copy2 as backtest
+from dataset_catalog import EXPIRY_FORMAT, DatasetCatalog
+from instrumentation import INSTRUMENTS
+from option_greeks import GreeksRecorder, greeks_path
+from pnl_recorder import PnlRecorder
+from position_book import PositionBook
+from position_journal import PositionJournal
+from risk_metrics import risk_summary
+from strategy_config import DEFAULT_CONFIG, StrategyConfig
+from underlyings import UNDERLYINGS, config_for
+
+
+def roll_schedule(catalog, underlying='NIFTY', roll_days=0):
+    # The run's expiry cycles in calendar order: each monthly expiry of the underlying trades
+    # from the day after the previous roll up to its own roll day, the last trading day in the
+    # data on or before the expiry less roll_days trading days. With roll_days=0 the fly is held
+    # into expiry (and settles there when the expiry day is in the data).
+    expiries = {catalog.monthly_expiry(month_name, underlying) for month_name in catalog.months()}
+    expiries = sorted((expiry for expiry in expiries if expiry), key=lambda expiry: datetime.strptime(expiry, EXPIRY_FORMAT))
+    days = [(day, entry) for day, entry in sorted(catalog.days.items()) if entry['option_file']]
+    cycles = []
+    start = 0
+    for expiry_date in expiries:
+        expiry_day = datetime.strptime(expiry_date, EXPIRY_FORMAT).strftime('%Y-%m-%d')
+        end = start
+        while end < len(days) and days[end][0] <= expiry_day:
+            end += 1
+        if end == start:
+            continue
+        end = max(end - roll_days, start + 1)
+        cycles.append({'expiry': expiry_date, 'days': days[start:end]})
+        start = end
+    if start < len(days):
+        logging.error(f"No {underlying} monthly expiry on or after {days[start][0]}; {len(days) - start} trailing days not traded")
+    return cycles
+
+
+class CycleDayLoader(backtest.PrefetchingDayLoader):
+    # A cycle can span month folders: each day file is read through its own month's columnar
+    # cache, the layout run_backtest uses
+
+    def day_cache_dir(self, options_file):
+        return Path(self.cache_dir) / Path(options_file).parent.name if self.cache_dir is not None else None
+
+
+def carry_positions(position_book, fly_book, position_journal):
+    # Add a freshly opened fly to the run's book, its position ids continuing the book's
+    for key, position in fly_book.to_dict().items():
+        key = f"{key.rpartition('_')[0]}_{len(position_book)}"
+        position_book.add(key, position)
+        position_journal.open_position(key, position, position_book)
+
+
+def run_continuous(catalog, output_dir, config=DEFAULT_CONFIG, engine='vectorized', pnl_format='csv', roll_days=0, cache_dir=None,
+                   prefetch_depth=backtest.PREFETCH_DEPTH, prefetch_mb=backtest.PREFETCH_MEMORY_MB, greeks=False, name='continuous'):
+    # One linear pass over every trading day in the catalog: the iron fly is opened on each
+    # cycle's first day, monitored day by day (MonthRun.run_day) and rolled out at the end of
+    # its roll day, squared off at its last marks unless it settled on the expiry day. All
+    # cycles share one position book and one PnL report, so the realized PnL of earlier cycles
+    # carries into the equity of later ones.
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pnl_path = output_dir / f"{name}.{pnl_format}"
+    position_file = output_dir / f"{name}_positions.json"
+    position_book = PositionBook()
+    position_journal = PositionJournal(output_dir / f"{name}_positions.journal.jsonl")
+    pnl_recorder = PnlRecorder(pnl_path)
+    greeks_recorder = GreeksRecorder(greeks_path(pnl_path)) if greeks else None
+
+    cycles = roll_schedule(catalog, config.underlying, roll_days)
+    loader = CycleDayLoader(cache_dir, (config.underlying,), prefetch_depth, prefetch_mb)
+    summary = []
+    try:
+        for cycle in cycles:
+            expiry_date = cycle['expiry']
+            first_day, first_entry = cycle['days'][0]
+            month_name = first_entry['month']
+            month_cache_dir = Path(cache_dir) / month_name if cache_dir is not None else None
+
+            # Open the cycle's fly from its first day; a cycle that cannot open is skipped
+            opened = None
+            if first_entry['index_file']:
+                strike_grid = catalog.strike_grid(month_name, expiry_date, config.underlying)
+                opened = backtest.open_month(month_name, Path(first_entry['index_file']), Path(first_entry['option_file']), expiry_date, config,
+                                             month_cache_dir, None, strike_grid, loader)
+            if opened is None:
+                logging.error(f"Could not open the {expiry_date} cycle on {first_day}; its {len(cycle['days'])} days are not traded")
+                continue
+            fly_book, strikes, initial = opened
+            # The start event names the month folder the cycle opens in, as a monthly run's does
+            position_journal.start(month_name, expiry_date, strikes, config.to_dict())
+            carry_positions(position_book, fly_book, position_journal)
+            if initial is not None:
+                pnl_recorder.record(initial[0], initial[1], position_book.total_pnl())
+
+            index_files = {Path(entry['option_file']).name: Path(entry['index_file']) for _, entry in cycle['days'] if entry['index_file']}
+            run = backtest.MonthRun(position_book, strikes, expiry_date, month_name, position_file, position_journal, pnl_recorder, engine,
+                                    cache_dir=month_cache_dir, config=config, greeks=greeks_recorder, index_files=index_files)
+            # The opening day is in hand; the cycle's other days are read ahead for its legs
+            option_files = [Path(entry['option_file']) for _, entry in cycle['days']]
+            loader.prefetch(option_files, config.entry_time, run.tickers)
+            for options_file in option_files:
+                run.run_day(options_file, loader)
+
+            # Roll out: whatever did not settle is squared off at its last marks
+            roll_day, _ = cycle['days'][-1]
+            roll_date = datetime.strptime(roll_day, '%Y-%m-%d').strftime('%d/%m/%Y')
+            for row in list(position_book.open_rows):
+                backtest.close_at_mark(position_book, position_journal, row, roll_date, config.exit_time)
+            summary.append({'expiry': expiry_date, 'strikes': strikes, 'first_day': first_day, 'roll_day': roll_day,
+                            'days': len(cycle['days']), 'positions': len(position_book), 'equity': position_book.realized})
+            logging.info(f"Rolled out of {expiry_date} on {roll_day}: equity {position_book.realized:.2f}, {len(position_book)} positions")
+    finally:
+        loader.close()
+
+    pnl_recorder.close()
+    with open(position_file, 'w') as f:
+        json.dump(position_book.to_dict(), f, indent=4)
+    position_journal.close()
+    ledger = position_book.ledger()
+    if ledger:
+        pd.DataFrame(ledger).to_csv(output_dir / f"{name}_realized.csv", index=False)
+    with open(output_dir / f"{name}_cycles.json", 'w') as f:
+        json.dump(summary, f, indent=4)
+
+    # The report is already one equity curve: no month offsets to stitch
+    if len(pnl_recorder):
+        df = pnl_recorder.to_frame()
+        timestamps = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'].astype(str), format='%d/%m/%Y %H:%M:%S').to_numpy()
+        with open(output_dir / f"{name}_risk_metrics.json", 'w') as f:
+            json.dump(risk_summary(df['PnL'].to_numpy(dtype=float), df['Date'].astype(str).to_numpy(), timestamps), f, indent=4)
+    return position_book, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the iron fly as one continuous backtest across consecutive expiries.')
+    parser.add_argument('--index-dir', default=backtest.index_dir)
+    parser.add_argument('--option-dir', default=backtest.option_dir)
+    parser.add_argument('--output-dir', default=backtest.output_dir)
+    parser.add_argument('--log-dir', default='logs')
+    parser.add_argument('--catalog', default='dataset_catalog.json', help='dataset catalog (see dataset_catalog.py); built on first use, refreshed for new or changed day files')
+    parser.add_argument('--months', nargs='*', default=None, help='restrict the run to these month folders (default: all of them)')
+    parser.add_argument('--engine', choices=['loop', 'vectorized'], default='vectorized')
+    parser.add_argument('--pnl-format', choices=['xlsx', 'csv', 'parquet'], default='csv')
+    parser.add_argument('--roll-days', type=int, default=0, help='roll into the next expiry this many trading days before expiry (0: hold into expiry)')
+    parser.add_argument('--prefetch', type=int, default=backtest.PREFETCH_DEPTH, help='day files read ahead on a background thread (0: off)')
+    parser.add_argument('--prefetch-mb', type=float, default=backtest.PREFETCH_MEMORY_MB, help='memory the read-ahead day files may take before the thread waits')
+    parser.add_argument('--cache-dir', default=None, help='columnar day-file cache (see day_cache.py); built on first use')
+    parser.add_argument('--greeks', action='store_true', help='write the per-bar portfolio Greeks next to the PnL report')
+    parser.add_argument('--instrument', action='store_true', help='collect hot-path counters and timers into <log-dir>/continuous.instruments.json')
+    parser.add_argument('--config', default=None, help='JSON file of StrategyConfig fields, e.g. a row picked from a parameter sweep')
+    parser.add_argument('--underlying', choices=sorted(UNDERLYINGS), default=None, help="default: the config's")
+    args = parser.parse_args()
+
+    config = DEFAULT_CONFIG
+    if args.config:
+        with open(args.config) as f:
+            config = StrategyConfig.from_dict(json.load(f))
+    config = config_for(args.underlying or config.underlying, config)
+
+    Path(args.log_dir).mkdir(parents=True, exist_ok=True)
+    backtest.setup_logging(Path(args.log_dir) / 'continuous_backtest.log', console_level='INFO')
+    if args.instrument:
+        INSTRUMENTS.enable()
+
+    started = time.perf_counter()
+    catalog = DatasetCatalog.open(args.index_dir, args.option_dir, args.catalog)
+    if args.months:
+        catalog = catalog.subset([month_name.upper() for month_name in args.months])
+    position_book, summary = run_continuous(catalog, args.output_dir, config, args.engine, args.pnl_format, args.roll_days, args.cache_dir,
+                                            args.prefetch, args.prefetch_mb, args.greeks)
+    if INSTRUMENTS.enabled:
+        INSTRUMENTS.log_summary('continuous ')
+        INSTRUMENTS.dump(Path(args.log_dir) / 'continuous.instruments.json')
+    logging.info(f"Ran {len(summary)} expiry cycles, {len(position_book)} positions in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
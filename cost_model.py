@@ -0,0 +1,73 @@
+import json
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+
+import numpy as np
+
+from position_book import SELL
+
+
+@dataclass(frozen=True)
+class CostModel:
+    # Execution costs of option fills, charged on whole arrays of fills at once. A position
+    # pays them twice: on the fill that opens it and on the one that closes it (the last mark
+    # stands in for the closing fill of positions still open at month end).
+    slippage_points: float = 0.0       # per unit against the fill (half the bid/ask spread): sells fill lower, buys higher
+    slippage_pct: float = 0.0          # percent of the fill price, on top of slippage_points
+    brokerage_per_order: float = 0.0   # flat fee per fill
+    exchange_pct: float = 0.0          # exchange transaction charges, percent of the premium traded
+    stt_pct: float = 0.0               # securities transaction tax, percent of the premium sold
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, values):
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in values.items() if k in names})
+
+    def fill_costs(self, prices, orders, qty):
+        # Cost of each fill: prices, orders (BUY / SELL) and qty are arrays or scalars; fills
+        # without a price cost nothing
+        prices = np.asarray(prices, dtype=np.float64)
+        orders = np.asarray(orders)
+        qty = np.asarray(qty, dtype=np.float64)
+        filled = ~np.isnan(prices)
+        prices = np.where(filled, prices, 0.0)
+        premium = prices * qty
+        slippage = (self.slippage_points + prices * self.slippage_pct / 100) * qty
+        stt = np.where(orders == SELL, premium * self.stt_pct / 100, 0.0)
+        costs = slippage + self.brokerage_per_order + premium * self.exchange_pct / 100 + stt
+        return np.where(filled, costs, 0.0)
+
+    def position_costs(self, entry, current, sides, qty):
+        # Opening plus closing costs of positions: a sold position opens with a sell and closes
+        # with a buy, a bought one the other way round
+        sides = np.asarray(sides)
+        return self.fill_costs(entry, sides, qty) + self.fill_costs(current, -sides, qty)
+
+    def book_costs(self, position_book):
+        # Total opening and closing costs of a PositionBook's traded positions
+        n = len(position_book)
+        sides = position_book.side[:n]
+        costs = self.position_costs(position_book.entry[:n], position_book.current[:n], sides, position_book.qty[:n])
+        return float(costs[sides != 0].sum())
+
+
+NO_COSTS = CostModel()
+
+# Cost models by name; --costs also takes a JSON file of CostModel fields
+COST_MODELS = {
+    'none': NO_COSTS,
+    # NSE index options, discount broker (2023-24 rates): Rs 20 an order, 0.0503% exchange
+    # charges, 0.0625% STT on the sell side, and half of a 0.5 point spread lost per fill
+    'nse': CostModel(slippage_points=0.25, brokerage_per_order=20.0, exchange_pct=0.0503, stt_pct=0.0625),
+}
+
+
+def load_cost_model(value):
+    # A COST_MODELS name or the path of a JSON file of CostModel fields
+    if value in COST_MODELS:
+        return COST_MODELS[value]
+    with open(Path(value)) as f:
+        return CostModel.from_dict(json.load(f))
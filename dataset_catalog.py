@@ -0,0 +1,237 @@
+import argparse
+import json
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from option_chain import TICKER_PATTERN
+
+CATALOG_VERSION = 2
+MONTH_FORMAT = '%b_%Y'    # APR_2023
+EXPIRY_FORMAT = '%d%b%y'  # 27APR23
+# Day files end in their date: NIFTY_GFDLCM_INDICES_01032024.csv / NIFTY_GFDLNFO_NIFTY_BANKNIFTY_01032024.csv
+DAY_FILE_PATTERN = re.compile(r'_(\d{8})\.csv$')
+MONTH_PATTERN = re.compile(r'[A-Za-z]{3}_\d{4}')
+
+
+def data_roots(data_dir):
+    # Data is laid out per year (.../2024/MAR_2024): a year folder brings in its sibling years
+    data_dir = Path(data_dir)
+    if re.fullmatch(r'\d{4}', data_dir.name) and data_dir.parent.exists():
+        return sorted(p for p in data_dir.parent.iterdir() if p.is_dir() and re.fullmatch(r'\d{4}', p.name))
+    return [data_dir]
+
+
+def scan_day_files(data_dir):
+    # {'YYYY-MM-DD': (month folder, path)} for every day file under the data roots
+    days = {}
+    for root in data_roots(data_dir):
+        for path in root.rglob('*.csv'):
+            match = DAY_FILE_PATTERN.search(path.name)
+            if not match:
+                continue
+            day = datetime.strptime(match.group(1), '%d%m%Y').strftime('%Y-%m-%d')
+            days[day] = (path.parent.name, path)
+    return days
+
+
+def signature(path):
+    stat = Path(path).stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def encode_strikes(strikes):
+    # Sorted strikes as [first, last, step] runs: a strike grid is a few arithmetic runs
+    # (50 apart near the money, 100 further out), so this is a handful of numbers per expiry
+    runs = []
+    for strike in sorted(set(strikes)):
+        if runs and runs[-1][2] == 0:
+            # A single strike run takes its step from the next strike
+            runs[-1][1:] = [strike, strike - runs[-1][0]]
+        elif runs and strike - runs[-1][1] == runs[-1][2]:
+            runs[-1][1] = strike
+        else:
+            runs.append([strike, strike, 0])
+    return runs
+
+
+def decode_strikes(runs):
+    strikes = []
+    for first, last, step in runs:
+        strikes.extend(range(first, last + 1, step) if step else [first])
+    return np.asarray(strikes, dtype=np.int64)
+
+
+def listed_contracts(option_file):
+    # Runs in a worker: {underlying: {expiry: strike runs}} of the options in one day file,
+    # counting a strike only when both its CE and PE are listed
+    try:
+        tickers = pd.read_csv(option_file, usecols=['Ticker'], dtype={'Ticker': 'category'})['Ticker'].cat.categories
+        parts = pd.Series(tickers).str.extract(TICKER_PATTERN).dropna()
+        parts['strike'] = parts['strike'].astype(np.int64)
+        both = parts.groupby(['underlying', 'expiry', 'strike'])['option_type'].nunique() == 2
+        contracts = {}
+        for (underlying, expiry, strike), listed in both.items():
+            if listed:
+                contracts.setdefault(underlying, {}).setdefault(expiry, []).append(int(strike))
+        return {underlying: {expiry: encode_strikes(strikes) for expiry, strikes in expiries.items()}
+                for underlying, expiries in contracts.items()}
+    except Exception as e:
+        logging.error(f"Error reading tickers from option file: {option_file} - {e}")
+        return None
+
+
+class DatasetCatalog:
+    # Persisted map of the dataset, built once and refreshed incrementally: every trading day
+    # with its index file, option file and month folder, and the expiries and strike grid of
+    # every underlying listed in that day's option file. Runners look files, monthly expiries
+    # and valid strikes up here instead of globbing the data directories per day.
+
+    def __init__(self, index_dir, option_dir, days=None):
+        self.index_dir = str(Path(index_dir).resolve())
+        self.option_dir = str(Path(option_dir).resolve())
+        self.days = days or {}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != CATALOG_VERSION:
+            raise ValueError(f"Catalog version {data.get('version')} != {CATALOG_VERSION}")
+        return cls(data['index_dir'], data['option_dir'], data['days'])
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'index_dir': self.index_dir, 'option_dir': self.option_dir, 'days': self.days}, f)
+
+    @classmethod
+    def open(cls, index_dir, option_dir, path=None, workers=None):
+        # The persisted catalog at `path` brought up to date, or a new one; saved if anything changed
+        catalog = None
+        if path is not None and Path(path).exists():
+            try:
+                catalog = cls.load(path)
+                if (catalog.index_dir, catalog.option_dir) != (str(Path(index_dir).resolve()), str(Path(option_dir).resolve())):
+                    logging.info(f"Catalog {path} describes other data directories; rebuilding")
+                    catalog = None
+            except Exception as e:
+                logging.error(f"Error loading dataset catalog: {path} - {e}")
+                catalog = None
+        if catalog is None:
+            catalog = cls(index_dir, option_dir)
+        if catalog.refresh(workers) and path is not None:
+            catalog.save(path)
+        return catalog
+
+    def refresh(self, workers=None):
+        # Re-list the data directories; only new or changed option files are read. Returns the
+        # number of days added, changed or removed.
+        index_files = scan_day_files(self.index_dir)
+        option_files = scan_day_files(self.option_dir)
+        days = {}
+        pending = []
+        for day in sorted(set(index_files) | set(option_files)):
+            month, index_file = index_files.get(day, (None, None))
+            option_month, option_file = option_files.get(day, (None, None))
+            entry = {
+                'month': option_month or month,
+                'index_file': str(index_file) if index_file else None,
+                'option_file': str(option_file) if option_file else None,
+                'option_signature': signature(option_file) if option_file else None,
+                'contracts': {},
+            }
+            known = self.days.get(day)
+            if known and known['option_file'] == entry['option_file'] and known['option_signature'] == entry['option_signature']:
+                entry['contracts'] = known['contracts']
+            elif option_file:
+                pending.append(day)
+            days[day] = entry
+
+        if pending:
+            files = [days[day]['option_file'] for day in pending]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for day, contracts in zip(pending, pool.map(listed_contracts, files)):
+                    # An unreadable file is retried on the next refresh
+                    days[day]['contracts'] = contracts or {}
+                    if contracts is None:
+                        days[day]['option_signature'] = None
+
+        changed = len(pending) + len(set(self.days) - set(days))
+        changed += sum(1 for day in days if day in self.days and days[day] != self.days[day] and day not in pending)
+        self.days = days
+        if changed:
+            logging.info(f"Catalog: {len(days)} days, {len(pending)} option files read")
+        return changed
+
+    def subset(self, month_names):
+        # A catalog of just these months, small enough to hand to a worker process
+        days = {day: entry for day, entry in self.days.items() if entry['month'] in month_names}
+        return DatasetCatalog(self.index_dir, self.option_dir, days)
+
+    def month_days(self, month_name):
+        return [(day, entry) for day, entry in sorted(self.days.items()) if entry['month'] == month_name]
+
+    def months(self):
+        # Month folders with option data, in calendar order
+        names = {entry['month'] for entry in self.days.values() if entry['option_file'] and MONTH_PATTERN.fullmatch(entry['month'])}
+        return sorted(names, key=lambda name: datetime.strptime(name, MONTH_FORMAT))
+
+    def option_files(self, month_name):
+        # The month's option day files in date order (find_all_matching_option_files)
+        return [Path(entry['option_file']) for _, entry in self.month_days(month_name) if entry['option_file']]
+
+    def first_files(self, month_name):
+        # (index file, option file) of the month's first day that has both (find_first_matching_csv)
+        for _, entry in self.month_days(month_name):
+            if entry['index_file'] and entry['option_file']:
+                return Path(entry['index_file']), Path(entry['option_file'])
+        return None, None
+
+    def underlyings(self):
+        return sorted({underlying for entry in self.days.values() for underlying in entry['contracts']})
+
+    def expiries(self, month_name, underlying='NIFTY'):
+        # Every expiry of the underlying listed on the month's days, soonest first
+        listed = {expiry for _, entry in self.month_days(month_name) for expiry in entry['contracts'].get(underlying, {})}
+        return sorted(listed, key=lambda expiry: datetime.strptime(expiry, EXPIRY_FORMAT))
+
+    def monthly_expiry(self, month_name, underlying='NIFTY'):
+        # Monthly expiry = the last listed expiry that falls in the month
+        in_month = [expiry for expiry in self.expiries(month_name, underlying)
+                    if datetime.strptime(expiry, EXPIRY_FORMAT).strftime(MONTH_FORMAT).upper() == month_name.upper()]
+        return in_month[-1] if in_month else None
+
+    def strike_grid(self, month_name, expiry_date, underlying='NIFTY'):
+        # Strikes of the expiry listed (CE and PE) on the month's first day with option data
+        for _, entry in self.month_days(month_name):
+            if entry['option_file']:
+                return decode_strikes(entry['contracts'].get(underlying, {}).get(expiry_date, []))
+        return np.zeros(0, dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or refresh the dataset catalog: trading days, their files, and the listed expiries and strikes.')
+    parser.add_argument('--index-dir', required=True)
+    parser.add_argument('--option-dir', required=True)
+    parser.add_argument('--catalog', default='dataset_catalog.json')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    catalog = DatasetCatalog.open(args.index_dir, args.option_dir, args.catalog, args.workers)
+    for month_name in catalog.months():
+        for underlying in catalog.underlyings():
+            expiry = catalog.monthly_expiry(month_name, underlying)
+            grid = catalog.strike_grid(month_name, expiry, underlying) if expiry else []
+            grid_range = f"{grid.min()}-{grid.max()}" if len(grid) else "-"
+            logging.info(f"{month_name} {underlying}: {len(catalog.option_files(month_name))} days, monthly expiry {expiry}, {len(grid)} strikes ({grid_range})")
+
+
+if __name__ == '__main__':
+    main()
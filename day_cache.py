@@ -0,0 +1,199 @@
+import argparse
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import time as dt_time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from option_chain import TICKER_PATTERN
+
+CACHE_VERSION = 1
+OPTION_TYPES = ['CE', 'PE']
+
+# One .npy file per column, memory-mapped on load
+CACHE_COLUMNS = {
+    'ticker': np.int32,       # code into meta['tickers']
+    'underlying': np.uint8,   # code into meta['underlyings']
+    'expiry': np.uint16,      # code into meta['expiries']
+    'strike': np.int32,
+    'option_type': np.int8,   # code into OPTION_TYPES
+    'seconds': np.int32,      # seconds since midnight
+    'close': np.float32,
+}
+
+
+def cache_path_for(csv_path, cache_dir):
+    return Path(cache_dir) / Path(csv_path).stem
+
+
+def source_signature(csv_path):
+    stat = Path(csv_path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_cache_fresh(csv_path, cache_path, underlyings):
+    meta_file = Path(cache_path) / 'meta.json'
+    if not meta_file.exists():
+        return False
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+        return (meta.get('version') == CACHE_VERSION
+                and meta.get('source') == source_signature(csv_path)
+                and set(underlyings) <= set(meta.get('underlyings', ())))
+    except Exception:
+        return False
+
+
+def convert_day_file(csv_path, cache_dir, underlyings=('NIFTY',)):
+    # Parse one raw option day file and write it as a pre-filtered, typed columnar cache:
+    # only option rows of the requested underlyings, ticker split into its parts,
+    # time as int seconds and close as float32
+    cache_path = cache_path_for(csv_path, cache_dir)
+    try:
+        df = pd.read_csv(csv_path, usecols=['Ticker', 'Date', 'Time', 'Close'],
+                         dtype={'Ticker': 'category', 'Date': str, 'Time': str, 'Close': np.float64})
+
+        tickers = df['Ticker'].cat.categories
+        parts = pd.Series(tickers).str.extract(TICKER_PATTERN)
+        wanted = (parts['underlying'].isin(underlyings)).to_numpy()
+        codes = df['Ticker'].cat.codes.to_numpy()
+        rows = (codes >= 0) & wanted[codes]
+
+        # Re-code the surviving tickers densely
+        kept_tickers = np.flatnonzero(wanted)
+        ticker_codes = np.full(len(tickers), -1, dtype=np.int32)
+        ticker_codes[kept_tickers] = np.arange(len(kept_tickers), dtype=np.int32)
+        kept_parts = parts.iloc[kept_tickers].reset_index(drop=True)
+
+        underlying_names = sorted(kept_parts['underlying'].unique())
+        expiry_names = sorted(kept_parts['expiry'].unique())
+        per_ticker = {
+            'underlying': kept_parts['underlying'].map({name: i for i, name in enumerate(underlying_names)}).to_numpy(),
+            'expiry': kept_parts['expiry'].map({name: i for i, name in enumerate(expiry_names)}).to_numpy(),
+            'strike': kept_parts['strike'].astype(np.int64).to_numpy(),
+            'option_type': kept_parts['option_type'].map({name: i for i, name in enumerate(OPTION_TYPES)}).to_numpy(),
+        }
+
+        row_tickers = ticker_codes[codes[rows]]
+        columns = {
+            'ticker': row_tickers,
+            'seconds': pd.to_timedelta(df['Time'].to_numpy()[rows]).total_seconds().to_numpy(),
+            'close': df['Close'].to_numpy()[rows],
+        }
+        for name, values in per_ticker.items():
+            columns[name] = values[row_tickers]
+
+        cache_path.mkdir(parents=True, exist_ok=True)
+        for name, dtype in CACHE_COLUMNS.items():
+            np.save(cache_path / f"{name}.npy", np.asarray(columns[name]).astype(dtype))
+
+        dates = df['Date'].dropna().unique()
+        meta = {
+            'version': CACHE_VERSION,
+            'source': source_signature(csv_path),
+            'date': dates[0] if len(dates) else None,
+            'underlyings': list(underlyings),
+            'tickers': [str(t) for t in tickers[kept_tickers]],
+            'expiries': expiry_names,
+            'underlying_names': underlying_names,
+            'rows': int(rows.sum()),
+        }
+        # meta.json goes last: its presence marks a complete cache entry
+        with open(cache_path / 'meta.json', 'w') as f:
+            json.dump(meta, f)
+        return cache_path
+    except Exception as e:
+        logging.error(f"Error converting day file to cache: {csv_path} - {e}")
+        return None
+
+
+def open_cached_arrays(cache_path):
+    # Memory-mapped columns plus the metadata; nothing is read until a column is touched
+    cache_path = Path(cache_path)
+    with open(cache_path / 'meta.json') as f:
+        meta = json.load(f)
+    arrays = {name: np.load(cache_path / f"{name}.npy", mmap_mode='r') for name in CACHE_COLUMNS}
+    return arrays, meta
+
+
+def seconds_to_times(seconds):
+    # datetime.time objects for an int seconds array, built once per distinct minute
+    uniques, inverse = np.unique(seconds, return_inverse=True)
+    lookup = np.array([dt_time(int(s) // 3600, int(s) % 3600 // 60, int(s) % 60) for s in uniques], dtype=object)
+    return lookup[inverse]
+
+
+def load_cached_day(cache_path, time_filter=None, tickers=None):
+    # Same columns as load_and_preprocess (Ticker, Date, Time, Close) plus the pre-split
+    # Underlying / Expiry / Strike / OptionType / Seconds columns. With tickers, only the rows
+    # of those exact tickers are read out of the memory-mapped columns.
+    try:
+        arrays, meta = open_cached_arrays(cache_path)
+        rows = np.ones(len(arrays['seconds']), dtype=bool)
+        if time_filter:
+            hours, minutes, secs = (int(part) for part in time_filter.split(':'))
+            rows &= np.asarray(arrays['seconds']) >= hours * 3600 + minutes * 60 + secs
+        if tickers is not None:
+            tickers = set(tickers)
+            wanted = [code for code, ticker in enumerate(meta['tickers']) if ticker in tickers]
+            rows &= np.isin(np.asarray(arrays['ticker']), wanted)
+
+        seconds = np.asarray(arrays['seconds'][rows], dtype=np.int64)
+        ticker = np.asarray(arrays['ticker'][rows])
+        n_rows = len(seconds)
+        # Prices are stored as float32; restore the 2-decimal tick values
+        close = np.round(np.asarray(arrays['close'][rows], dtype=np.float64), 2)
+
+        return pd.DataFrame({
+            'Ticker': pd.Categorical.from_codes(ticker, categories=meta['tickers']),
+            'Date': pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8), categories=[meta['date']]),
+            'Time': seconds_to_times(seconds),
+            'Close': close,
+            'Underlying': pd.Categorical.from_codes(np.asarray(arrays['underlying'][rows]), categories=meta['underlying_names']),
+            'Expiry': pd.Categorical.from_codes(np.asarray(arrays['expiry'][rows]), categories=meta['expiries']),
+            'Strike': np.asarray(arrays['strike'][rows]),
+            'OptionType': pd.Categorical.from_codes(np.asarray(arrays['option_type'][rows]), categories=OPTION_TYPES),
+            'Seconds': seconds,
+        })
+    except Exception as e:
+        logging.error(f"Error loading cached day: {cache_path} - {e}")
+        return pd.DataFrame()
+
+
+def cached_day(csv_path, cache_dir, time_filter=None, underlyings=('NIFTY',), tickers=None):
+    # Load a day file through the cache, converting it first if the cache is missing or stale
+    cache_path = cache_path_for(csv_path, cache_dir)
+    if not is_cache_fresh(csv_path, cache_path, underlyings):
+        if convert_day_file(csv_path, cache_dir, underlyings) is None:
+            return pd.DataFrame()
+    return load_cached_day(cache_path, time_filter, tickers)
+
+
+def convert_directory(option_dir, cache_dir, months=None, workers=None, underlyings=('NIFTY',)):
+    # One-time conversion stage: cache every option day file under option_dir/<month>/
+    option_files = []
+    for month_dir in sorted(Path(option_dir).iterdir()):
+        if month_dir.is_dir() and (months is None or month_dir.name in months):
+            option_files.extend(sorted(month_dir.glob('*.csv')))
+    pending = [f for f in option_files if not is_cache_fresh(f, cache_path_for(f, Path(cache_dir) / f.parent.name), underlyings)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for csv_path in pending:
+            pool.submit(convert_day_file, csv_path, Path(cache_dir) / csv_path.parent.name, underlyings)
+    logging.info(f"Cached {len(pending)} of {len(option_files)} option day files into {cache_dir}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert raw option day files into the columnar day cache.')
+    parser.add_argument('option_dir')
+    parser.add_argument('cache_dir')
+    parser.add_argument('--months', nargs='*', default=None)
+    parser.add_argument('--underlyings', nargs='*', default=['NIFTY'])
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    convert_directory(args.option_dir, args.cache_dir, args.months, args.workers, tuple(args.underlyings))
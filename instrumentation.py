@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+NULL_TIMER = nullcontext()
+
+
+class Timer:
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instruments.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Instruments:
+    # Counters, timers and a ring buffer of structured events for the backtest hot path, in place
+    # of per-tick logging.debug calls. Disabled (the default), every call returns after a single
+    # attribute check. Events keep their %-style message and arguments and are only formatted
+    # when read, and only the last `buffer_size` of them are kept. With sample_every=N only every
+    # Nth event of each name is buffered (all of them are still counted). Updates take a lock:
+    # the day-file prefetch thread counts and times its loads next to the engine's counters.
+
+    def __init__(self, enabled=False, buffer_size=10000, sample_every=1):
+        self.enabled = enabled
+        self.sample_every = sample_every
+        self.counters = {}
+        self.timers = {}  # name -> [calls, total seconds, max seconds]
+        self.event_counts = {}
+        self.events = deque(maxlen=buffer_size)
+        self.lock = threading.Lock()
+
+    def enable(self, buffer_size=None, sample_every=None):
+        if buffer_size is not None:
+            self.events = deque(self.events, maxlen=buffer_size)
+        if sample_every is not None:
+            self.sample_every = sample_every
+        self.enabled = True
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.event_counts.clear()
+            self.events.clear()
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def event(self, name, message, *args):
+        if not self.enabled:
+            return
+        with self.lock:
+            seen = self.event_counts.get(name, 0)
+            self.event_counts[name] = seen + 1
+            if seen % self.sample_every == 0:
+                self.events.append((time.time(), name, message, args))
+
+    def timer(self, name):
+        # with instruments.timer('day_file'): ...
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            stats = self.timers.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def formatted_events(self):
+        formatted = []
+        with self.lock:
+            events = list(self.events)
+        for at, name, message, args in events:
+            try:
+                text = message % args if args else message
+            except Exception as e:
+                text = f"{message} {args} (format error: {e})"
+            formatted.append({'time': at, 'event': name, 'message': text})
+        return formatted
+
+    def summary(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {name: {'calls': calls, 'seconds': round(total, 6), 'mean_seconds': round(total / calls, 6), 'max_seconds': round(longest, 6)}
+                           for name, (calls, total, longest) in self.timers.items()},
+                'events': dict(self.event_counts),
+            }
+
+    def log_summary(self, prefix=''):
+        if not self.enabled:
+            return
+        summary = self.summary()
+        logging.info(f"{prefix}counters: {summary['counters']}")
+        for name, stats in summary['timers'].items():
+            logging.info(f"{prefix}timer {name}: {stats['calls']} calls, {stats['seconds']:.3f}s total, {stats['max_seconds']:.3f}s max")
+
+    def dump(self, path):
+        # Summary plus the buffered events, formatted now
+        with open(path, 'w') as f:
+            json.dump({**self.summary(), 'recent_events': self.formatted_events()}, f, indent=4, default=str)
+
+
+# Process-wide instruments; BACKTEST_INSTRUMENT=1 turns them on without code changes
+INSTRUMENTS = Instruments(enabled=os.environ.get('BACKTEST_INSTRUMENT') == '1')
@@ -0,0 +1,455 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import single_month_backtest_copy2 as backtest
+from instrumentation import INSTRUMENTS
+from option_chain import LegGrid, OptionChainIndex, frame_seconds
+from pnl_recorder import PnlRecorder
+from position_journal import PositionJournal, leg_key
+from strategy_config import DEFAULT_CONFIG, StrategyConfig
+
+# Feed messages, one JSON object per line on the wire:
+#   {"date": "01/03/2024", "time": "09:20:59", "index": 22030.5, "quotes": {"22000CE": 120.5, ...}}
+#   {"event": "day_end", "file": "NIFTY_GFDLNFO_NIFTY_BANKNIFTY_01032024.csv", "date": "01/03/2024", "index": 22010.2}
+# A bar needs quotes for the fly's legs only ("index" is only used to open the fly). On the expiry
+# day, day_end's optional "index" is the spot the open positions settle against. Parsed bars
+# carry 'time' as a datetime.time, quotes keyed by (strike, option_type), and 'received_ns',
+# the perf_counter_ns() at which the bar reached this process.
+# The replay adapter sends one extra {"event": "open", ...} bar: the backtest opens the fly from
+# the index file and exact entry-time quotes, while its bars are forward-filled.
+
+
+def parse_bar(message):
+    bar = dict(message)
+    if 'time' in bar and isinstance(bar['time'], str):
+        bar['time'] = datetime.strptime(bar['time'], '%H:%M:%S').time()
+    quotes = {}
+    for key, price in (bar.get('quotes') or {}).items():
+        if isinstance(key, str):
+            key = (int(key[:-2]), key[-2:])
+        quotes[key] = price
+    bar['quotes'] = quotes
+    return bar
+
+
+def bar_message(bar):
+    # The wire form of a bar (see parse_bar)
+    message = {key: value for key, value in bar.items() if key not in ('quotes', 'received_ns', 'time')}
+    if 'time' in bar:
+        message['time'] = bar['time'].strftime('%H:%M:%S')
+    if 'quotes' in bar:
+        message['quotes'] = {leg_key(strike, option_type): price for (strike, option_type), price in bar['quotes'].items()}
+    return message
+
+
+def latency_summary(samples):
+    micros = np.asarray(samples, dtype=np.float64) / 1e3
+    return {
+        'mean_us': round(float(micros.mean()), 1),
+        'p50_us': round(float(np.percentile(micros, 50)), 1),
+        'p90_us': round(float(np.percentile(micros, 90)), 1),
+        'p99_us': round(float(np.percentile(micros, 99)), 1),
+        'max_us': round(float(micros.max()), 1),
+    }
+
+
+class LatencyStats:
+    # Tick-to-decision latency: from a bar reaching this process to the core's decision on it.
+    # It includes the time the bar waited in the queue; 'decision' is the core's share alone.
+    # A fast replay fills the queue ahead of the core, so there the wait dominates.
+
+    def __init__(self):
+        self.tick_to_decision = []
+        self.decision = []
+
+    def add(self, received_ns, dequeued_ns):
+        decided_ns = time.perf_counter_ns()
+        self.tick_to_decision.append(decided_ns - received_ns)
+        self.decision.append(decided_ns - dequeued_ns)
+        if INSTRUMENTS.enabled:
+            INSTRUMENTS.add_time('tick_to_decision', (decided_ns - received_ns) / 1e9)
+
+    def summary(self):
+        if not self.tick_to_decision:
+            return {'bars': 0}
+        return {
+            'bars': len(self.tick_to_decision),
+            'tick_to_decision': latency_summary(self.tick_to_decision),
+            'decision': latency_summary(self.decision),
+        }
+
+
+class PaperTrader:
+    # Consumes parsed bars and drives an IronFlyCore: opens the fly from the first bar in the
+    # entry window that has the index and all four entry quotes, then hands every bar to the
+    # core. Writes the same outputs as a backtest month (PnL report, positions json, journal)
+    # plus <name>.latency.json. Decisions are logged; no orders are sent anywhere.
+    # PnL rows are flushed to the report every `flush_every` bars (0: at day end only), so a
+    # dashboard tailing the report (pnl_dashboard.py) sees them as they happen. At the end of
+    # the expiry day the open positions settle at intrinsic value against the day end's spot.
+
+    def __init__(self, name, expiry_date, output_dir, config=DEFAULT_CONFIG, pnl_format='csv', flush_every=0):
+        self.name = name
+        self.expiry_date = expiry_date
+        self.config = config
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.position_file = self.output_dir / f"{name}_positions.json"
+        self.pnl_recorder = PnlRecorder(self.output_dir / f"{name}.{pnl_format}")
+        self.position_journal = PositionJournal(self.output_dir / f"{name}_positions.journal.jsonl")
+        self.entry_time = datetime.strptime(config.entry_time, '%H:%M:%S').time()
+        self.core = None
+        self.completed_files = []
+        self.decisions = {}
+        self.latency = LatencyStats()
+        self.flush_every = flush_every
+        self.unflushed = 0
+        self.last_bar = None
+
+    def open(self, bar):
+        if bar.get('index') is None or bar['time'] < self.entry_time:
+            return False
+        strikes = backtest.iron_fly_strikes(bar['index'], self.config)
+        option_prices = {name: bar['quotes'].get((strike, 'CE' if name.startswith('ce') else 'PE')) for name, strike in strikes.items()}
+        if any(price is None for price in option_prices.values()):
+            logging.warning(f"Missing entry quotes at {bar['date']} {bar['time']}: {option_prices}; waiting for the next bar")
+            return False
+
+        position_book = backtest.iron_fly_book(bar['date'], bar['time'], strikes, option_prices, self.config)
+        self.position_journal.start(self.name, self.expiry_date, strikes, self.config.to_dict())
+        for key, pos in position_book.to_dict().items():
+            self.position_journal.open_position(key, pos)
+        # Initial PnL of the freshly opened fly
+        self.pnl_recorder.record(bar['date'], bar['time'].strftime('%H:%M:%S'), position_book.total_pnl())
+        self.core = backtest.IronFlyCore(position_book, strikes, self.position_journal, self.pnl_recorder, self.config)
+        logging.info(f"Opened iron fly at {bar['date']} {bar['time']}: {strikes}")
+        return True
+
+    def on_bar(self, bar):
+        dequeued_ns = time.perf_counter_ns()
+        event = bar.get('event')
+        if event == 'day_end':
+            self.end_day(bar.get('file') or bar.get('date'), bar.get('date'), bar.get('index'))
+            return None
+        if self.core is None:
+            opened = self.open(bar)
+            if event == 'open' or not opened:
+                return None
+        elif event == 'open':
+            return None
+
+        core = self.core
+        decision = None
+        # A settled book has nothing left to trade
+        if len(core.position_book.open_rows) and core.is_new_bar(bar['date'], bar['time']):
+            self.last_bar = bar
+            decision = core.on_bar(bar['date'], bar['time'], [bar['quotes'].get(leg) for leg in core.legs])
+            self.decisions[decision] = self.decisions.get(decision, 0) + 1
+            if decision != 'hold':
+                logging.info(f"{bar['date']} {bar['time']}: {decision}, {len(core.position_book)} positions")
+        if 'received_ns' in bar:
+            self.latency.add(bar['received_ns'], dequeued_ns)
+        # Report writes come after the decision and are not part of its latency
+        if decision is not None:
+            self.unflushed += 1
+            if self.flush_every and self.unflushed >= self.flush_every:
+                self.pnl_recorder.flush()
+                self.unflushed = 0
+        return decision
+
+    def end_day(self, day, date=None, spot=None):
+        # Day end: persist the day's PnL rows, then checkpoint the positions
+        self.pnl_recorder.flush()
+        self.unflushed = 0
+        if self.core is None:
+            return
+        if date is None and self.last_bar is not None:
+            date = self.last_bar['date']
+        if len(self.core.position_book.open_rows) and date is not None and backtest.is_expiry_date(date, self.expiry_date):
+            self.settle(date, spot)
+        self.completed_files.append(day)
+        self.position_journal.snapshot(self.core.position_book, checkpoint={'completed_files': self.completed_files, 'pnl_rows': len(self.pnl_recorder)})
+
+    def settle(self, date, spot=None):
+        # The day end's spot (the replay sends the backtest's settlement_spot); a feed without it
+        # settles on the last bar: its index value, else put-call parity on the sold straddle
+        position_book, strikes, bar = self.core.position_book, self.core.strikes, self.last_bar
+        if spot is None and bar is not None:
+            spot = bar.get('index')
+            call, put = bar['quotes'].get((strikes['ce_sell'], 'CE')), bar['quotes'].get((strikes['pe_sell'], 'PE'))
+            if spot is None and strikes['ce_sell'] == strikes['pe_sell'] and call is not None and put is not None:
+                spot = strikes['ce_sell'] + call - put
+        if spot is None:
+            logging.error(f"No {self.config.underlying} settlement spot on {date}; positions left open")
+            return
+        logging.info(f"Settling {len(position_book.open_rows)} positions at spot {spot}")
+        backtest.settle_expiry(position_book, spot, date, self.position_journal, self.pnl_recorder)
+        self.pnl_recorder.flush()
+        self.last_bar = None
+
+    def close(self):
+        self.pnl_recorder.close()
+        if self.core is not None:
+            with open(self.position_file, 'w') as f:
+                json.dump(self.core.position_book.to_dict(), f, indent=4)
+        self.position_journal.close()
+        report = {'decisions': self.decisions, 'latency': self.latency.summary()}
+        with open(self.output_dir / f"{self.name}.latency.json", 'w') as f:
+            json.dump(report, f, indent=4)
+        return report
+
+
+async def consume(queue, trader):
+    # None on the queue ends the stream
+    while True:
+        bar = await queue.get()
+        if bar is None:
+            break
+        try:
+            trader.on_bar(bar)
+        except Exception as e:
+            logging.error(f"Error handling bar {bar_message(bar)} - {e}")
+
+
+async def put_bar(queue, bar):
+    bar['received_ns'] = time.perf_counter_ns()
+    await queue.put(bar)
+
+
+def replay_day_bars(option_df, strikes, expiry_date, config):
+    # The bars the backtest engines see for one day file: each row later than every row before
+    # it, among the rows of the fly's strikes up to the exit time, with forward-filled leg quotes
+    day = backtest.leg_rows(option_df, backtest.fly_tickers(strikes, expiry_date, config.underlying), config.exit_time)
+    if day.empty:
+        return []
+    seconds = frame_seconds(day)
+    processed = np.ones(len(seconds), dtype=bool)
+    processed[1:] = seconds[1:] > np.maximum.accumulate(seconds)[:-1]
+    rows = np.flatnonzero(processed)
+    minutes = seconds[rows]
+
+    legs = [(strikes['ce_sell'], 'CE'), (strikes['pe_sell'], 'PE'), (strikes['ce_buy'], 'CE'), (strikes['pe_buy'], 'PE')]
+    leg_grid = LegGrid(OptionChainIndex(day, config.underlying), expiry_date, legs, seconds.min(), seconds.max(), config.forward_fill_minutes)
+    quotes = leg_grid.quotes_many(minutes).T
+    dates = day['Date'].to_numpy()[rows]
+    times = day['Time'].to_numpy()[rows]
+    return [{
+        'date': dates[i],
+        'time': times[i],
+        'seconds': int(minutes[i]),
+        'quotes': {leg: (None if np.isnan(column[i]) else column[i]) for leg, column in zip(legs, quotes)},
+    } for i in range(len(rows))]
+
+
+async def replay_month(queue, index_dir, option_dir, month_name, expiry_date, config=DEFAULT_CONFIG, speed=0.0, cache_dir=None):
+    # Replay adapter: the month's day files as bars, reproducing the backtest's inputs exactly.
+    # speed=0 replays as fast as the consumer takes them, speed=N plays N market minutes per
+    # wall-clock minute. File loading runs in a thread so the event loop keeps serving bars.
+    loop = asyncio.get_running_loop()
+    try:
+        index_file, first_option_file = backtest.find_first_matching_csv(index_dir, option_dir, month_name)
+        if not (index_file and first_option_file):
+            logging.error(f"No matching files found for month: {month_name}")
+            return
+        index_df = await loop.run_in_executor(None, backtest.load_and_preprocess, index_file, config.entry_time)
+        day_loader = backtest.DayLoader(cache_dir, (config.underlying,))
+        option_df = await loop.run_in_executor(None, day_loader.load, first_option_file, config.entry_time)
+        if index_df.empty or option_df is None or option_df.empty:
+            logging.error(f"Entry files for {month_name} are empty or failed to load")
+            return
+
+        # The opening bar: the underlying's spot at the first index bar and the backtest's entry quotes
+        option_chain = OptionChainIndex(option_df, config.underlying)
+        spot = backtest.entry_spot(index_df, option_chain, expiry_date, config)
+        strikes = backtest.iron_fly_strikes(spot, config)
+        entry = datetime.strptime(config.entry_time, '%H:%M:%S').time()
+        option_prices = backtest.extract_option_prices(option_chain, strikes['ce_sell'], strikes['pe_sell'], strikes['ce_buy'], strikes['pe_buy'],
+                                                       expiry_date, entry, config.forward_fill_minutes)
+        entry_quotes = {(strike, 'CE' if name.startswith('ce') else 'PE'): option_prices.get(name) for name, strike in strikes.items()}
+        await put_bar(queue, {'event': 'open', 'date': index_df.iloc[0]['Date'], 'time': index_df.iloc[0]['Time'],
+                              'index': spot, 'quotes': entry_quotes})
+
+        # The days after the entry only need the rows of the fly's legs; the expiry day's end
+        # carries the spot the backtest settles against
+        tickers = backtest.fly_tickers(strikes, expiry_date, config.underlying)
+        index_files = backtest.day_index_files(index_dir, option_dir, month_name)
+        for options_file in backtest.find_all_matching_option_files(option_dir, month_name):
+            options_df = await loop.run_in_executor(None, day_loader.load, options_file, config.entry_time, tickers)
+            previous = None
+            for bar in (replay_day_bars(options_df, strikes, expiry_date, config) if options_df is not None else []):
+                if speed > 0 and previous is not None:
+                    await asyncio.sleep((bar['seconds'] - previous) / speed)
+                previous = bar['seconds']
+                await put_bar(queue, bar)
+            day_end = {'event': 'day_end', 'file': options_file.name, 'date': backtest.file_date(options_file)}
+            if backtest.is_expiry_day(options_file, expiry_date):
+                day_end['index'] = await loop.run_in_executor(None, backtest.day_settlement_spot, options_file, index_files.get(options_file.name),
+                                                              expiry_date, config, day_loader)
+            await put_bar(queue, day_end)
+    except Exception as e:
+        logging.error(f"Error replaying month: {month_name} - {e}")
+    finally:
+        await queue.put(None)
+
+
+class TcpJsonFeed:
+    # Live feed: JSON lines (see the message format above) read from a TCP socket
+
+    def __init__(self, host='127.0.0.1', port=9100):
+        self.host = host
+        self.port = port
+
+    async def bars(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=1 << 24)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received_ns = time.perf_counter_ns()
+                try:
+                    bar = parse_bar(json.loads(line))
+                except Exception as e:
+                    logging.error(f"Bad feed message: {line[:200]!r} - {e}")
+                    continue
+                bar['received_ns'] = received_ns
+                yield bar
+        finally:
+            writer.close()
+
+
+# Live feeds by name; anything with an async bars() generator yielding parsed bars plugs in
+FEEDS = {
+    'tcp': TcpJsonFeed,
+}
+
+
+async def feed_month(queue, feed):
+    try:
+        async for bar in feed.bars():
+            await queue.put(bar)
+    except Exception as e:
+        logging.error(f"Feed failed - {e}")
+    finally:
+        await queue.put(None)
+
+
+def historical_messages(index_dir, option_dir, month_name, expiry_date, cache_dir=None, config=DEFAULT_CONFIG):
+    # What a live feed would have sent for a historical month: for every minute of the index
+    # file, the underlying's spot and the exact-minute close of every option of the expiry (no
+    # forward fill), then a day_end message per day (with the settlement spot on the expiry day).
+    # An underlying the index files do not carry is sent its options' parity spot, on the index
+    # file's minutes.
+    underlying = config.underlying
+    day_loader = backtest.DayLoader(cache_dir, (underlying,))
+    for options_file in backtest.find_all_matching_option_files(option_dir, month_name):
+        date_str = options_file.stem.split('_')[-1]
+        index_file = next(Path(index_dir, month_name).glob(f"*_{date_str}.csv"), None)
+        if index_file is None:
+            continue
+        index_df = backtest.load_and_preprocess(index_file)
+        option_chain = OptionChainIndex(day_loader.load(options_file), underlying)
+        contracts = [key for key in option_chain.keys() if key[0] == expiry_date]
+        clock = backtest.underlying_index_rows(index_df, underlying)
+        if clock.empty:
+            clock = index_df.drop_duplicates('Time')
+            spots = [option_chain.parity_spot(expiry_date, seconds) for seconds in frame_seconds(clock)]
+        else:
+            spots = clock['Close'].to_numpy(dtype=np.float64)
+        index_seconds = frame_seconds(clock)
+        closes = {(strike, option_type): option_chain.lookup_many(expiry_date, strike, option_type, index_seconds)
+                  for _, strike, option_type in contracts}
+        for i, row in enumerate(clock.itertuples(index=False)):
+            quotes = {leg_key(strike, option_type): float(column[i]) for (strike, option_type), column in closes.items() if not np.isnan(column[i])}
+            spot = None if spots[i] is None else float(spots[i])
+            yield {'date': row.Date, 'time': row.Time.strftime('%H:%M:%S'), 'index': spot, 'quotes': quotes}
+        day_end = {'event': 'day_end', 'file': options_file.name, 'date': backtest.file_date(options_file)}
+        if backtest.is_expiry_day(options_file, expiry_date):
+            day_end['index'] = backtest.day_settlement_spot(options_file, index_file, expiry_date, config, day_loader)
+        yield day_end
+
+
+async def serve_feed(messages, host='127.0.0.1', port=9100, speed=0.0):
+    # Local stand-in for a market data server: streams the messages to the first client as JSON
+    # lines, speed market minutes per wall-clock minute (0: as fast as the client reads), then
+    # closes. Returns once that client is done.
+    done = asyncio.Event()
+
+    async def handle(reader, writer):
+        try:
+            for message in messages:
+                writer.write((json.dumps(message) + '\n').encode())
+                await writer.drain()
+                if speed > 0 and 'event' not in message:
+                    await asyncio.sleep(60 / speed)
+        except (ConnectionResetError, BrokenPipeError):
+            logging.warning("Feed client disconnected")
+        finally:
+            writer.close()
+            done.set()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"Serving feed on {host}:{port}")
+    async with server:
+        await done.wait()
+
+
+async def run_trader(producer, trader, queue_size=1000):
+    # The producer fills a bounded queue (a slow consumer holds the feed back) and puts None
+    # when it is done; the trader consumes until then
+    queue = asyncio.Queue(maxsize=queue_size)
+    await asyncio.gather(producer(queue), consume(queue, trader))
+    return trader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the iron fly on a bar stream: a replay of historical files, a live feed, or serve a historical month as a stand-in live feed.')
+    parser.add_argument('mode', choices=['replay', 'live', 'serve'])
+    parser.add_argument('month', help='month folder, e.g. MAR_2024 (also names the outputs)')
+    parser.add_argument('--expiry', required=True, help='expiry traded, e.g. 28MAR24')
+    parser.add_argument('--index-dir', default=backtest.index_dir)
+    parser.add_argument('--option-dir', default=backtest.option_dir)
+    parser.add_argument('--output-dir', default='paper_trading')
+    parser.add_argument('--cache-dir', default=None, help='columnar day-file cache (see day_cache.py)')
+    parser.add_argument('--config', default=None, help='JSON file of StrategyConfig fields')
+    parser.add_argument('--speed', type=float, default=0.0, help='market minutes per wall-clock minute (0: as fast as possible)')
+    parser.add_argument('--feed', choices=sorted(FEEDS), default='tcp')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--flush-every', type=int, default=None, help='write PnL rows to the report every N bars for pnl_dashboard.py (default: every bar when live, at day end otherwise)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = DEFAULT_CONFIG
+    if args.config:
+        with open(args.config) as f:
+            config = StrategyConfig.from_dict(json.load(f))
+    month_cache_dir = Path(args.cache_dir) / args.month if args.cache_dir else None
+
+    if args.mode == 'serve':
+        messages = historical_messages(args.index_dir, args.option_dir, args.month, args.expiry, month_cache_dir, config)
+        asyncio.run(serve_feed(messages, args.host, args.port, args.speed))
+        return
+
+    flush_every = args.flush_every if args.flush_every is not None else (1 if args.mode == 'live' else 0)
+    trader = PaperTrader(args.month, args.expiry, args.output_dir, config, flush_every=flush_every)
+    if args.mode == 'replay':
+        producer = lambda queue: replay_month(queue, args.index_dir, args.option_dir, args.month, args.expiry, config, args.speed, month_cache_dir)
+    else:
+        feed = FEEDS[args.feed](args.host, args.port)
+        producer = lambda queue: feed_month(queue, feed)
+    report = asyncio.run(run_trader(producer, trader, args.queue_size))
+    logging.info(f"Decisions: {report['decisions']}")
+    logging.info(f"Tick-to-decision latency: {report['latency']}")
+
+
+if __name__ == '__main__':
+    main()
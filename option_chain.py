@@ -0,0 +1,255 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Option tickers look like NIFTY28MAR2422000CE.NFO / BANKNIFTY28MAR2447000PE.NFO
+TICKER_PATTERN = r'^(?P<underlying>[A-Z]+?)(?P<expiry>\d{2}[A-Z]{3}\d{2})(?P<strike>\d+)(?P<option_type>CE|PE)\.NFO$'
+
+
+def time_to_seconds(times):
+    # Convert a Series of datetime.time / 'HH:MM:SS' values to int seconds since midnight
+    try:
+        if pd.api.types.is_integer_dtype(times):
+            return times.to_numpy(dtype=np.int64)
+        seconds = pd.to_timedelta(times.astype(str)).dt.total_seconds()
+        return seconds.to_numpy(dtype=np.int64)
+    except Exception as e:
+        logging.error(f"Error converting times to seconds - {e}")
+        return np.array([], dtype=np.int64)
+
+
+def frame_seconds(df):
+    # Int seconds for a loaded day frame; cached frames already carry them in 'Seconds'
+    if 'Seconds' in df:
+        return df['Seconds'].to_numpy(dtype=np.int64)
+    return time_to_seconds(df['Time'])
+
+
+def search_limit(seconds, forward_minutes):
+    # Last bar time accepted when searching ahead: the bars are stamped hh:mm:59,
+    # so N minutes ahead means the :59 bar of the Nth following minute
+    if forward_minutes <= 0:
+        return seconds
+    return seconds - seconds % 60 + forward_minutes * 60 + 59
+
+
+def option_ticker(underlying, expiry_date, strike, option_type):
+    # The exact ticker of one contract, the inverse of TICKER_PATTERN
+    return f"{underlying}{expiry_date}{int(strike)}{option_type}.NFO"
+
+
+def split_tickers(tickers):
+    # Split option tickers into underlying / expiry / strike / option type columns
+    # Work on the unique tickers only, a day file has a few thousand of them against ~100k rows
+    codes, uniques = pd.factorize(tickers)
+    parts = pd.Series(uniques).str.extract(TICKER_PATTERN)
+    return codes, parts
+
+
+class OptionChainIndex:
+    # Per-day option chain keyed by (expiry, strike, option_type) -> time-sorted (seconds, close) arrays.
+    # Built once per day file so every price lookup is a dict hit plus a binary search
+    # instead of a regex scan over the whole day's file.
+
+    def __init__(self, option_df, underlying='NIFTY'):
+        self.underlying = underlying
+        self.chain = {}
+        if option_df is None or option_df.empty:
+            return
+        try:
+            codes, parts = split_tickers(option_df['Ticker'])
+            seconds = frame_seconds(option_df)
+            closes = option_df['Close'].to_numpy(dtype=np.float64)
+
+            wanted = (parts['underlying'] == underlying).to_numpy()
+            row_mask = (codes >= 0) & wanted[codes]
+            codes = codes[row_mask]
+            seconds = seconds[row_mask]
+            closes = closes[row_mask]
+
+            # Stable sort by (ticker, time) so duplicate bars keep their file order, like values[0] did
+            order = np.lexsort((seconds, codes))
+            codes = codes[order]
+            seconds = seconds[order]
+            closes = closes[order]
+
+            boundaries = np.flatnonzero(np.diff(codes)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(codes)]))
+            for start, end in zip(starts, ends):
+                if start == end:
+                    continue
+                ticker_parts = parts.iloc[codes[start]]
+                key = (ticker_parts['expiry'], int(ticker_parts['strike']), ticker_parts['option_type'])
+                self.chain[key] = (seconds[start:end], closes[start:end])
+        except Exception as e:
+            logging.error(f"Error building option chain index for underlying: {underlying} - {e}")
+
+    def __contains__(self, key):
+        return key in self.chain
+
+    def __len__(self):
+        return len(self.chain)
+
+    def keys(self):
+        return self.chain.keys()
+
+    def series(self, expiry_date, strike, option_type):
+        # Time-sorted (seconds, close) arrays for one contract, or None if it never traded that day
+        return self.chain.get((expiry_date, int(strike), option_type))
+
+    def lookup(self, expiry_date, strike, option_type, seconds, forward_minutes=0):
+        # Close of the first bar at or after `seconds` and no later than the :59 bar `forward_minutes` minutes ahead
+        entry = self.series(expiry_date, strike, option_type)
+        if entry is None:
+            return None
+        bar_seconds, closes = entry
+        pos = np.searchsorted(bar_seconds, seconds, side='left')
+        if pos < len(bar_seconds) and bar_seconds[pos] <= search_limit(seconds, forward_minutes):
+            return closes[pos]
+        return None
+
+    def parity_spot(self, expiry_date, seconds, forward_minutes=0):
+        # Spot implied by put-call parity (strike + call - put) at the strike where the call and
+        # put are closest in price, for underlyings the index files do not carry; None when no
+        # strike of the expiry has both prices
+        best = None
+        for expiry, strike, option_type in self.chain:
+            if expiry != expiry_date or option_type != 'CE':
+                continue
+            call = self.lookup(expiry, strike, 'CE', seconds, forward_minutes)
+            put = self.lookup(expiry, strike, 'PE', seconds, forward_minutes)
+            if call is None or put is None:
+                continue
+            if best is None or abs(call - put) < best[0]:
+                best = (abs(call - put), strike + call - put)
+        return None if best is None else float(best[1])
+
+    def last_parity_spot(self, expiry_date, seconds):
+        # parity_spot from the last bars at or before `seconds`: the latest time at which some
+        # strike of the expiry has both a call and a put bar, the closest call / put among the
+        # strikes traded then; None when no strike ever had both
+        best = None
+        for expiry, strike, option_type in self.chain:
+            if expiry != expiry_date or option_type != 'CE':
+                continue
+            put_entry = self.series(expiry, strike, 'PE')
+            if put_entry is None:
+                continue
+            call_seconds, calls = self.series(expiry, strike, 'CE')
+            put_seconds, puts = put_entry
+            common, call_pos, put_pos = np.intersect1d(call_seconds[call_seconds <= seconds], put_seconds[put_seconds <= seconds], return_indices=True)
+            if not len(common):
+                continue
+            call, put = calls[call_pos[-1]], puts[put_pos[-1]]
+            candidate = (-int(common[-1]), abs(call - put), strike + call - put)
+            if best is None or candidate[:2] < best[:2]:
+                best = candidate
+        return None if best is None else float(best[2])
+
+    def lookup_many(self, expiry_date, strike, option_type, seconds, forward_minutes=0):
+        # Vectorized lookup over an array of times; misses come back as NaN
+        return self.lookup_bars(expiry_date, strike, option_type, seconds, forward_minutes)[0]
+
+    def lookup_bars(self, expiry_date, strike, option_type, seconds, forward_minutes=0):
+        # lookup_many plus the time of the bar each price came from (-1 for misses)
+        seconds = np.asarray(seconds, dtype=np.int64)
+        prices = np.full(len(seconds), np.nan)
+        found = np.full(len(seconds), -1, dtype=np.int64)
+        entry = self.series(expiry_date, strike, option_type)
+        if entry is None or len(seconds) == 0:
+            return prices, found
+        bar_seconds, closes = entry
+        pos = np.searchsorted(bar_seconds, seconds, side='left')
+        in_range = pos < len(bar_seconds)
+        hit = np.zeros(len(seconds), dtype=bool)
+        hit[in_range] = bar_seconds[pos[in_range]] <= search_limit(seconds[in_range], forward_minutes)
+        prices[hit] = closes[pos[hit]]
+        found[hit] = bar_seconds[pos[hit]]
+        return prices, found
+
+
+def longest_run(mask):
+    # Length of the longest run of True values
+    if not mask.any():
+        return 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return int((edges[1::2] - edges[::2]).max())
+
+
+class LegGrid:
+    # One day's prices of a fixed set of legs on an aligned minute grid, filled in one vectorized
+    # pass when the day is loaded. Row k is the :59 bar of the k-th minute from the day's first
+    # bar; a leg without a bar of its own that minute takes the first bar up to forward_minutes
+    # minutes later (the engines' fill rule, see OptionChainIndex.lookup), so every per-bar
+    # lookup afterwards is an array index. age holds how many minutes away the price came from
+    # (0: the minute's own bar, -1: no price within the limit); stale flags age > 0.
+    # Times off the :59 grid fall back to the chain.
+
+    def __init__(self, option_chain, expiry_date, legs, first_seconds, last_seconds, forward_minutes=0):
+        self.option_chain = option_chain
+        self.expiry_date = expiry_date
+        self.legs = list(legs)
+        self.forward_minutes = forward_minutes
+        self.start = int(first_seconds) - int(first_seconds) % 60 + 59
+        slots = max((int(last_seconds) - self.start) // 60 + 1, 0)
+        self.slot_seconds = self.start + 60 * np.arange(slots, dtype=np.int64)
+        self.prices = np.full((slots, len(self.legs)), np.nan)
+        self.age = np.full((slots, len(self.legs)), -1, dtype=np.int64)
+        for leg, (strike, option_type) in enumerate(self.legs):
+            prices, found = option_chain.lookup_bars(expiry_date, strike, option_type, self.slot_seconds, forward_minutes)
+            self.prices[:, leg] = prices
+            hit = found >= 0
+            self.age[hit, leg] = (found[hit] - self.slot_seconds[hit]) // 60
+
+    @property
+    def stale(self):
+        return self.age > 0
+
+    def slots(self, seconds):
+        # Grid row of each time, -1 for times off the grid
+        seconds = np.asarray(seconds, dtype=np.int64)
+        offset = seconds - self.start
+        rows = offset // 60
+        on_grid = (offset % 60 == 0) & (rows >= 0) & (rows < len(self.slot_seconds))
+        return np.where(on_grid, rows, -1)
+
+    def quotes_many(self, seconds):
+        # (times x legs) prices, NaN where a leg has no price within the limit
+        seconds = np.asarray(seconds, dtype=np.int64)
+        rows = self.slots(seconds)
+        quotes = self.prices[np.maximum(rows, 0)] if len(self.slot_seconds) else np.full((len(seconds), len(self.legs)), np.nan)
+        off_grid = rows < 0
+        if off_grid.any():
+            for leg, (strike, option_type) in enumerate(self.legs):
+                quotes[off_grid, leg] = self.option_chain.lookup_many(self.expiry_date, strike, option_type, seconds[off_grid], self.forward_minutes)
+        return quotes
+
+    def quotes(self, seconds):
+        # One time's prices in legs order, None for a leg without a price
+        row = self.slots([seconds])[0]
+        if row < 0:
+            prices = [self.option_chain.lookup(self.expiry_date, strike, option_type, seconds, self.forward_minutes) for strike, option_type in self.legs]
+        else:
+            prices = self.prices[row].tolist()
+        return [None if price is None or price != price else price for price in prices]
+
+    def gap_stats(self, seconds=None):
+        # Per leg over the grid rows of `seconds` (default: every minute of the grid): minutes,
+        # minutes with the leg's own bar, minutes filled from a later bar, minutes without a
+        # price, the longest run of minutes without an own bar and the oldest fill used
+        rows = np.arange(len(self.slot_seconds)) if seconds is None else self.slots(seconds)
+        age = self.age[rows[rows >= 0]]
+        stats = {}
+        for leg, (strike, option_type) in enumerate(self.legs):
+            column = age[:, leg]
+            stats[f"{strike}{option_type}"] = {
+                'minutes': int(len(column)),
+                'quoted': int((column == 0).sum()),
+                'filled': int((column > 0).sum()),
+                'missing': int((column < 0).sum()),
+                'longest_gap': longest_run(column != 0),
+                'max_fill_age': int(column.max()) if len(column) else 0,
+            }
+        return stats
@@ -0,0 +1,283 @@
+import logging
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from option_chain import LegGrid, frame_seconds
+
+RISK_FREE_RATE = 0.065          # annual, continuously compounded
+EXPIRY_SECONDS = 15 * 3600 + 30 * 60   # contracts expire at the 15:30 close
+YEAR_SECONDS = 365 * 86400
+MIN_YEARS = 60 / YEAR_SECONDS   # one minute: keeps the formulas finite on expiry day
+VOL_MIN = 1e-4
+VOL_MAX = 5.0
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2 * np.pi)
+
+
+def norm_cdf(x):
+    # Hart's double precision algorithm (as given by West, "Better approximations to cumulative
+    # normal functions"), accurate to ~1e-14; numpy has no erf and scipy is not a dependency.
+    # The implied vol solver needs the precision: a 1e-7 error on a 22000 forward is a
+    # visible price error on far strikes.
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x)
+    density = np.exp(-0.5 * z * z)
+    numerator = 3.52624965998911e-02 * z + 0.700383064443688
+    for coefficient in (6.37396220353165, 33.912866078383, 112.079291497871, 221.213596169931, 220.206867912376):
+        numerator = numerator * z + coefficient
+    denominator = 8.83883476483184e-02 * z + 1.75566716318264
+    for coefficient in (16.064177579207, 86.7807322029461, 296.564248779674, 637.333633378831, 793.826512519948, 440.413735824752):
+        denominator = denominator * z + coefficient
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Continued fraction for the far tail
+        fraction = z + 1 / (z + 2 / (z + 3 / (z + 4 / (z + 0.65))))
+        tail = np.where(z < 7.07106781186547, density * numerator / denominator, density / fraction / 2.506628274631)
+    tail = np.where(z > 37, 0.0, tail)
+    return np.where(x > 0, 1.0 - tail, tail)
+
+
+def year_fraction(expiry_date, date, seconds):
+    # Years from each bar (dd/mm/yyyy date, seconds since midnight) to the 15:30 expiry
+    expiry_day = datetime.strptime(expiry_date, '%d%b%y')
+    bar_day = datetime.strptime(str(date), '%d/%m/%Y')
+    seconds = np.asarray(seconds, dtype=np.float64)
+    remaining = (expiry_day - bar_day).days * 86400 + EXPIRY_SECONDS - seconds
+    return np.maximum(remaining / YEAR_SECONDS, MIN_YEARS)
+
+
+def d1_d2(forward, strike, years, sigma):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = sigma * np.sqrt(years)
+        d1 = (np.log(forward / strike) + 0.5 * spread * spread) / spread
+    return d1, d1 - spread
+
+
+def black76_price(forward, strike, years, sigma, is_call, rate=RISK_FREE_RATE):
+    # Discounted Black-76 price of a European option on the forward; is_call is a bool array
+    d1, d2 = d1_d2(forward, strike, years, sigma)
+    discount = np.exp(-rate * years)
+    call = discount * (forward * norm_cdf(d1) - strike * norm_cdf(d2))
+    put = discount * (strike * norm_cdf(-d2) - forward * norm_cdf(-d1))
+    return np.where(is_call, call, put)
+
+
+def black76_vega(forward, strike, years, sigma, rate=RISK_FREE_RATE):
+    # d price / d sigma (per 1.00 of volatility)
+    d1, _ = d1_d2(forward, strike, years, sigma)
+    return np.exp(-rate * years) * forward * norm_pdf(d1) * np.sqrt(years)
+
+
+def implied_vol(price, forward, strike, years, is_call, rate=RISK_FREE_RATE, tol=1e-6, max_iter=50):
+    # Implied volatility of every option at once: Newton steps on the whole array, falling back
+    # to bisection of a per-option bracket wherever Newton would leave it, until every price is
+    # matched within tol. Prices outside the no-arbitrage bounds (at or below intrinsic, at or
+    # above the discounted forward / strike) and missing prices give NaN.
+    price, forward, strike, years, is_call = np.broadcast_arrays(
+        np.asarray(price, dtype=np.float64), np.asarray(forward, dtype=np.float64),
+        np.asarray(strike, dtype=np.float64), np.asarray(years, dtype=np.float64), np.asarray(is_call, dtype=bool))
+    discount = np.exp(-rate * years)
+    intrinsic = discount * np.maximum(np.where(is_call, forward - strike, strike - forward), 0.0)
+    ceiling = discount * np.where(is_call, forward, strike)
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(price) & np.isfinite(forward) & (price > intrinsic) & (price < ceiling)
+
+    # Brenner-Subrahmanyam at-the-money estimate as the starting point
+    with np.errstate(divide='ignore', invalid='ignore'):
+        guess = np.sqrt(2 * np.pi / years) * price / (discount * forward)
+    sigma = np.full(price.shape, np.nan)
+    # Iterate on the options still unsolved only, most converge in a few Newton steps
+    todo = np.flatnonzero(valid)
+    p, f, k, t, c = (a[valid] for a in (price, forward, strike, years, is_call))
+    s = np.clip(guess[valid], VOL_MIN, VOL_MAX)
+    low = np.full(len(todo), VOL_MIN)
+    high = np.full(len(todo), VOL_MAX)
+    for _ in range(max_iter):
+        diff = black76_price(f, k, t, s, c, rate) - p
+        done = np.abs(diff) <= tol
+        sigma.flat[todo[done]] = s[done]
+        active = ~done
+        if not active.any():
+            break
+        todo, p, f, k, t, c, s, low, high, diff = (a[active] for a in (todo, p, f, k, t, c, s, low, high, diff))
+        # The price rises with volatility, so the sign of the miss halves the bracket
+        high = np.where(diff > 0, s, high)
+        low = np.where(diff < 0, s, low)
+        vega = black76_vega(f, k, t, s, rate)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton = s - diff / vega
+        s = np.where((vega > 1e-12) & (newton > low) & (newton < high), newton, 0.5 * (low + high))
+    else:
+        # Out of iterations: the bracket midpoint is the best estimate left
+        sigma.flat[todo] = s
+    return sigma
+
+
+def black76_greeks(forward, strike, years, sigma, is_call, rate=RISK_FREE_RATE):
+    # Greeks against the spot S = F * exp(-rT): delta per index point, gamma per index point
+    # squared, vega per volatility point (0.01) and theta per calendar day
+    d1, d2 = d1_d2(forward, strike, years, sigma)
+    discount = np.exp(-rate * years)
+    spot = forward * discount
+    root = np.sqrt(years)
+    density = norm_pdf(d1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = density / (spot * sigma * root)
+        decay = -spot * density * sigma / (2 * root)
+    call_theta = decay - rate * strike * discount * norm_cdf(d2)
+    put_theta = decay + rate * strike * discount * norm_cdf(-d2)
+    return {
+        'delta': np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1.0),
+        'gamma': gamma,
+        'vega': spot * density * root / 100,
+        'theta': np.where(is_call, call_theta, put_theta) / 365,
+    }
+
+
+def option_greeks(price, forward, strike, years, is_call, rate=RISK_FREE_RATE):
+    # Implied volatility plus Greeks for arrays of option prices
+    sigma = implied_vol(price, forward, strike, years, is_call, rate)
+    greeks = black76_greeks(forward, strike, years, sigma, is_call, rate)
+    greeks['iv'] = sigma
+    return greeks
+
+
+def parity_forward(option_chain, expiry_date, seconds, forward_minutes=0):
+    # Forward implied by put-call parity (strike + call - put) at each time, taken at the strike
+    # where the call and put are closest in price (OptionChainIndex.parity_spot for many times)
+    seconds = np.asarray(seconds, dtype=np.int64)
+    strikes = sorted(strike for expiry, strike, option_type in option_chain.keys()
+                     if expiry == expiry_date and option_type == 'CE' and (expiry, strike, 'PE') in option_chain)
+    if not strikes:
+        return np.full(len(seconds), np.nan)
+    calls = np.array([option_chain.lookup_many(expiry_date, strike, 'CE', seconds, forward_minutes) for strike in strikes])
+    puts = np.array([option_chain.lookup_many(expiry_date, strike, 'PE', seconds, forward_minutes) for strike in strikes])
+    gap = np.abs(calls - puts)
+    quoted = ~np.isnan(gap).all(axis=0)
+    best = np.argmin(np.where(np.isnan(gap), np.inf, gap), axis=0)
+    columns = np.arange(len(seconds))
+    forwards = np.asarray(strikes, dtype=np.float64)[best] + calls[best, columns] - puts[best, columns]
+    return np.where(quoted, forwards, np.nan)
+
+
+def spot_at(index_df, seconds):
+    # Index close of the last bar at or before each time (the first bar for earlier times)
+    index_seconds = frame_seconds(index_df)
+    closes = index_df['Close'].to_numpy(dtype=np.float64)
+    order = np.argsort(index_seconds, kind='stable')
+    pos = np.searchsorted(index_seconds[order], np.asarray(seconds, dtype=np.int64), side='right') - 1
+    return closes[order][np.maximum(pos, 0)]
+
+
+def chain_greeks(option_chain, expiry_date, date, seconds, forwards, forward_minutes=0, rate=RISK_FREE_RATE):
+    # IV and Greeks of every contract of the expiry at each time, as (times x contracts) arrays,
+    # with the contracts as a list of (strike, option_type)
+    contracts = sorted((strike, option_type) for expiry, strike, option_type in option_chain.keys() if expiry == expiry_date)
+    seconds = np.asarray(seconds, dtype=np.int64)
+    prices = np.column_stack([option_chain.lookup_many(expiry_date, strike, option_type, seconds, forward_minutes)
+                              for strike, option_type in contracts]) if contracts else np.zeros((len(seconds), 0))
+    strikes = np.array([strike for strike, _ in contracts], dtype=np.float64)
+    is_call = np.array([option_type == 'CE' for _, option_type in contracts], dtype=bool)
+    years = year_fraction(expiry_date, date, seconds)[:, None]
+    return contracts, option_greeks(prices, np.asarray(forwards, dtype=np.float64)[:, None], strikes, years, is_call, rate)
+
+
+def portfolio_greeks(position_book, option_chain, expiry_date, legs, date, seconds, forwards, forward_minutes=0, rate=RISK_FREE_RATE):
+    # Per-bar Greeks of the book over one day's bars plus each leg's IV. A leg is priced at the
+    # bar (with the engines' forward fill), else at its last price earlier in the day; a
+    # position counts from the bar it was opened at. Greeks are summed over positions as
+    # side * qty * greek, so a short straddle shows negative gamma and vega.
+    seconds = np.asarray(seconds, dtype=np.int64)
+    legs = list(dict.fromkeys(legs))
+    if len(seconds) == 0:
+        return {}, {}
+    leg_grid = LegGrid(option_chain, expiry_date, legs, seconds.min(), seconds.max(), forward_minutes)
+    prices = leg_grid.quotes_many(seconds)
+    for leg in range(len(legs)):
+        column = prices[:, leg]
+        last_seen = np.maximum.accumulate(np.where(~np.isnan(column), np.arange(len(column)), -1))
+        prices[:, leg] = np.where(last_seen >= 0, column[np.maximum(last_seen, 0)], np.nan)
+
+    strikes = np.array([strike for strike, _ in legs], dtype=np.float64)
+    is_call = np.array([option_type == 'CE' for _, option_type in legs], dtype=bool)
+    years = year_fraction(expiry_date, date, seconds)[:, None]
+    greeks = option_greeks(prices, np.asarray(forwards, dtype=np.float64)[:, None], strikes, years, is_call, rate)
+
+    # (bars x legs) net quantity: side * qty of every position on the leg opened by the bar and
+    # not yet closed; positions from earlier days are held all day, ones closed on earlier days not at all
+    leg_of = {leg: i for i, leg in enumerate(legs)}
+    holding = np.zeros((len(seconds), len(legs)))
+    for row in range(len(position_book)):
+        leg = leg_of.get((position_book.strike[row], position_book.option_types[row]))
+        if leg is None:
+            continue
+        opened = pd.Timedelta(position_book.times[row]).total_seconds() if position_book.dates[row] == date else 0
+        held = seconds >= opened
+        if position_book.closed[row]:
+            if position_book.exit_dates[row] != date:
+                continue
+            held &= seconds < pd.Timedelta(position_book.exit_times[row]).total_seconds()
+        holding[:, leg] += held * position_book.side[row] * position_book.qty[row]
+    totals = {name: (holding * greeks[name]).sum(axis=1) for name in ('delta', 'gamma', 'vega', 'theta')}
+    leg_ivs = {f"IV_{strike}{option_type}": greeks['iv'][:, leg] for leg, (strike, option_type) in enumerate(legs)}
+    return totals, leg_ivs
+
+
+class GreeksRecorder:
+    # The per-bar portfolio Greeks report, one row per PnL report row, written next to it as
+    # <report stem>.greeks.csv and appended at day end like the CSV PnL report. resume_rows keeps
+    # the rows of the days an interrupted run completed.
+
+    def __init__(self, output_path, resume_rows=None):
+        self.output_path = Path(output_path)
+        self.frames = []
+        if resume_rows and self.output_path.exists():
+            pd.read_csv(self.output_path).iloc[:resume_rows].to_csv(self.output_path, index=False)
+        elif self.output_path.exists():
+            self.output_path.unlink()
+
+    def record_day(self, position_book, option_chain, expiry_date, legs, dates, times, index_df=None, forward_minutes=0, rate=RISK_FREE_RATE):
+        # dates / times: one day's PnL rows recorded since the last flush. The spot is the index
+        # close at each row; without index rows for the underlying the forward comes from
+        # put-call parity on the chain instead.
+        try:
+            if not len(times):
+                return
+            date = dates[-1]
+            seconds = pd.to_timedelta(pd.Series(times, dtype=str)).dt.total_seconds().to_numpy(dtype=np.int64)
+            discount = np.exp(-rate * year_fraction(expiry_date, date, seconds))
+            if index_df is not None and not index_df.empty:
+                spot = spot_at(index_df, seconds)
+                forwards = spot / discount
+            else:
+                forwards = parity_forward(option_chain, expiry_date, seconds, forward_minutes)
+                spot = forwards * discount
+            totals, leg_ivs = portfolio_greeks(position_book, option_chain, expiry_date, legs, date, seconds, forwards, forward_minutes, rate)
+            frame = pd.DataFrame({'Date': list(dates), 'Time': list(times), 'Spot': spot})
+            for name, values in totals.items():
+                frame[name.capitalize()] = values
+            for name, values in leg_ivs.items():
+                frame[name] = values
+            self.frames.append(frame)
+        except Exception as e:
+            logging.error(f"Error computing portfolio Greeks for {self.output_path.name} - {e}")
+
+    def flush(self):
+        if not self.frames:
+            return
+        try:
+            df = pd.concat(self.frames, ignore_index=True)
+            self.frames = []
+            existing = self.output_path.exists()
+            df.to_csv(self.output_path, mode='a' if existing else 'w', header=not existing, index=False)
+        except Exception as e:
+            logging.error(f"Error writing portfolio Greeks to: {self.output_path} - {e}")
+
+
+def greeks_path(pnl_path):
+    pnl_path = Path(pnl_path)
+    return pnl_path.with_name(f"{pnl_path.stem}.greeks.csv")
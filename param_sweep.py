@@ -0,0 +1,200 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import single_month_backtest_copy2 as backtest
+from cost_model import COST_MODELS, NO_COSTS, load_cost_model
+from option_chain import OptionChainIndex
+from pnl_metrics import MetricsAccumulator
+from pnl_recorder import PnlRecorder
+from position_journal import PositionJournal
+from risk_metrics import equity_curve, risk_summary
+from dataset_catalog import MONTH_FORMAT, DatasetCatalog
+from run_backtest import parse_months, resolve_months
+from strategy_config import config_grid
+from underlyings import UNDERLYINGS
+
+# Market data of the swept months, loaded once per process and shared by every config
+SWEEP_DATA = None
+
+
+def to_time(value):
+    return datetime.strptime(value, '%H:%M:%S').time()
+
+
+def load_sweep_data(months, catalog, cache_dir=None, entry_time='09:20:59', underlying='NIFTY'):
+    # Parse every day file of the swept months once, from the earliest entry time in the grid
+    data = {}
+    for month_name, expiry_date in months.items():
+        month_cache_dir = Path(cache_dir) / month_name if cache_dir is not None else None
+        index_file, first_option_file = catalog.first_files(month_name)
+        if not index_file:
+            logging.error(f"No matching files found for month: {month_name}")
+            continue
+        days = [(option_file, backtest.load_and_preprocess(option_file, entry_time, month_cache_dir, (underlying,)))
+                for option_file in catalog.option_files(month_name)]
+        # The expiry day's index, when the month has it, is what open positions settle against
+        settle_files = [entry['index_file'] for _, entry in catalog.month_days(month_name)
+                        if entry['index_file'] and entry['option_file'] and backtest.is_expiry_day(entry['option_file'], expiry_date)]
+        data[month_name] = {
+            'expiry': expiry_date,
+            'index_df': backtest.load_and_preprocess(index_file, entry_time),
+            'first_option_file': first_option_file.name,
+            'underlying': underlying,
+            'strike_grid': catalog.strike_grid(month_name, expiry_date, underlying),
+            'days': days,
+            'settle_index_df': backtest.load_and_preprocess(settle_files[0]) if settle_files else None,
+            'chains': {},
+        }
+    return data
+
+
+def init_worker(months, catalog, cache_dir, entry_time, underlying):
+    # Forked workers inherit the parent's SWEEP_DATA; spawned ones load it (cheaply from the mmap cache)
+    global SWEEP_DATA
+    if SWEEP_DATA is None:
+        SWEEP_DATA = load_sweep_data(months, catalog, cache_dir, entry_time, underlying)
+
+
+def day_chain(month_data, day, option_df, exit_time):
+    # One chain index per day and exit time, reused by every config that shares them
+    key = (day, exit_time)
+    if key not in month_data['chains']:
+        month_data['chains'][key] = OptionChainIndex(option_df[option_df['Time'] <= to_time(exit_time)], month_data['underlying'])
+    return month_data['chains'][key]
+
+
+def run_config(config, cost_model=NO_COSTS):
+    started = time.perf_counter()
+    entry = to_time(config.entry_time)
+    month_pnl, month_frames, positions, costs = {}, [], 0, 0.0
+    # Live metrics over the whole run; months are fed in calendar order
+    metrics = MetricsAccumulator(config.qty)
+    for month_name in sorted(SWEEP_DATA, key=lambda name: datetime.strptime(name, MONTH_FORMAT)):
+        month_data = SWEEP_DATA[month_name]
+        try:
+            index_df = month_data['index_df'][month_data['index_df']['Time'] >= entry]
+            first_df = dict((f.name, df) for f, df in month_data['days'])[month_data['first_option_file']]
+            chain = day_chain(month_data, month_data['first_option_file'], first_df, config.exit_time)
+            position_book, strikes = backtest.open_iron_fly(index_df, chain, month_data['expiry'], config, month_data['strike_grid'])
+            if position_book is None:
+                month_pnl[month_name] = np.nan
+                continue
+
+            # Nothing is written to disk: the journal is a no-op and PnL rows stay in memory
+            journal = PositionJournal(None)
+            recorder = PnlRecorder(None, metrics=metrics)
+            for option_file, day_df in month_data['days']:
+                # A settled book has nothing left to monitor
+                if not len(position_book.open_rows):
+                    break
+                # Rows before this config's entry are dropped here; lookups only search forward,
+                # so the shared chain built from the full day gives the same prices
+                chain = day_chain(month_data, option_file.name, day_df, config.exit_time)
+                backtest.monitor_positions_vectorized(
+                    position_book, day_df[day_df['Time'] >= entry], option_file, strikes['ce_buy'], strikes['pe_buy'], strikes['ce_sell'], strikes['pe_sell'],
+                    month_data['expiry'], month_name, journal, recorder, config,
+                    option_chain=chain)
+                if backtest.is_expiry_day(option_file, month_data['expiry']) and not day_df.empty:
+                    # Expiry: whatever is still open settles at intrinsic value
+                    spot = backtest.settlement_spot(month_data['settle_index_df'], chain, month_data['expiry'], config)
+                    if spot is not None:
+                        backtest.settle_expiry(position_book, spot, day_df['Date'].iloc[0], journal, recorder)
+                recorder.flush()
+
+            month_frames.append(recorder.to_frame())
+            pnl = month_frames[-1]['PnL'].to_numpy(dtype=np.float64)
+            month_pnl[month_name] = float(pnl[-1]) if len(pnl) else 0.0
+            positions += len(position_book)
+            # Every position's opening and closing fills, charged from the book's arrays in one go
+            costs += cost_model.book_costs(position_book)
+        except Exception as e:
+            # One config failing on a month (e.g. a missing entry bar) must not stop the sweep
+            logging.error(f"Sweep config {config} failed on month: {month_name} - {e}")
+            month_pnl[month_name] = np.nan
+
+    summary = metrics.metrics()
+    equity, _, dates = equity_curve(month_frames)
+    risk = risk_summary(equity, dates)
+    total_pnl = float(np.sum(list(month_pnl.values())))
+    return {
+        **config.to_dict(),
+        'net_pnl': total_pnl - costs,
+        'total_pnl': total_pnl,
+        'costs': costs,
+        'max_drawdown': metrics.max_drawdown,
+        'win_months_pct': summary.get('Win %'),
+        'expectancy': summary.get('Expectancy'),
+        'max_losing_streak': summary.get('Max Losing Streak'),
+        'drawdown_bars': risk['drawdown_bars'],
+        'worst_intraday_excursion': risk['worst_intraday_excursion'],
+        'max_intraday_drawdown': risk['max_intraday_drawdown'],
+        'sharpe': risk['sharpe'],
+        'sortino': risk['sortino'],
+        'positions': positions,
+        'bars': metrics.bars,
+        'seconds': round(time.perf_counter() - started, 3),
+        **{f'pnl_{month_name}': value for month_name, value in month_pnl.items()},
+    }
+
+
+def run_sweep(configs, months, catalog, cache_dir=None, workers=1, cost_model=NO_COSTS):
+    # Results ranked on PnL net of the cost model's costs
+    global SWEEP_DATA
+    entry_time = min(config.entry_time for config in configs)
+    underlyings = {config.underlying for config in configs}
+    if len(underlyings) != 1:
+        raise ValueError(f"A sweep trades one underlying, got {sorted(underlyings)}")
+    init_args = (months, catalog.subset(months), cache_dir, entry_time, underlyings.pop())
+    # Load this sweep's months afresh: data left from an earlier sweep in the process may be of other months or dirs
+    SWEEP_DATA = None
+    init_worker(*init_args)
+    if workers == 1:
+        results = [run_config(config, cost_model) for config in configs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init_args) as pool:
+            results = list(pool.map(run_config, configs, [cost_model] * len(configs)))
+    return pd.DataFrame(results).sort_values('net_pnl', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate a grid of iron fly configs over the same loaded market data.')
+    parser.add_argument('months', nargs='*', help='MONTH_YYYY[=DDMONYY] entries (default: every month in the data, at its monthly expiry)')
+    parser.add_argument('--index-dir', default=backtest.index_dir)
+    parser.add_argument('--option-dir', default=backtest.option_dir)
+    parser.add_argument('--catalog', default='dataset_catalog.json', help='dataset catalog (see dataset_catalog.py)')
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--underlying', choices=sorted(UNDERLYINGS), default='NIFTY')
+    parser.add_argument('--wing-width', type=int, nargs='+', default=None, help="default: the underlying's (see underlyings.py)")
+    parser.add_argument('--stop-loss-factor', type=float, nargs='+', default=[0.9])
+    parser.add_argument('--entry-time', nargs='+', default=['09:20:59'])
+    parser.add_argument('--exit-time', nargs='+', default=['15:29:59'])
+    parser.add_argument('--qty', type=int, nargs='+', default=None, help="default: the underlying's lot size")
+    parser.add_argument('--square-off-on-stop', choices=['no', 'yes'], nargs='+', default=['no'], help='close the stopped sell and its hedge before re-hedging')
+    parser.add_argument('--costs', default='nse', help=f"cost model configs are ranked net of: {', '.join(COST_MODELS)} or a JSON file of CostModel fields (see cost_model.py)")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--output', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    backtest.setup_logging('param_sweep.log', console_level='INFO')
+    catalog = DatasetCatalog.open(args.index_dir, args.option_dir, args.catalog)
+    months = resolve_months(catalog, parse_months(args.months), args.underlying)
+    spec = UNDERLYINGS[args.underlying]
+    configs = config_grid(wing_width=args.wing_width or [spec.wing_width], stop_loss_factor=args.stop_loss_factor,
+                          entry_time=args.entry_time, exit_time=args.exit_time, qty=args.qty or [spec.lot_size], underlying=[args.underlying],
+                          square_off_on_stop=[value == 'yes' for value in args.square_off_on_stop])
+
+    started = time.perf_counter()
+    results = run_sweep(configs, months, catalog, args.cache_dir, args.workers, load_cost_model(args.costs))
+    results.to_csv(args.output, index=False)
+    logging.info(f"Evaluated {len(configs)} configs over {len(months)} months in {time.perf_counter() - started:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
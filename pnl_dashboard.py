@@ -0,0 +1,407 @@
+import argparse
+import io
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dataset_catalog import MONTH_FORMAT
+from pnl_recorder import PNL_COLUMNS, read_pnl_report
+
+DEFAULT_MAX_POINTS = 4000
+# Files a month's report can be in (see ReportSeries): a CSV report, the '.partial.csv' spill of
+# a running xlsx / parquet month, or the final report
+REPORT_SUFFIXES = ['.csv', '.xlsx.partial.csv', '.parquet.partial.csv', '.xlsx', '.parquet']
+
+
+def normalize_report(df):
+    # Date / Time / PnL columns as strings and floats; also reads the old live pnl_report.xlsx
+    # layout (a 'PNL' column, dates as datetimes and times as fractions of a day)
+    df = df.rename(columns={'PNL': 'PnL'})
+    if pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = df['Date'].dt.strftime('%d/%m/%Y')
+    if pd.api.types.is_numeric_dtype(df['Time']):
+        df['Time'] = (pd.Timestamp(0) + pd.to_timedelta(df['Time'], unit='D').dt.round('s')).dt.strftime('%H:%M:%S')
+    return df[PNL_COLUMNS].astype({'Date': str, 'Time': str, 'PnL': np.float64})
+
+
+def decimate(x, y, max_points):
+    # Min/max decimation of a whole series: split it into max_points / 2 buckets and keep each
+    # bucket's lowest and highest point, in time order, so spikes survive at any length
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    if len(y) <= max_points:
+        return x, y
+    starts = np.linspace(0, len(y), max_points // 2, endpoint=False).astype(np.int64)
+    starts = np.unique(starts)
+    lo, hi = MinMaxDecimator.extremes(y, starts)
+    # The last bar is the current PnL; it is always drawn
+    lo, hi = np.append(lo, len(y) - 1), np.append(hi, len(y) - 1)
+    x, y = MinMaxDecimator.interleave(x, y, lo, hi)
+    keep = np.concatenate([[True], x[1:] != x[:-1]])
+    return x[keep], y[keep]
+
+
+class MinMaxDecimator:
+    # Incremental min/max decimation. Bars go into buckets of `width` bars, each keeping the
+    # position and value of its lowest and highest bar. When there are more than max_buckets
+    # buckets, neighbouring pairs merge and the width doubles, so memory and the number of
+    # points drawn stay bounded however long the history grows. Buckets only need to cover
+    # contiguous bars, not aligned ones, so an unpaired last bucket simply stays as it is.
+    # add() only touches the new bars and the last, partly filled bucket.
+
+    def __init__(self, max_buckets=DEFAULT_MAX_POINTS // 2):
+        self.max_buckets = max_buckets
+        self.width = 1
+        self.pending = np.zeros(0)  # bars not yet in a full bucket
+        self.lo = np.zeros(0)
+        self.lo_at = np.zeros(0, dtype=np.int64)
+        self.hi = np.zeros(0)
+        self.hi_at = np.zeros(0, dtype=np.int64)
+        self.count = 0
+
+    @staticmethod
+    def extremes(y, starts):
+        # Index of the first min / max of y in each [starts[i], starts[i + 1]) segment
+        lengths = np.diff(np.append(starts, len(y)))
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        positions = np.arange(len(y))
+        lo = np.full(len(starts), len(y))
+        hi = np.full(len(starts), len(y))
+        is_low = y == np.minimum.reduceat(y, starts)[segment]
+        is_high = y == np.maximum.reduceat(y, starts)[segment]
+        np.minimum.at(lo, segment[is_low], positions[is_low])
+        np.minimum.at(hi, segment[is_high], positions[is_high])
+        return lo, hi
+
+    @staticmethod
+    def interleave(x, y, lo, hi):
+        # Both extremes of every bucket in time order, once when they are the same bar
+        first, second = np.minimum(lo, hi), np.maximum(lo, hi)
+        order = np.column_stack([first, second]).ravel()
+        keep = np.ones(len(order), dtype=bool)
+        keep[1::2] = second != first
+        order = order[keep]
+        return np.asarray(x)[order], np.asarray(y)[order]
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        start = self.count - len(self.pending)
+        pending = np.concatenate([self.pending, values])
+        full = len(pending) // self.width * self.width
+        if full:
+            lo, hi = self.extremes(pending[:full], np.arange(0, full, self.width))
+            self.lo = np.concatenate([self.lo, pending[lo]])
+            self.lo_at = np.concatenate([self.lo_at, start + lo])
+            self.hi = np.concatenate([self.hi, pending[hi]])
+            self.hi_at = np.concatenate([self.hi_at, start + hi])
+        self.pending = pending[full:]
+        self.count += len(values)
+        while len(self.lo) > self.max_buckets:
+            self.merge_pairs()
+
+    def merge_pairs(self):
+        pairs = len(self.lo) // 2 * 2
+        a, b = slice(0, pairs, 2), slice(1, pairs, 2)
+        # Ties keep the earlier bar
+        take_b_lo = self.lo[b] < self.lo[a]
+        take_b_hi = self.hi[b] > self.hi[a]
+        odd = slice(pairs, None)
+        self.lo = np.concatenate([np.where(take_b_lo, self.lo[b], self.lo[a]), self.lo[odd]])
+        self.lo_at = np.concatenate([np.where(take_b_lo, self.lo_at[b], self.lo_at[a]), self.lo_at[odd]])
+        self.hi = np.concatenate([np.where(take_b_hi, self.hi[b], self.hi[a]), self.hi[odd]])
+        self.hi_at = np.concatenate([np.where(take_b_hi, self.hi_at[b], self.hi_at[a]), self.hi_at[odd]])
+        self.width *= 2
+
+    def points(self):
+        # (bar, value) arrays to draw: every bucket's extremes in time order, then the pending bars
+        low_first = self.lo_at <= self.hi_at
+        x = np.column_stack([np.where(low_first, self.lo_at, self.hi_at), np.where(low_first, self.hi_at, self.lo_at)]).ravel()
+        y = np.column_stack([np.where(low_first, self.lo, self.hi), np.where(low_first, self.hi, self.lo)]).ravel()
+        keep = np.ones(len(x), dtype=bool)
+        keep[1::2] = self.lo_at != self.hi_at
+        pending_start = self.count - len(self.pending)
+        return (np.concatenate([x[keep], np.arange(pending_start, self.count)]),
+                np.concatenate([y[keep], self.pending]))
+
+
+class ReportTail:
+    # Reads one PnL report incrementally. CSV reports and spill files are tailed: each poll
+    # parses only the complete lines appended since the last one. xlsx / parquet reports are
+    # finished outputs and are re-read whole if they change. poll() returns (new rows, reset);
+    # reset means the file was rewritten and the rows read before must be dropped.
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.offset = 0
+        self.inode = None
+        self.signature = None
+
+    def poll(self):
+        empty = pd.DataFrame(columns=PNL_COLUMNS)
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return empty, False
+        try:
+            if self.path.suffix != '.csv':
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if signature == self.signature:
+                    return empty, False
+                self.signature = signature
+                return normalize_report(read_pnl_report(self.path)), True
+
+            reset = stat.st_ino != self.inode or stat.st_size < self.offset
+            if reset:
+                self.inode, self.offset = stat.st_ino, 0
+            if stat.st_size == self.offset:
+                return empty, reset
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read(stat.st_size - self.offset)
+            # Only whole lines; a row being written is picked up by the next poll
+            end = chunk.rfind(b'\n') + 1
+            if not end:
+                return empty, reset
+            header = self.offset == 0
+            self.offset += end
+            df = pd.read_csv(io.BytesIO(chunk[:end]), header=0 if header else None, names=None if header else PNL_COLUMNS,
+                             dtype={'Date': str, 'Time': str}, float_precision='round_trip')
+            return normalize_report(df), reset
+        except Exception as e:
+            logging.error(f"Error reading PnL report: {self.path} - {e}")
+            return empty, False
+
+
+class ReportSeries:
+    # One month's (or one file's) decimated PnL, fed from whichever report file is current:
+    # a CSV report, the '.partial.csv' spill of a running xlsx / parquet month, or the final report
+
+    def __init__(self, name, paths, max_points=DEFAULT_MAX_POINTS):
+        self.name = name
+        self.paths = paths
+        self.max_points = max_points
+        self.tail = None
+        self.clear()
+
+    def clear(self):
+        self.decimator = MinMaxDecimator(self.max_points // 2)
+        self.days = []  # (bar, date) of each day's first bar
+        self.last = None
+
+    def refresh(self):
+        path = next((p for p in self.paths if p.exists()), None)
+        if path is None:
+            return 0
+        if self.tail is None or self.tail.path != path:
+            self.tail = ReportTail(path)
+            self.clear()
+        rows, reset = self.tail.poll()
+        if reset:
+            self.clear()
+        if rows.empty:
+            return 0
+        dates = rows['Date'].to_numpy()
+        previous = self.days[-1][1] if self.days else None
+        new_day = np.flatnonzero(dates != np.concatenate([[previous], dates[:-1]]))
+        self.days.extend((self.decimator.count + int(i), dates[i]) for i in new_day)
+        self.decimator.add(rows['PnL'].to_numpy())
+        self.last = rows.iloc[-1].to_dict()
+        return len(rows)
+
+
+class PnlDashboard:
+    # Equity curve over every month report in a directory (or a single report file). Each month's
+    # PnL is month-to-date, so months are chained in calendar order, each offset by the closing
+    # PnL of the months before it, as in risk_metrics.equity_curve.
+
+    def __init__(self, source, max_points=DEFAULT_MAX_POINTS):
+        self.source = Path(source)
+        self.max_points = max_points
+        self.series = {}
+
+    def discover(self):
+        if self.source.is_file():
+            if not self.series:
+                self.series[self.source.stem] = ReportSeries(self.source.stem, [self.source], self.max_points)
+            return
+        for path in self.source.iterdir():
+            name = path.name.split('.')[0]
+            if name in self.series:
+                continue
+            try:
+                datetime.strptime(name, MONTH_FORMAT)
+            except ValueError:
+                continue
+            candidates = [self.source / f"{name}{suffix}" for suffix in REPORT_SUFFIXES]
+            self.series[name] = ReportSeries(name, candidates, self.max_points)
+
+    def ordered(self):
+        if self.source.is_file():
+            return list(self.series.values())
+        return [self.series[name] for name in sorted(self.series, key=lambda name: datetime.strptime(name, MONTH_FORMAT))]
+
+    def refresh(self):
+        # Reads only what was appended since the last refresh; returns the number of new rows
+        self.discover()
+        return sum(series.refresh() for series in self.series.values())
+
+    def snapshot(self):
+        xs, ys, days, months = [], [], [], []
+        bar_offset, pnl_offset, last = 0, 0.0, None
+        for series in self.ordered():
+            if series.last is None:
+                continue
+            x, y = series.decimator.points()
+            xs.append(x + bar_offset)
+            ys.append(y + pnl_offset)
+            days.extend((bar + bar_offset, date) for bar, date in series.days)
+            months.append((bar_offset, series.name))
+            last = {**series.last, 'equity': pnl_offset + series.last['PnL'], 'month': series.name}
+            bar_offset += series.decimator.count
+            pnl_offset += series.last['PnL']
+        x, y = (np.concatenate(xs), np.concatenate(ys)) if xs else (np.zeros(0, dtype=np.int64), np.zeros(0))
+        x, y = decimate(x, y, self.max_points)
+        return {
+            'x': x.tolist(),
+            'y': y.tolist(),
+            'days': [[int(bar), str(date)] for bar, date in days],
+            'months': [[int(bar), name] for bar, name in months],
+            'bars': bar_offset,
+            'last': last,
+        }
+
+
+def render(snapshot, output):
+    # Headless: draw the equity curve to an image file (format from the extension)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(14, 5))
+    ax.plot(snapshot['x'], snapshot['y'], linewidth=0.8, color='tab:blue')
+    ax.axhline(0, color='grey', linewidth=0.5)
+    for bar, name in snapshot['months'][1:]:
+        ax.axvline(bar, color='grey', linewidth=0.5, linestyle=':')
+    # At most ~15 day labels, whatever the span
+    days = snapshot['days'][::max(1, len(snapshot['days']) // 15)]
+    ax.set_xticks([bar for bar, _ in days])
+    ax.set_xticklabels([date for _, date in days], rotation=45, ha='right')
+    ax.set_ylabel('PnL')
+    ax.grid(True, alpha=0.3)
+    last = snapshot['last']
+    if last is not None:
+        ax.set_title(f"PnL {last['equity']:.2f} at {last['Date']} {last['Time']} ({snapshot['bars']} bars)")
+    fig.savefig(output, dpi=110, bbox_inches='tight')
+    plt.close(fig)
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>PnL</title>
+<style>body{font-family:sans-serif;margin:12px}canvas{width:100%;height:80vh;border:1px solid #ddd}</style></head>
+<body><div id="status">loading...</div><canvas id="chart"></canvas>
+<script>
+const canvas = document.getElementById('chart'), statusLine = document.getElementById('status');
+function draw(d) {
+  const w = canvas.width = canvas.clientWidth * devicePixelRatio, h = canvas.height = canvas.clientHeight * devicePixelRatio;
+  const ctx = canvas.getContext('2d'), pad = 60 * devicePixelRatio;
+  ctx.clearRect(0, 0, w, h);
+  if (!d.x.length) return;
+  const x0 = d.x[0], x1 = Math.max(d.x[d.x.length - 1], x0 + 1);
+  let y0 = Math.min(0, ...d.y), y1 = Math.max(0, ...d.y);
+  if (y1 === y0) y1 = y0 + 1;
+  const sx = x => pad + (x - x0) / (x1 - x0) * (w - 2 * pad), sy = y => h - pad - (y - y0) / (y1 - y0) * (h - 2 * pad);
+  ctx.font = (11 * devicePixelRatio) + 'px sans-serif';
+  ctx.strokeStyle = '#999'; ctx.fillStyle = '#333';
+  ctx.beginPath(); ctx.moveTo(pad, sy(0)); ctx.lineTo(w - pad, sy(0)); ctx.stroke();
+  [y0, 0, y1].forEach(v => ctx.fillText(v.toFixed(0), 4, sy(v) + 4));
+  const step = Math.max(1, Math.floor(d.days.length / 12));
+  d.days.filter((_, i) => i % step === 0).forEach(([bar, date]) => ctx.fillText(date, sx(bar), h - pad / 3));
+  ctx.setLineDash([2, 4]);
+  d.months.slice(1).forEach(([bar]) => { ctx.beginPath(); ctx.moveTo(sx(bar), pad); ctx.lineTo(sx(bar), h - pad); ctx.stroke(); });
+  ctx.setLineDash([]);
+  ctx.strokeStyle = '#1f77b4'; ctx.beginPath();
+  d.x.forEach((x, i) => i ? ctx.lineTo(sx(x), sy(d.y[i])) : ctx.moveTo(sx(x), sy(d.y[i])));
+  ctx.stroke();
+}
+async function poll() {
+  try {
+    const d = await (await fetch('data')).json();
+    if (d.last) statusLine.textContent = `PnL ${d.last.equity.toFixed(2)} at ${d.last.Date} ${d.last.Time} (${d.last.month}), ${d.bars} bars, ${d.x.length} points drawn`;
+    draw(d);
+  } catch (e) { statusLine.textContent = 'disconnected: ' + e; }
+  setTimeout(poll, INTERVAL_MS);
+}
+poll();
+</script></body></html>
+"""
+
+
+def serve(dashboard, host='127.0.0.1', port=8050, interval=2.0):
+    # Local dashboard: the page polls /data, and each poll reads only the rows appended since
+    # the previous one (PnlDashboard.refresh)
+    lock = threading.Lock()
+    page = PAGE.replace('INTERVAL_MS', str(int(interval * 1000))).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/':
+                body, content_type = page, 'text/html'
+            elif self.path.startswith('/data'):
+                with lock:
+                    dashboard.refresh()
+                    body = json.dumps(dashboard.snapshot()).encode()
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logging.info(f"PnL dashboard for {dashboard.source} on http://{host}:{port}/")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live PnL dashboard over the minute PnL reports of a backtest or paper-trading run.')
+    parser.add_argument('source', help='directory of <MONTH>.<format> PnL reports (e.g. the backtest output dir), or a single report file')
+    parser.add_argument('--output', default=None, help='render headless to this image file (png / svg / pdf) instead of serving')
+    parser.add_argument('--watch', action='store_true', help='with --output: keep re-rendering as new rows arrive')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between refreshes')
+    parser.add_argument('--max-points', type=int, default=DEFAULT_MAX_POINTS, help='points drawn after min/max decimation')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    dashboard = PnlDashboard(args.source, args.max_points)
+    if args.output is None:
+        serve(dashboard, args.host, args.port, args.interval)
+        return
+    while True:
+        started = time.perf_counter()
+        if dashboard.refresh() or not args.watch:
+            snapshot = dashboard.snapshot()
+            render(snapshot, args.output)
+            logging.info(f"Rendered {snapshot['bars']} bars ({len(snapshot['x'])} points) to {args.output} in {time.perf_counter() - started:.2f}s")
+        if not args.watch:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import copy
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cost_model import NO_COSTS
+from position_book import BUY, SELL
+
+
+def month_of(when):
+    # 'YYYY-MM' for a datetime / Timestamp or a 'dd/mm/yyyy' / ISO date(time) string
+    if isinstance(when, str):
+        day = when[:10]
+        when = datetime.strptime(day, '%d/%m/%Y') if '/' in day else datetime.fromisoformat(day)
+    return f"{when.year:04d}-{when.month:02d}"
+
+
+def trade_qty(trades, qty=25):
+    # Each trade's own lot size when the table has a qty column (read from the positions), qty
+    # for trades without one (position files written before positions recorded it)
+    if 'qty' not in trades:
+        return qty
+    return trades['qty'].fillna(qty).to_numpy(dtype=np.float64)
+
+
+def trade_pnl(trades, qty=25):
+    # Vectorized PnL of the combined trade table: sells earn price - current, buys the reverse
+    price = trades['price'].to_numpy(dtype=np.float64)
+    current = trades['current_price'].to_numpy(dtype=np.float64)
+    sell = (trades['BUY/SELL'] == 'SELL').to_numpy()
+    return pd.Series(trade_qty(trades, qty) * np.where(sell, price - current, current - price), index=trades.index)
+
+
+def trade_costs(trades, qty=25, cost_model=NO_COSTS):
+    # Opening plus closing costs of each trade of the combined trade table (see cost_model.py)
+    sides = np.where((trades['BUY/SELL'] == 'SELL').to_numpy(), SELL, BUY)
+    costs = cost_model.position_costs(trades['price'].to_numpy(dtype=np.float64), trades['current_price'].to_numpy(dtype=np.float64), sides,
+                                      trade_qty(trades, qty))
+    return pd.Series(costs, index=trades.index)
+
+
+def max_streak(mask):
+    # Longest run of True values
+    edges = np.diff(np.concatenate([[0], np.asarray(mask, dtype=np.int8), [0]]))
+    runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return int(runs.max()) if len(runs) else 0
+
+
+def metrics_dict(overall_pnl, total_months, best, worst, wins, losses, win_sum, loss_sum, max_win_streak, max_loss_streak, peak, trough):
+    # The combined_metrics.json schema. Max Drawdown keeps its established definition: highest
+    # minus lowest cumulative monthly PnL (see risk_metrics.py for peak-to-trough drawdown).
+    win_percentage = np.float64(wins) / total_months * 100
+    loss_percentage = np.float64(losses) / total_months * 100
+    average_profit_on_win_month = np.float64(win_sum) / wins if wins else np.nan
+    average_loss_on_loss_month = np.float64(loss_sum) / losses if losses else np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reward_to_risk_ratio = abs(average_profit_on_win_month / average_loss_on_loss_month)
+        expectancy = (reward_to_risk_ratio * (win_percentage / 100)) - (loss_percentage / 100)
+        max_drawdown = np.float64(peak) - trough
+        max_drawdown_percentage = (max_drawdown / peak) * 100
+    return {
+        "Overall PnL": float(overall_pnl),
+        "Average Month PnL": float(overall_pnl / total_months),
+        "Max Profit Month": {"Month": best[0], "Value": float(best[1])},
+        "Max Loss Month": {"Month": worst[0], "Value": float(worst[1])},
+        "Total Months": int(total_months),
+        "Win %": float(win_percentage),
+        "Loss %": float(loss_percentage),
+        "Reward to Risk Ratio": float(reward_to_risk_ratio),
+        "Expectancy": float(expectancy),
+        "Max Winning Streak": int(max_win_streak),
+        "Max Losing Streak": int(max_loss_streak),
+        "Average Profit on Winning Month": float(average_profit_on_win_month),
+        "Average Loss on Losing Month": float(average_loss_on_loss_month),
+        "Max Drawdown": float(max_drawdown),
+        "Max Drawdown Percentage": float(max_drawdown_percentage),
+    }
+
+
+def monthly_metrics(monthly_pnl):
+    # Batch path: the combined_metrics.json schema from a Series of monthly PnL indexed by month
+    values = monthly_pnl.to_numpy(dtype=np.float64)
+    cumulative = np.cumsum(values)
+    wins, losses = values > 0, values < 0
+    return metrics_dict(
+        overall_pnl=values.sum(),
+        total_months=len(values),
+        best=(str(monthly_pnl.index[np.argmax(values)]), values.max()),
+        worst=(str(monthly_pnl.index[np.argmin(values)]), values.min()),
+        wins=int(wins.sum()), losses=int(losses.sum()),
+        win_sum=values[wins].sum(), loss_sum=values[losses].sum(),
+        max_win_streak=max_streak(wins), max_loss_streak=max_streak(losses),
+        peak=cumulative.max(), trough=cumulative.min(),
+    )
+
+
+class MonthlyStats:
+    # Running statistics over closed months; every field updates in O(1) per month
+
+    def __init__(self):
+        self.total = 0.0
+        self.months = 0
+        self.wins = 0
+        self.losses = 0
+        self.win_sum = 0.0
+        self.loss_sum = 0.0
+        self.win_streak = 0
+        self.loss_streak = 0
+        self.max_win_streak = 0
+        self.max_loss_streak = 0
+        self.best = None
+        self.worst = None
+        self.peak = None
+        self.trough = None
+
+    def add_month(self, month, pnl):
+        self.total += pnl
+        self.months += 1
+        if pnl > 0:
+            self.wins += 1
+            self.win_sum += pnl
+            self.win_streak, self.loss_streak = self.win_streak + 1, 0
+        elif pnl < 0:
+            self.losses += 1
+            self.loss_sum += pnl
+            self.win_streak, self.loss_streak = 0, self.loss_streak + 1
+        else:
+            self.win_streak = self.loss_streak = 0
+        self.max_win_streak = max(self.max_win_streak, self.win_streak)
+        self.max_loss_streak = max(self.max_loss_streak, self.loss_streak)
+        # First month wins ties, like idxmax / idxmin
+        if self.best is None or pnl > self.best[1]:
+            self.best = (month, pnl)
+        if self.worst is None or pnl < self.worst[1]:
+            self.worst = (month, pnl)
+        self.peak = self.total if self.peak is None else max(self.peak, self.total)
+        self.trough = self.total if self.trough is None else min(self.trough, self.total)
+
+    def to_metrics(self):
+        if not self.months:
+            return {}
+        return metrics_dict(self.total, self.months, self.best, self.worst, self.wins, self.losses, self.win_sum, self.loss_sum,
+                            self.max_win_streak, self.max_loss_streak, self.peak, self.trough)
+
+
+class MetricsAccumulator:
+    # Incremental version of combined_metrics.py, fed while a backtest or sweep runs:
+    #   add_trade(side, price, current_price, when)  - a trade's PnL adds to its month
+    #   add_bar(date, pnl) / add_bars(dates, pnls)   - minute PnL bars, each the month-to-date MTM
+    # Updates must arrive in month order. A month is closed into the running stats when the
+    # first update of the next month arrives; metrics() includes the open month without closing
+    # it, so it can be called at any point. Besides the schema it tracks the equity curve's
+    # running peak and peak-to-trough drawdown.
+
+    def __init__(self, qty=25):
+        self.qty = qty
+        self.closed = MonthlyStats()
+        self.month = None
+        self.month_pnl = 0.0
+        self.compensation = 0.0
+        self.bars = 0
+        self.equity_peak = None
+        self.max_drawdown = 0.0
+
+    def enter_month(self, month):
+        if month == self.month:
+            return
+        if self.month is not None:
+            if month < self.month:
+                raise ValueError(f"Metrics update for {month} after {self.month}; updates must arrive in month order")
+            self.closed.add_month(self.month, self.month_pnl)
+        self.month, self.month_pnl, self.compensation = month, 0.0, 0.0
+
+    def update_equity(self, equity):
+        if self.equity_peak is None or equity > self.equity_peak:
+            self.equity_peak = equity
+        self.max_drawdown = max(self.max_drawdown, self.equity_peak - equity)
+
+    @property
+    def equity(self):
+        return self.closed.total + self.month_pnl
+
+    def add_trade(self, side, price, current_price, when):
+        self.enter_month(month_of(when))
+        pnl = self.qty * ((price - current_price) if side == 'SELL' else (current_price - price))
+        # Kahan summation, as pandas' groupby sum does, so the month totals match the batch path
+        y = pnl - self.compensation
+        total = self.month_pnl + y
+        self.compensation = (total - self.month_pnl) - y
+        self.month_pnl = total
+        self.update_equity(self.equity)
+        return pnl
+
+    def add_bar(self, date, pnl):
+        self.enter_month(month_of(date))
+        self.month_pnl = pnl
+        self.bars += 1
+        self.update_equity(self.equity)
+
+    def add_bars(self, dates, pnls):
+        # A batch of bars (e.g. one record_many call): one month switch check per distinct month
+        pnls = np.asarray(pnls, dtype=np.float64)
+        if not len(pnls):
+            return
+        months = [month_of(date) for date in pd.unique(np.asarray(dates))]
+        if len(months) > 1:
+            for date, pnl in zip(dates, pnls):
+                self.add_bar(date, pnl)
+            return
+        self.enter_month(months[0])
+        equity = self.closed.total + pnls
+        peaks = np.maximum.accumulate(equity)
+        if self.equity_peak is not None:
+            peaks = np.maximum(peaks, self.equity_peak)
+        self.equity_peak = float(peaks[-1])
+        self.max_drawdown = max(self.max_drawdown, float(np.max(peaks - equity)))
+        self.month_pnl = float(pnls[-1])
+        self.bars += len(pnls)
+
+    def monthly_stats(self):
+        stats = copy.copy(self.closed)
+        if self.month is not None:
+            stats.add_month(self.month, self.month_pnl)
+        return stats
+
+    def metrics(self):
+        return self.monthly_stats().to_metrics()
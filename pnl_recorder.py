@@ -0,0 +1,123 @@
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+PNL_COLUMNS = ['Date', 'Time', 'PnL']
+
+
+def write_parquet(df, output_path):
+    df.to_parquet(output_path, index=False)
+
+
+def write_xlsx(df, output_path):
+    df.to_excel(output_path, index=False)
+
+
+# Final report writers keyed by file suffix. CSV needs no writer: flushed rows are
+# appended straight to the report. Other formats spill flushed rows to a
+# '<report>.partial.csv' file and are written once by close().
+PNL_WRITERS = {
+    'parquet': write_parquet,
+    'xlsx': write_xlsx,
+}
+
+
+def read_pnl_report(path):
+    path = Path(path)
+    if path.suffix == '.csv':
+        return pd.read_csv(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+
+def read_spill(spill_path):
+    return pd.read_csv(spill_path, dtype={'Date': str, 'Time': str}, float_precision='round_trip')
+
+
+class PnlRecorder:
+    # Collects the Date / Time / PnL report rows in memory and writes them in bulk.
+    # flush() (day end) appends the buffered rows to a CSV on disk; close() (month end)
+    # turns that into the final report with a single write.
+    # With output_path=None nothing is written and the rows stay available via to_frame().
+    # resume_rows keeps the first N rows already flushed by an earlier, interrupted run.
+    # metrics (a pnl_metrics.MetricsAccumulator) is fed every recorded row for live metrics.
+
+    def __init__(self, output_path=None, fmt=None, resume_rows=None, metrics=None):
+        self.metrics = metrics
+        self.output_path = Path(output_path) if output_path is not None else None
+        self.fmt = fmt or (self.output_path.suffix.lstrip('.') if self.output_path is not None else None)
+        self.dates = []
+        self.times = []
+        self.pnls = []
+        self.pending = []
+        self.rows_flushed = 0
+        self.spill_path = None
+        if self.output_path is None:
+            return
+        if self.fmt != 'csv' and self.fmt not in PNL_WRITERS:
+            raise ValueError(f"Unsupported PnL report format: {self.fmt}")
+        if self.fmt == 'csv':
+            self.spill_path = self.output_path
+        else:
+            self.spill_path = self.output_path.with_name(self.output_path.name + '.partial.csv')
+
+        if resume_rows and self.spill_path.exists():
+            kept = read_spill(self.spill_path).iloc[:resume_rows]
+            kept.to_csv(self.spill_path, index=False)
+            self.rows_flushed = len(kept)
+        elif self.spill_path.exists():
+            self.spill_path.unlink()
+
+    def __len__(self):
+        return self.rows_flushed + sum(len(df) for df in self.pending) + len(self.pnls)
+
+    def record(self, date, time, pnl):
+        self.dates.append(date)
+        self.times.append(time)
+        self.pnls.append(pnl)
+        if self.metrics is not None:
+            self.metrics.add_bar(date, pnl)
+
+    def record_many(self, dates, times, pnls):
+        self.dates.extend(dates)
+        self.times.extend(times)
+        self.pnls.extend(pnls)
+        if self.metrics is not None:
+            self.metrics.add_bars(dates, pnls)
+
+    def buffered_frame(self):
+        return pd.DataFrame({'Date': self.dates, 'Time': self.times, 'PnL': self.pnls}, columns=PNL_COLUMNS)
+
+    def to_frame(self):
+        frames = self.pending + [self.buffered_frame()]
+        if self.spill_path is not None and self.spill_path.exists():
+            frames.insert(0, read_spill(self.spill_path))
+        return pd.concat(frames, ignore_index=True)
+
+    def flush(self):
+        if not self.pnls:
+            return
+        try:
+            df = self.buffered_frame()
+            self.dates, self.times, self.pnls = [], [], []
+            if self.spill_path is None:
+                self.pending.append(df)
+                return
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            existing = self.spill_path.exists()
+            df.to_csv(self.spill_path, mode='a' if existing else 'w', header=not existing, index=False)
+            self.rows_flushed += len(df)
+        except Exception as e:
+            logging.error(f"Error flushing PnL rows to: {self.spill_path} - {e}")
+
+    def close(self):
+        self.flush()
+        if self.output_path is None or self.fmt == 'csv' or not self.spill_path.exists():
+            return
+        try:
+            PNL_WRITERS[self.fmt](read_spill(self.spill_path), self.output_path)
+            self.spill_path.unlink()
+        except Exception as e:
+            logging.error(f"Error writing PnL report: {self.output_path} - {e}")
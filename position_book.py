@@ -0,0 +1,219 @@
+import numpy as np
+
+BUY = 1
+SELL = -1
+
+
+def side_of(key):
+    # Same substring tests the PnL loop used on position keys
+    if 'sell' in key:
+        return SELL
+    if 'buy' in key:
+        return BUY
+    return 0
+
+
+class PositionBook:
+    # Struct-of-arrays store for the month's positions, replacing the dict of position dicts.
+    # Prices, qty, side and leg live in NumPy arrays that grow by doubling, so marking legs and
+    # computing PnL are array operations and hedges add no per-bar Python objects.
+    #   side - BUY / SELL (0 for keys that are neither, which never count towards PnL)
+    #   leg  - column of the leg this position is marked against (see assign_legs), -1 for none
+    # Keys, dates and times are only needed for output and stay in plain lists.
+    # A closed position (close: squared off or settled) keeps its row as the realized ledger:
+    # its exit price stays in current, its PnL moves into `realized`, and marking and PnL only
+    # ever touch the open rows.
+
+    def __init__(self, capacity=16):
+        self.keys = []
+        self.dates = []
+        self.times = []
+        self.option_types = []
+        self.entry = np.full(capacity, np.nan)
+        self.current = np.full(capacity, np.nan)
+        self.qty = np.zeros(capacity, dtype=np.int64)
+        self.side = np.zeros(capacity, dtype=np.int8)
+        self.strike = np.zeros(capacity, dtype=np.int64)
+        self.leg = np.full(capacity, -1, dtype=np.int64)
+        self.closed = np.zeros(capacity, dtype=bool)
+        self.exit_dates = []
+        self.exit_times = []
+        self.realized = 0.0
+        self.last_closed = -1
+        self.open_index = None
+        self.legs = []
+        # Latest position per key prefix ('ce_sell_pos', 'pe_buy_pos', ...) as (pos id, row)
+        self.latest_positions = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def grow(self):
+        capacity = 2 * len(self.entry)
+        for name, fill in (('entry', np.nan), ('current', np.nan), ('qty', 0), ('side', 0), ('strike', 0), ('leg', -1), ('closed', False)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, key, position):
+        # position: a dict as built by create_position_dict
+        row = len(self.keys)
+        if row == len(self.entry):
+            self.grow()
+        self.keys.append(key)
+        self.dates.append(position['date'])
+        self.times.append(position['time'])
+        self.option_types.append(position['option_type'])
+        self.entry[row] = np.nan if position['entry_price'] is None else position['entry_price']
+        self.current[row] = np.nan if position['current_price'] is None else position['current_price']
+        self.qty[row] = position['qty']
+        self.side[row] = side_of(key)
+        self.strike[row] = position['strike']
+        self.leg[row] = self.leg_index(position['strike'], position['option_type'])
+        self.exit_dates.append(None)
+        self.exit_times.append(None)
+        self.open_index = None
+
+        if self.side[row] != 0:
+            prefix, _, pos_id = key.rpartition('_')
+            pos_id = int(pos_id)
+            if prefix not in self.latest_positions or pos_id > self.latest_positions[prefix][0]:
+                self.latest_positions[prefix] = (pos_id, row)
+        if 'exit_price' in position:
+            # A position of the ledger, e.g. from a journal or the result cache
+            self.close(row, position['exit_price'], position.get('exit_date'), position.get('exit_time'))
+        return row
+
+    def close(self, row, price, date=None, time=None):
+        # Close a position at `price`: it leaves the marked rows and its PnL is realized
+        self.close_many([row], [price], date, time)
+
+    def close_many(self, rows, prices, date=None, time=None):
+        # The realized total is the sequential sum of the closed rows' PnL in position order, not
+        # in the order they were closed: a resumed or result-cache replayed run closes them in
+        # another order, and only the position-order sum comes out the same to the last bit.
+        # Closes past the last closed row (stop square-offs, replays) extend the sum as it
+        # stands; any other close (an expiry settling older rows) re-sums the closed rows once.
+        rows = [int(row) for row in rows]
+        if not rows:
+            return
+        for row, price in zip(rows, prices):
+            self.current[row] = np.nan if price is None else price
+            self.closed[row] = True
+            self.exit_dates[row] = date
+            self.exit_times[row] = time
+        self.open_index = None
+        if rows[0] > self.last_closed and all(a < b for a, b in zip(rows, rows[1:])):
+            pnl = self.position_pnl_rows(rows, self.current[rows])
+            if self.last_closed >= 0:
+                pnl = np.concatenate(([self.realized], pnl))
+            self.realized = float(np.add.accumulate(pnl)[-1])
+        else:
+            closed = np.flatnonzero(self.closed[:len(self)])
+            self.realized = float(np.add.accumulate(self.position_pnl_rows(closed, self.current[closed]))[-1])
+        self.last_closed = max(self.last_closed, max(rows))
+
+    @property
+    def open_rows(self):
+        # Rows of the open positions, in position order
+        if self.open_index is None:
+            self.open_index = np.flatnonzero(~self.closed[:len(self)])
+        return self.open_index
+
+    def leg_index(self, strike, option_type):
+        for leg, (leg_strike, leg_type) in enumerate(self.legs):
+            if strike == leg_strike and option_type == leg_type:
+                return leg
+        return -1
+
+    def assign_legs(self, legs):
+        # legs: [(strike, option_type), ...]; the first matching leg wins
+        self.legs = list(legs)
+        for row in range(len(self)):
+            self.leg[row] = self.leg_index(self.strike[row], self.option_types[row])
+        return self.leg[:len(self)]
+
+    def latest_sell(self, option_type):
+        # Row of the sell with the highest position id for CE / PE, tracked as positions are added
+        return self.latest_positions[f"{option_type.lower()}_sell_pos"][1]
+
+    def latest_buy(self, option_type):
+        # Row of the newest CE / PE buy (the hedge of the newest sell), None before any
+        latest = self.latest_positions.get(f"{option_type.lower()}_buy_pos")
+        return None if latest is None else latest[1]
+
+    def mark(self, leg_prices):
+        # leg_prices: one price per assigned leg; NaN leaves the legs' positions unchanged
+        rows = self.open_rows
+        leg = self.leg[rows]
+        prices = np.asarray(leg_prices, dtype=np.float64)[np.maximum(leg, 0)]
+        update = (leg >= 0) & ~np.isnan(prices)
+        self.current[rows[update]] = prices[update]
+
+    def leg_start_prices(self):
+        # Current price of the last open position on each leg (NaN when it has none)
+        starts = np.full(len(self.legs), np.nan)
+        for row in self.open_rows:
+            if self.leg[row] >= 0 and not np.isnan(self.current[row]):
+                starts[self.leg[row]] = self.current[row]
+        return starts
+
+    def position_pnl_rows(self, rows, current):
+        # PnL of the positions in rows for current prices of shape (..., rows); untracked positions give 0
+        entry = self.entry[rows]
+        pnl = self.side[rows] * (current - entry) * self.qty[rows]
+        counted = (self.side[rows] != 0) & ~np.isnan(entry) & ~np.isnan(self.current[rows])
+        return np.where(counted & ~np.isnan(current), pnl, 0.0)
+
+    def total_pnl(self):
+        # Realized PnL plus the open positions summed in position order, as the dict loop did,
+        # so totals match it to the last bit
+        rows = self.open_rows
+        if not len(rows):
+            return self.realized
+        return self.realized + float(np.add.accumulate(self.position_pnl_rows(rows, self.current[rows]))[-1])
+
+    def pnl_series(self, leg_marks):
+        # Total PnL for each row of a (minutes x legs) mark matrix; open positions on no leg keep
+        # their current price
+        rows = self.open_rows
+        if not len(rows):
+            return np.full(len(leg_marks), self.realized)
+        leg = self.leg[rows]
+        current = np.where(leg >= 0, leg_marks[:, np.maximum(leg, 0)], self.current[rows])
+        return self.realized + np.add.accumulate(self.position_pnl_rows(rows, current), axis=1)[:, -1]
+
+    def ledger(self):
+        # The closed positions with their realized PnL, in the order they were opened
+        rows = np.flatnonzero(self.closed[:len(self)])
+        pnl = self.position_pnl_rows(rows, self.current[rows])
+        return [{'key': self.keys[row], **self.position(row), 'pnl': float(row_pnl)} for row, row_pnl in zip(rows, pnl)]
+
+    def position(self, row):
+        position = {
+            'entry_price': None if np.isnan(self.entry[row]) else float(self.entry[row]),
+            'strike': int(self.strike[row]),
+            'option_type': self.option_types[row],
+            'date': self.dates[row],
+            'time': self.times[row],
+            'qty': int(self.qty[row]),
+            'current_price': None if np.isnan(self.current[row]) else float(self.current[row]),
+        }
+        if self.closed[row]:
+            position.update(exit_price=position['current_price'], exit_date=self.exit_dates[row], exit_time=self.exit_times[row])
+        return position
+
+    def to_dict(self):
+        # The position_dict layout written to the journal and the positions json
+        return {key: self.position(row) for row, key in enumerate(self.keys)}
+
+    @classmethod
+    def from_dict(cls, position_dict):
+        book = cls(capacity=max(16, len(position_dict)))
+        for key, position in position_dict.items():
+            book.add(key, position)
+        return book
@@ -0,0 +1,139 @@
+import copy
+import json
+import logging
+from pathlib import Path
+
+
+def leg_key(strike, option_type):
+    # Positions on the same strike and option type share a price, e.g. '22000CE'
+    return f"{strike}{option_type}"
+
+
+class PositionJournal:
+    # Append-only JSON Lines log of position events for one month run:
+    #   start     - month, expiry and the four strikes of the iron fly
+    #   open      - a new position (key + the position dict)
+    #   mark      - leg prices that changed since the previous mark
+    #   close     - a position squared off or settled (key, exit date / time and price)
+    #   snapshot  - the full position dict, written every `snapshot_every` events and at each
+    #               day end; day-end snapshots are checkpoints a killed run can resume from
+    # Disk writes grow with the number of events instead of positions x bars.
+
+    def __init__(self, journal_path, snapshot_every=1000, truncate_at=None):
+        # journal_path=None gives a journal that writes nothing (parameter sweeps)
+        self.journal_path = Path(journal_path) if journal_path is not None else None
+        self.snapshot_every = snapshot_every
+        self.events_since_snapshot = 0
+        self.last_marks = {}
+        self.file = None
+        if self.journal_path is None:
+            return
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        if truncate_at is None:
+            self.file = open(self.journal_path, 'w')
+        else:
+            # Resuming: drop the events written after the checkpoint we resume from
+            self.file = open(self.journal_path, 'r+')
+            self.file.truncate(truncate_at)
+            self.file.seek(truncate_at)
+
+    def write(self, event):
+        if self.file is not None:
+            self.file.write(json.dumps(event) + '\n')
+
+    def start(self, month_name, expiry_date, strikes, config=None):
+        self.write({'event': 'start', 'month': month_name, 'expiry': expiry_date, 'strikes': strikes, 'config': config})
+
+    def open_position(self, key, position, position_book=None):
+        self.write({'event': 'open', 'key': key, 'position': position})
+        self.last_marks[leg_key(position['strike'], position['option_type'])] = position['current_price']
+        self.count_event(position_book)
+
+    def mark(self, date, time, prices, position_book=None):
+        # prices: {(strike, option_type): price}; None and unchanged prices are not written
+        changed = {}
+        for (strike, option_type), price in prices.items():
+            key = leg_key(strike, option_type)
+            if price is not None and self.last_marks.get(key) != price:
+                changed[key] = price
+                self.last_marks[key] = price
+        if changed:
+            self.write({'event': 'mark', 'date': date, 'time': time, 'prices': changed})
+            self.count_event(position_book)
+
+    def close_position(self, key, date, time, price, position_book=None):
+        self.write({'event': 'close', 'key': key, 'date': date, 'time': time, 'price': price})
+        self.count_event(position_book)
+
+    def count_event(self, position_book):
+        self.events_since_snapshot += 1
+        if position_book is not None and self.events_since_snapshot >= self.snapshot_every:
+            self.snapshot(position_book)
+
+    def snapshot(self, position_book, checkpoint=None):
+        self.events_since_snapshot = 0
+        if self.file is None:
+            return
+        event = {'event': 'snapshot', 'positions': position_book.to_dict()}
+        if checkpoint is not None:
+            event['checkpoint'] = checkpoint
+        self.write(event)
+        if checkpoint is not None:
+            # Make the checkpoint durable before the next day starts
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+
+def apply_mark(position_dict, prices):
+    for pos in position_dict.values():
+        if 'exit_price' in pos:
+            continue
+        price = prices.get(leg_key(pos['strike'], pos['option_type']))
+        if price is not None:
+            pos['current_price'] = price
+
+
+def load_positions(journal_path, checkpoint_only=False):
+    # Replay a position journal. Returns (position_dict, state) where state holds the start
+    # event ('start'), the last checkpoint ('checkpoint') and the byte offset just after it
+    # ('offset'). With checkpoint_only=True the replay stops at the last checkpoint, which is
+    # the state a resumed run continues from.
+    position_dict = {}
+    state = {}
+    checkpoint_positions = {}
+    try:
+        with open(journal_path, 'rb') as f:
+            offset = 0
+            for raw in f:
+                try:
+                    event = json.loads(raw)
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves a partial last line
+                    logging.error(f"Truncated event at byte {offset} in position journal: {journal_path}")
+                    break
+                offset += len(raw)
+                kind = event.get('event')
+                if kind == 'start':
+                    state['start'] = event
+                elif kind == 'open':
+                    position_dict[event['key']] = event['position']
+                elif kind == 'mark':
+                    apply_mark(position_dict, event['prices'])
+                elif kind == 'close':
+                    pos = position_dict[event['key']]
+                    pos.update(current_price=event['price'], exit_price=event['price'],
+                               exit_date=event['date'], exit_time=event['time'])
+                elif kind == 'snapshot':
+                    position_dict = event['positions']
+                    if 'checkpoint' in event:
+                        state['checkpoint'] = event['checkpoint']
+                        state['offset'] = offset
+                        checkpoint_positions = copy.deepcopy(position_dict)
+    except Exception as e:
+        logging.error(f"Error loading position journal: {journal_path} - {e}")
+    if checkpoint_only:
+        return checkpoint_positions, state
+    return position_dict, state
@@ -0,0 +1,170 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+# Bump whenever the engine's results for the same inputs change (stop-loss rules, PnL
+# formula, ...), so entries written by older code are never reused
+RESULT_CACHE_VERSION = 3
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def json_digest(value):
+    # Key order is kept: the position dict's order is part of the state
+    return digest(json.dumps(value, default=str).encode())
+
+
+def content_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResultCache:
+    # Content-addressed store of per-day backtest results. A day's outcome depends only on
+    # the day file, the positions carried in from the previous day and the strategy config,
+    # so an entry is keyed by the hash of those and holds the positions carried out plus the
+    # day's PnL rows; re-running a month replays unchanged days from here instead of loading
+    # and monitoring them.
+    #   entries/<key[:2]>/<key>.json - one entry, written atomically
+    #   digests/<stat key>           - content hash of a source file, per (path, size, mtime)
+    # The entries are kept under max_bytes by evicting the least recently used ones; a hit
+    # touches the entry's mtime, which is the LRU clock.
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.entry_dir = self.cache_dir / 'entries'
+        self.digest_dir = self.cache_dir / 'digests'
+        self.max_bytes = max_bytes
+        self.size = None  # bytes in entries/, scanned on the first put
+        self.digests = {}
+        self.hits = 0
+        self.misses = 0
+
+    def file_digest(self, path):
+        # Content hash of a source file, hashed once per version of the file
+        path = Path(path).resolve()
+        stat = path.stat()
+        stat_key = digest(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        if stat_key in self.digests:
+            return self.digests[stat_key]
+        memo = self.digest_dir / stat_key
+        try:
+            value = memo.read_text()
+        except OSError:
+            value = content_digest(path)
+            self.write_atomic(memo, value)
+        self.digests[stat_key] = value
+        return value
+
+    def key(self, kind, **parts):
+        return json_digest({'version': RESULT_CACHE_VERSION, 'kind': kind, **parts})
+
+    def entry_path(self, key):
+        return self.entry_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logging.error(f"Error reading result cache entry: {path} - {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        path = self.entry_path(key)
+        try:
+            data = json.dumps(entry, default=str)
+            self.write_atomic(path, data)
+            if self.size is None:
+                self.size = self.scan_size()
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict(self.max_bytes)
+        except Exception as e:
+            logging.error(f"Error writing result cache entry: {path} - {e}")
+
+    def write_atomic(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(data)
+        os.replace(tmp, path)
+
+    def scan(self):
+        # (mtime, size, path) of every entry; other processes may evict while we look
+        entries = []
+        if not self.entry_dir.exists():
+            return entries
+        for shard in os.scandir(self.entry_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def scan_size(self):
+        return sum(size for _, size, _ in self.scan())
+
+    def evict(self, max_bytes):
+        # Drop least recently used entries until the cache fits in max_bytes
+        entries = sorted(self.scan())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.size = total
+        if removed:
+            logging.info(f"Evicted {removed} result cache entries from {self.cache_dir} ({total} bytes kept)")
+        return removed
+
+    def stats(self):
+        entries = self.scan()
+        return {'entries': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or trim the per-day backtest result cache.')
+    parser.add_argument('cache_dir')
+    parser.add_argument('--max-mb', type=float, default=None, help='evict least recently used entries down to this size')
+    parser.add_argument('--clear', action='store_true', help='remove every entry')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    cache = ResultCache(args.cache_dir)
+    if args.clear:
+        cache.evict(0)
+    elif args.max_mb is not None:
+        cache.evict(int(args.max_mb * 1024 * 1024))
+    stats = cache.stats()
+    logging.info(f"{stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB in {args.cache_dir}")
@@ -0,0 +1,211 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dataset_catalog import MONTH_FORMAT
+from pnl_recorder import read_pnl_report
+
+BARS_PER_DAY = 375          # 09:15 - 15:29 minute bars
+TRADING_DAYS_PER_YEAR = 252
+
+
+def equity_curve(month_frames):
+    # Minute equity across months from per-month Date / Time / PnL reports (each month's PnL is
+    # its own month-to-date MTM): every month is offset by the closing PnL of the months before
+    pnls, dates, times = [], [], []
+    offset = 0.0
+    for df in month_frames:
+        if df.empty:
+            continue
+        pnl = df['PnL'].to_numpy(dtype=np.float64)
+        pnls.append(pnl + offset)
+        dates.append(df['Date'].astype(str).to_numpy())
+        times.append(df['Time'].astype(str).to_numpy())
+        offset += pnl[-1]
+    if not pnls:
+        return np.zeros(0), np.zeros(0, dtype='datetime64[s]'), np.zeros(0, dtype=object)
+    dates = np.concatenate(dates)
+    timestamps = pd.to_datetime(pd.Series(dates) + ' ' + np.concatenate(times), format='%d/%m/%Y %H:%M:%S').to_numpy()
+    return np.concatenate(pnls), timestamps, dates
+
+
+def drawdown(equity):
+    # Peak-to-trough drawdown: the largest fall from a running high, the bar that high was set
+    # (start), the bar of the low (trough) and the first bar back at the high (recovery, or -1)
+    equity = np.asarray(equity, dtype=np.float64)
+    if not len(equity):
+        return {'max_drawdown': 0.0, 'start': -1, 'trough': -1, 'recovery': -1}
+    peaks = np.maximum.accumulate(equity)
+    underwater = peaks - equity
+    trough = int(np.argmax(underwater))
+    peak_value = peaks[trough]
+    start = trough - int(np.argmax(equity[trough::-1] == peak_value))
+    recovered = np.flatnonzero(equity[trough:] >= peak_value)
+    recovery = trough + int(recovered[0]) if len(recovered) and underwater[trough] > 0 else -1
+    return {'max_drawdown': float(underwater[trough]), 'start': start, 'trough': trough, 'recovery': recovery}
+
+
+def day_starts(days):
+    # Index of the first bar of each day (bars must be in time order)
+    days = np.asarray(days)
+    if not len(days):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate([[True], days[1:] != days[:-1]]))
+
+
+def segment_cummax(values, starts):
+    # np.maximum.accumulate restarted at every segment start: shift each segment so its values
+    # sit above everything before it and accumulate once. The result is read back from the bar
+    # holding each running high, so it carries the original (unshifted) values.
+    lows = np.minimum.reduceat(values, starts)
+    highs = np.maximum.reduceat(values, starts)
+    widths = highs - lows + 1.0
+    base = np.concatenate([[0.0], np.cumsum(widths)[:-1]]) - lows
+    lengths = np.diff(np.concatenate([starts, [len(values)]]))
+    shifted = values + np.repeat(base, lengths)
+    holder = np.where(shifted == np.maximum.accumulate(shifted), np.arange(len(values)), 0)
+    return values[np.maximum.accumulate(holder)]
+
+
+def daily_stats(equity, days):
+    # One row per day: PnL vs the previous day's close, the day's high / low, the worst and
+    # best excursion from the previous close and the largest intraday peak-to-trough drawdown
+    equity = np.asarray(equity, dtype=np.float64)
+    starts = day_starts(days)
+    if not len(starts):
+        return pd.DataFrame(columns=['Date', 'bars', 'open', 'close', 'pnl', 'high', 'low', 'worst_excursion', 'best_excursion', 'max_drawdown'])
+    ends = np.concatenate([starts[1:], [len(equity)]]) - 1
+    previous_close = np.concatenate([[0.0], equity[ends[:-1]]])
+    highs = np.maximum.reduceat(equity, starts)
+    lows = np.minimum.reduceat(equity, starts)
+    intraday_drawdown = np.maximum.reduceat(segment_cummax(equity, starts) - equity, starts)
+    return pd.DataFrame({
+        'Date': np.asarray(days)[starts],
+        'bars': ends - starts + 1,
+        'open': previous_close,
+        'close': equity[ends],
+        'pnl': equity[ends] - previous_close,
+        'high': highs,
+        'low': lows,
+        'worst_excursion': lows - previous_close,
+        'best_excursion': highs - previous_close,
+        'max_drawdown': intraday_drawdown,
+    })
+
+
+def rolling_sum(values, window):
+    sums = np.cumsum(np.concatenate([[0.0], values]))
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sums[window:] - sums[:-window]
+    return out
+
+
+def rolling_sharpe(returns, window, periods_per_year=BARS_PER_DAY * TRADING_DAYS_PER_YEAR):
+    # Annualised mean / standard deviation of bar PnL changes over a trailing window (NaN until full)
+    returns = np.asarray(returns, dtype=np.float64)
+    mean = rolling_sum(returns, window) / window
+    variance = (rolling_sum(returns * returns, window) - window * mean * mean) / (window - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(variance > 0, mean / np.sqrt(np.maximum(variance, 0)), np.nan) * np.sqrt(periods_per_year)
+
+
+def rolling_sortino(returns, window, periods_per_year=BARS_PER_DAY * TRADING_DAYS_PER_YEAR):
+    # As rolling_sharpe, with the downside deviation (losses only) in the denominator
+    returns = np.asarray(returns, dtype=np.float64)
+    mean = rolling_sum(returns, window) / window
+    downside = np.minimum(returns, 0.0)
+    downside_deviation = np.sqrt(rolling_sum(downside * downside, window) / window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(downside_deviation > 0, mean / downside_deviation, np.nan) * np.sqrt(periods_per_year)
+
+
+def ratio(returns, downside_only=False, periods_per_year=BARS_PER_DAY * TRADING_DAYS_PER_YEAR):
+    # Whole-period Sharpe (or Sortino) of bar PnL changes
+    if len(returns) < 2:
+        return float('nan')
+    if downside_only:
+        deviation = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+    else:
+        deviation = np.std(returns, ddof=1)
+    return float(np.mean(returns) / deviation * np.sqrt(periods_per_year)) if deviation > 0 else float('nan')
+
+
+def risk_summary(equity, days, timestamps=None, window=BARS_PER_DAY, periods_per_year=BARS_PER_DAY * TRADING_DAYS_PER_YEAR):
+    # Flat dict of the bar-level risk metrics; positions in the curve are reported as timestamps
+    # when given, bar indices otherwise
+    equity = np.asarray(equity, dtype=np.float64)
+    returns = np.diff(equity, prepend=0.0)
+    at = (lambda i: str(pd.Timestamp(timestamps[i])) if i >= 0 else None) if timestamps is not None else (lambda i: i if i >= 0 else None)
+
+    dd = drawdown(equity)
+    start, trough, recovery = dd['start'], dd['trough'], dd['recovery']
+    daily = daily_stats(equity, days)
+    sharpe = rolling_sharpe(returns, window, periods_per_year)
+    sortino = rolling_sortino(returns, window, periods_per_year)
+    worst_day = int(np.argmin(daily['worst_excursion'].to_numpy())) if len(daily) else -1
+    return {
+        'bars': len(equity),
+        'days': len(daily),
+        'final_pnl': float(equity[-1]) if len(equity) else 0.0,
+        'max_drawdown': dd['max_drawdown'],
+        'max_drawdown_start': at(start),
+        'max_drawdown_trough': at(trough),
+        'max_drawdown_recovery': at(recovery),
+        # Bars from the high to the low, and from the high until recovery (or the end of the curve)
+        'drawdown_bars': trough - start,
+        'underwater_bars': (recovery if recovery >= 0 else len(equity) - 1) - start,
+        'worst_intraday_excursion': float(daily['worst_excursion'].min()) if len(daily) else 0.0,
+        'worst_intraday_excursion_day': str(daily['Date'].iloc[worst_day]) if worst_day >= 0 else None,
+        'max_intraday_drawdown': float(daily['max_drawdown'].max()) if len(daily) else 0.0,
+        'best_day_pnl': float(daily['pnl'].max()) if len(daily) else 0.0,
+        'worst_day_pnl': float(daily['pnl'].min()) if len(daily) else 0.0,
+        'win_days_pct': float((daily['pnl'] > 0).mean() * 100) if len(daily) else 0.0,
+        'sharpe': ratio(returns, periods_per_year=periods_per_year),
+        'sortino': ratio(returns, downside_only=True, periods_per_year=periods_per_year),
+        'rolling_sharpe_min': float(np.nanmin(sharpe)) if np.isfinite(sharpe).any() else float('nan'),
+        'rolling_sortino_min': float(np.nanmin(sortino)) if np.isfinite(sortino).any() else float('nan'),
+    }
+
+
+def load_month_reports(pnl_dir, months=None, pnl_format='xlsx'):
+    # Per-month minute PnL reports (<MONTH>.<format>) in calendar order
+    paths = sorted(Path(pnl_dir).glob(f'*.{pnl_format}'))
+    frames = {}
+    for path in paths:
+        try:
+            month = datetime.strptime(path.stem, MONTH_FORMAT)
+        except ValueError:
+            continue
+        if months is None or path.stem in months:
+            frames[month] = read_pnl_report(path)
+    return [frames[month] for month in sorted(frames)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bar-level drawdown and risk metrics over the minute PnL reports.')
+    parser.add_argument('pnl_dir', help='directory of <MONTH>.<format> minute PnL reports')
+    parser.add_argument('--months', nargs='*', default=None)
+    parser.add_argument('--pnl-format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    parser.add_argument('--window', type=int, default=BARS_PER_DAY, help='rolling Sharpe / Sortino window in bars')
+    parser.add_argument('--output', default='risk_metrics.json')
+    parser.add_argument('--daily-output', default=None, help='optional CSV of the per-day statistics')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    equity, timestamps, dates = equity_curve(load_month_reports(args.pnl_dir, args.months, args.pnl_format))
+    summary = risk_summary(equity, dates, timestamps, args.window)
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=4)
+    if args.daily_output:
+        daily_stats(equity, dates).to_csv(args.daily_output, index=False)
+    logging.info(f"Risk metrics over {summary['bars']} bars / {summary['days']} days written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import single_month_backtest_copy2 as backtest
+from consolidate import consolidate
+from cost_model import COST_MODELS, NO_COSTS, load_cost_model
+from dataset_catalog import MONTH_FORMAT, DatasetCatalog
+from instrumentation import INSTRUMENTS
+from pnl_recorder import read_pnl_report
+from result_cache import DEFAULT_MAX_BYTES, ResultCache
+from risk_metrics import equity_curve, risk_summary
+from strategy_config import DEFAULT_CONFIG, StrategyConfig
+from underlyings import UNDERLYINGS, config_for
+
+
+def resolve_months(catalog, requested=None, underlying='NIFTY'):
+    # {month: expiry} to run: the requested months (default: every month in the catalog), with
+    # bare months taking the catalog's monthly expiry of the underlying
+    months = {}
+    for month_name, expiry_date in (requested or dict.fromkeys(catalog.months())).items():
+        expiry_date = expiry_date or catalog.monthly_expiry(month_name, underlying)
+        if expiry_date is None:
+            logging.error(f"No {underlying} expiry listed in the dataset catalog for month: {month_name}")
+            continue
+        months[month_name] = expiry_date
+    return months
+
+
+def underlying_dir(base_dir, underlying):
+    # NIFTY outputs stay where they always were, other underlyings get a sub-folder
+    return Path(base_dir) if underlying == 'NIFTY' else Path(base_dir) / underlying
+
+
+def run_month(month_name, runs, catalog, engine, pnl_format, resume, log_dir, cache_dir=None, instrument=False, result_cache_dir=None, result_cache_mb=None, greeks=False,
+              prefetch=backtest.PREFETCH_DEPTH, prefetch_mb=backtest.PREFETCH_MEMORY_MB):
+    # Runs in a worker process: one log file per month, all state local to this call. runs is
+    # {underlying: (expiry, output_dir, config)}; every underlying trades off one parse of each day file
+    log_path = Path(log_dir) / f"{month_name}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    backtest.setup_logging(log_path, console_level=None)
+    if instrument:
+        INSTRUMENTS.reset()
+        INSTRUMENTS.enable()
+
+    started = time.perf_counter()
+    result_cache = None
+    if result_cache_dir is not None:
+        result_cache = ResultCache(result_cache_dir, int(result_cache_mb * 1024 * 1024) if result_cache_mb else DEFAULT_MAX_BYTES)
+
+    books = backtest.process_month_underlyings(catalog.index_dir, catalog.option_dir, month_name, runs, engine=engine, pnl_format=pnl_format, resume=resume, cache_dir=cache_dir,
+                                               result_cache=result_cache, catalog=catalog, greeks=greeks, prefetch=prefetch, prefetch_mb=prefetch_mb)
+    if result_cache is not None:
+        logging.info(f"Result cache for {month_name}: {result_cache.hits} hits, {result_cache.misses} misses")
+    if INSTRUMENTS.enabled:
+        INSTRUMENTS.log_summary(f"{month_name} ")
+        INSTRUMENTS.dump(Path(log_dir) / f"{month_name}.instruments.json")
+    return {
+        'month': month_name,
+        'expiry': {underlying: expiry_date for underlying, (expiry_date, _, _) in runs.items()},
+        'positions': {underlying: len(books.get(underlying) or []) for underlying in runs},
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+def merge_outputs(months, output_dir, pnl_format, combined_dir, qty=25, cost_model=NO_COSTS):
+    # Stitch the per-month outputs into the combined trade table / monthly gross and net PnL /
+    # metrics (consolidate.py) and the minute PnL file
+    output_dir = Path(output_dir)
+    combined_dir = Path(combined_dir)
+    consolidate(output_dir, combined_dir, months, workers=1, qty=qty, cost_model=cost_model)
+    pnl = []
+    # Calendar order, so the minute PnL files chain into one equity curve
+    for month_name in sorted(months, key=lambda name: datetime.strptime(name, MONTH_FORMAT)):
+        pnl_file = output_dir / f"{month_name}.{pnl_format}"
+        if pnl_file.exists():
+            pnl.append(read_pnl_report(pnl_file).assign(Month=month_name))
+
+    if pnl:
+        pd.concat(pnl, ignore_index=True).to_csv(combined_dir / 'combined_minute_pnl.csv', index=False)
+        # Bar-level drawdown / risk over the minute equity curve of all months
+        equity, timestamps, dates = equity_curve(pnl)
+        with open(combined_dir / 'risk_metrics.json', 'w') as f:
+            json.dump(risk_summary(equity, dates, timestamps), f, indent=4)
+
+
+def parse_months(values):
+    # MAR_2024=28MAR24 pins the expiry, a bare MAR_2024 takes the monthly expiry from the catalog
+    months = {}
+    for value in values:
+        month_name, _, expiry_date = value.partition('=')
+        months[month_name.upper()] = expiry_date.upper() or None
+    return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the iron fly backtest for several months in parallel.')
+    parser.add_argument('months', nargs='*', help='MONTH_YYYY[=DDMONYY] entries, e.g. MAR_2024=28MAR24 (default: every month in the data, at its monthly expiry)')
+    parser.add_argument('--index-dir', default=backtest.index_dir)
+    parser.add_argument('--option-dir', default=backtest.option_dir)
+    parser.add_argument('--output-dir', default=backtest.output_dir)
+    parser.add_argument('--combined-dir', default=None, help='where the merged outputs go (default: parent of --output-dir)')
+    parser.add_argument('--log-dir', default='logs')
+    parser.add_argument('--catalog', default='dataset_catalog.json', help='dataset catalog (see dataset_catalog.py); built on first use, refreshed for new or changed day files')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--engine', choices=['loop', 'vectorized'], default='vectorized')
+    parser.add_argument('--pnl-format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    parser.add_argument('--resume', action='store_true', help='continue interrupted months from their last checkpoint')
+    parser.add_argument('--cache-dir', default=None, help='columnar day-file cache (see day_cache.py); built on first use')
+    parser.add_argument('--result-cache-dir', default=None, help='per-day result cache (see result_cache.py): days whose file, incoming positions and config are unchanged are replayed')
+    parser.add_argument('--result-cache-mb', type=float, default=None, help='size bound of the result cache; least recently used entries are evicted')
+    parser.add_argument('--costs', default='nse', help=f"cost model for the net PnL: {', '.join(COST_MODELS)} or a JSON file of CostModel fields (see cost_model.py)")
+    parser.add_argument('--prefetch', type=int, default=backtest.PREFETCH_DEPTH, help='day files read ahead on a background thread while the current one is simulated (0: off)')
+    parser.add_argument('--prefetch-mb', type=float, default=backtest.PREFETCH_MEMORY_MB, help='memory the read-ahead day files may take before the thread waits')
+    parser.add_argument('--greeks', action='store_true', help="write each month's per-bar portfolio Greeks and leg IVs (see option_greeks.py) next to its PnL report")
+    parser.add_argument('--instrument', action='store_true', help='collect hot-path counters, timers and recent events into <log-dir>/<month>.instruments.json')
+    parser.add_argument('--config', default=None, help='JSON file of StrategyConfig fields, e.g. a row picked from a parameter sweep')
+    parser.add_argument('--underlyings', nargs='+', choices=sorted(UNDERLYINGS), default=None,
+                        help="underlyings to trade off the same day files (default: the config's); each but NIFTY writes to a sub-folder of the output dirs")
+    args = parser.parse_args()
+
+    cost_model = load_cost_model(args.costs)
+    config = DEFAULT_CONFIG
+    if args.config:
+        with open(args.config) as f:
+            config = StrategyConfig.from_dict(json.load(f))
+    # The config applies to its own underlying; others take their lot size and wing width from underlyings.py
+    configs = {underlying: config_for(underlying, config) for underlying in (args.underlyings or [config.underlying])}
+    combined_dir = args.combined_dir or Path(args.output_dir).parent
+
+    Path(args.log_dir).mkdir(parents=True, exist_ok=True)
+    backtest.setup_logging(Path(args.log_dir) / 'run_backtest.log', console_level='INFO')
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    catalog = DatasetCatalog.open(args.index_dir, args.option_dir, args.catalog, workers=args.workers)
+    requested = parse_months(args.months)
+    # A pinned expiry is for the config's underlying; the others take their own monthly expiry
+    months = {}
+    for underlying, underlying_config in configs.items():
+        pins = requested if underlying == config.underlying else dict.fromkeys(requested)
+        for month_name, expiry_date in resolve_months(catalog, pins, underlying).items():
+            months.setdefault(month_name, {})[underlying] = (expiry_date, str(underlying_dir(args.output_dir, underlying)), underlying_config)
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(run_month, month_name, runs, catalog.subset([month_name]), args.engine, args.pnl_format, args.resume, args.log_dir, args.cache_dir,
+                        args.instrument, args.result_cache_dir, args.result_cache_mb, args.greeks, args.prefetch, args.prefetch_mb): month_name
+            for month_name, runs in months.items()
+        }
+        for future in as_completed(futures):
+            month_name = futures[future]
+            try:
+                result = future.result()
+                results.append(result)
+                logging.info(f"Finished {month_name} (expiry {result['expiry']}): {result['positions']} positions in {result['seconds']}s")
+            except Exception as e:
+                logging.error(f"Backtest worker failed for month: {month_name} - {e}")
+
+    for underlying, underlying_config in configs.items():
+        underlying_months = [month_name for month_name, runs in months.items() if underlying in runs]
+        if underlying_months:
+            merge_outputs(underlying_months, underlying_dir(args.output_dir, underlying), args.pnl_format, underlying_dir(combined_dir, underlying), underlying_config.qty, cost_model)
+    logging.info(f"Ran {len(results)} months in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
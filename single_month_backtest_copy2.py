@@ -1,35 +1,52 @@
 import pandas as pd
-import os
+import numpy as np
 from pathlib import Path
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 import coloredlogs
-import csv
+import collections
 import threading
 import time
 
+from day_cache import cached_day
+from instrumentation import INSTRUMENTS
+from option_chain import LegGrid, OptionChainIndex, frame_seconds, option_ticker
+from option_greeks import EXPIRY_SECONDS, GreeksRecorder, greeks_path, spot_at
+from pnl_recorder import PnlRecorder
+from position_book import PositionBook
+from position_journal import PositionJournal, load_positions
+from strategy_config import DEFAULT_CONFIG, StrategyConfig
+from underlyings import UNDERLYINGS
+
 # Set up logging
 log_file_path = 'strategy_logs_sept.log'
 
-# Configure basic logging to file
+# Rows parsed per chunk when a day file is streamed for a few tickers (load_day_rows)
+CHUNK_ROWS = 10000
 
-# Configure basic logging to file
-logging.basicConfig(level=logging.DEBUG, filename=log_file_path, filemode='a',
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+# Day files read ahead of the engine, and the memory their queued frames may take (PrefetchingDayLoader)
+PREFETCH_DEPTH = 2
+PREFETCH_MEMORY_MB = 256
 
+# Expiring positions settle at the 15:30 close
+SETTLEMENT_TIME = f"{EXPIRY_SECONDS // 3600:02d}:{EXPIRY_SECONDS % 3600 // 60:02d}:00"
 
-# Set up colored logs for console output
-coloredlogs.install(level='DEBUG',
-                    fmt='%(asctime)s - %(levelname)s - %(message)s',
-                    level_styles={
-                        'info': {'color': 'green'},
-                        'debug': {'color': 'white'},
-                        'error': {'color': 'red'},
-                    })
 
-# Initialize the global position dictionary
-position_dict = {}
+def setup_logging(log_file_path=log_file_path, console_level='DEBUG'):
+    # Configure basic logging to file
+    logging.basicConfig(level=logging.DEBUG, filename=log_file_path, filemode='a',
+                        format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    # Set up colored logs for console output
+    if console_level:
+        coloredlogs.install(level=console_level,
+                            fmt='%(asctime)s - %(levelname)s - %(message)s',
+                            level_styles={
+                                'info': {'color': 'green'},
+                                'debug': {'color': 'white'},
+                                'error': {'color': 'red'},
+                            })
 
 
 def round_to_nearest_50(x):
@@ -42,11 +59,19 @@ def round_to_nearest_50(x):
         logging.error(f"Error rounding value {x} to nearest 50 - {e}")
         return None
 
-def load_and_preprocess(file_path, time_filter=None):
+def round_to_step(x, step):
+    # ATM strike for an underlying's strike spacing (50 for NIFTY, 100 for BANKNIFTY)
+    return round(x / step) * step
+
+
+def load_and_preprocess(file_path, time_filter=None, cache_dir=None, underlyings=('NIFTY',)):
     try:
         # logging.debug(f"Loading file: {file_path}")
+        if cache_dir is not None:
+            # Pre-filtered columnar copy of the day file, converted on first use
+            return cached_day(file_path, cache_dir, time_filter, underlyings)
         df = pd.read_csv(file_path)
-        df['Time'] = pd.to_datetime(df['Time']).dt.time
+        df['Time'] = pd.to_datetime(df['Time'], format='%H:%M:%S').dt.time
         # logging.debug(f"File loaded successfully. Applying time filter: {time_filter}")
         if time_filter:
             df = df[df['Time'] >= datetime.strptime(time_filter, '%H:%M:%S').time()]
@@ -56,13 +81,45 @@ def load_and_preprocess(file_path, time_filter=None):
         logging.error(f"Error loading and preprocessing file: {file_path} - {e}")
         return pd.DataFrame()
 
-def find_strike_prices(atm):
+def load_day_rows(file_path, tickers, time_filter=None, cache_dir=None, underlyings=('NIFTY',), chunk_rows=CHUNK_ROWS):
+    # load_and_preprocess for just the rows of these exact tickers: the file is parsed chunk_rows
+    # rows at a time and each chunk is cut down to the tickers before the next one is read, so
+    # only the rows in play are ever held, not the whole day file
+    try:
+        if cache_dir is not None:
+            return cached_day(file_path, cache_dir, time_filter, underlyings, tickers)
+        tickers = set(tickers)
+        kept = []
+        for chunk in pd.read_csv(file_path, usecols=['Ticker', 'Date', 'Time', 'Close'], chunksize=chunk_rows):
+            chunk = chunk[chunk['Ticker'].isin(tickers)]
+            if not chunk.empty:
+                kept.append(chunk)
+        df = pd.concat(kept) if kept else pd.DataFrame(columns=['Ticker', 'Date', 'Time', 'Close'])
+        df['Time'] = pd.to_datetime(df['Time'], format='%H:%M:%S').dt.time
+        if time_filter:
+            df = df[df['Time'] >= datetime.strptime(time_filter, '%H:%M:%S').time()]
+        return df
+    except Exception as e:
+        logging.error(f"Error loading rows of {len(tickers)} tickers from file: {file_path} - {e}")
+        return pd.DataFrame()
+
+def fly_tickers(strikes, expiry_date, underlying='NIFTY'):
+    # Exact tickers of the fly's four legs (NIFTY28MAR2422000CE.NFO, ...)
+    legs = [(strikes['ce_sell'], 'CE'), (strikes['pe_sell'], 'PE'), (strikes['ce_buy'], 'CE'), (strikes['pe_buy'], 'PE')]
+    return sorted({option_ticker(underlying, expiry_date, strike, option_type) for strike, option_type in legs})
+
+def leg_rows(option_df, tickers, exit_time):
+    # The day's rows of these tickers up to the exit time. Tickers are matched exactly, so other
+    # expiries and underlyings whose tickers contain the same strike digits stay out.
+    return option_df[option_df['Ticker'].isin(tickers) & (option_df['Time'] <= pd.to_datetime(exit_time).time())]
+
+def find_strike_prices(atm, wing_width=700):
     try:
         # logging.debug(f"Calculating strike prices for ATM: {atm}")
         ce_sell_strike = atm
         pe_sell_strike = atm
-        ce_buy_strike = atm + 700  # Not rounding these values
-        pe_buy_strike = atm - 700  # Not rounding these values
+        ce_buy_strike = atm + wing_width  # Not rounding these values
+        pe_buy_strike = atm - wing_width  # Not rounding these values
         # logging.debug(f"Calculated strike prices - CE Sell: {ce_sell_strike}, PE Sell: {pe_sell_strike}, CE Buy: {ce_buy_strike}, PE Buy: {pe_buy_strike}")
         return ce_sell_strike, pe_sell_strike, ce_buy_strike, pe_buy_strike
     except Exception as e:
@@ -70,21 +127,28 @@ def find_strike_prices(atm):
         return None, None, None, None
 
 
-def extract_option_prices(option_df, ce_sell_strike, pe_sell_strike, ce_buy_strike, pe_buy_strike, expiry_date, time):
+def extract_option_prices(option_chain, ce_sell_strike, pe_sell_strike, ce_buy_strike, pe_buy_strike, expiry_date, time, forward_minutes=0):
     try:
-        # logging.debug(f"Extracting option prices for strikes - CE Sell: {ce_sell_strike}, PE Sell: {pe_sell_strike}, CE Buy: {ce_buy_strike}, PE Buy: {pe_buy_strike} at time: {time}")
-
-        # Filter option_df by time and ticker
-        option_prices = {
-            'ce_sell': option_df[(option_df['Ticker'].str.contains(f'NIFTY{expiry_date}{ce_sell_strike}CE.NFO')) & (option_df['Time'] == time)]['Close'].values[0],
-            'pe_sell': option_df[(option_df['Ticker'].str.contains(f'NIFTY{expiry_date}{pe_sell_strike}PE.NFO')) & (option_df['Time'] == time)]['Close'].values[0],
-            'ce_buy': option_df[(option_df['Ticker'].str.contains(f'NIFTY{expiry_date}{ce_buy_strike}CE.NFO')) & (option_df['Time'] == time)]['Close'].values[0],
-            'pe_buy': option_df[(option_df['Ticker'].str.contains(f'NIFTY{expiry_date}{pe_buy_strike}PE.NFO')) & (option_df['Time'] == time)]['Close'].values[0]
-        }
-        
-        # logging.debug(f"Extracted option prices: {option_prices}")
+        # Look up each leg in the day's option chain index at the exact time
+        seconds = time.hour * 3600 + time.minute * 60 + time.second
+        legs = {'ce_sell': (ce_sell_strike, 'CE'), 'pe_sell': (pe_sell_strike, 'PE'), 'ce_buy': (ce_buy_strike, 'CE'), 'pe_buy': (pe_buy_strike, 'PE')}
+        option_prices = {name: option_chain.lookup(expiry_date, strike, option_type, seconds) for name, (strike, option_type) in legs.items()}
+
+        # A leg without a bar at the entry time (sparse deep OTM wings) takes its first bar
+        # within the forward-fill limit, like every later mark does
+        filled = [name for name, price in option_prices.items() if price is None]
+        if filled and forward_minutes > 0:
+            for name in filled:
+                option_prices[name] = option_chain.lookup(expiry_date, *legs[name], seconds, forward_minutes)
+            INSTRUMENTS.count('entry_price_fills', sum(option_prices[name] is not None for name in filled))
+            logging.warning(f"No bar at entry time {time} for {filled}; filled from the next {forward_minutes} minutes: {', '.join(f'{name}={option_prices[name]}' for name in filled)}")
+        if any(price is None for price in option_prices.values()):
+            raise IndexError
+
+        INSTRUMENTS.event('entry_prices', "Extracted option prices at %s: %s", time, option_prices)
         return option_prices
     except IndexError:
+        INSTRUMENTS.count('entry_price_misses')
         logging.error(f"No matching data found for the provided strikes and time - CE Sell: {ce_sell_strike}, PE Sell: {pe_sell_strike}, CE Buy: {ce_buy_strike}, PE Buy: {pe_buy_strike} at time: {time}")
         return {}
     except Exception as e:
@@ -111,58 +175,33 @@ def create_position_dict(date, time, strike, price, option_type, qty=25):
         return {}
 
 
-def get_current_price(option_df, strike, option_type, expiry_date, time, option_file):
+def get_current_price(option_chain, strike, option_type, expiry_date, time, option_file, forward_minutes=5):
     try:
-        pattern = f'NIFTY{expiry_date}{strike}{option_type}.NFO'
-        # logging.debug(f"Fetching current price for pattern: {pattern} at time: {time}")
-
-        # Initialize the time to search
-        search_time = time
-
-        # Loop to check up to 5 minutes ahead
-        for i in range(6):  # 0 to 5 (total 6 iterations)
-            filtered_df = option_df[(option_df['Ticker'].str.contains(pattern)) & (option_df['Time'] == search_time)]
-            
-            if not filtered_df.empty:
-                current_price = filtered_df['Close'].values[0]
-                # logging.debug(f"Current price for pattern {pattern} at time {search_time}: {current_price}")
-                return current_price
-            
-            # logging.debug(f"No matching data found for pattern: {pattern} at time: {search_time}. Checking the next minute.")
-
-            # Increment time by one minute, keeping the seconds at 59
-            new_time = datetime.combine(datetime.today(), search_time) + timedelta(minutes=1)
-            search_time = new_time.time().replace(second=59)
-
-        logging.error(f"No matching data found for pattern: {pattern} within 5 minutes of time: {time} in option file: {option_file}. Skipping price update.")
+        pattern = f'{option_chain.underlying}{expiry_date}{strike}{option_type}.NFO'
+        INSTRUMENTS.count('price_lookups')
+
+        # First bar at this time or within the next 5 minutes, found by binary search in the chain index
+        seconds = time.hour * 3600 + time.minute * 60 + time.second
+        current_price = option_chain.lookup(expiry_date, strike, option_type, seconds, forward_minutes)
+        if current_price is not None:
+            INSTRUMENTS.event('price_lookup', "Current price for %s at %s: %s", pattern, time, current_price)
+            return current_price
+
+        INSTRUMENTS.count('forward_fill_misses')
+        logging.error(f"No matching data found for pattern: {pattern} within {forward_minutes} minutes of time: {time} in option file: {option_file}. Skipping price update.")
         return None
     except Exception as e:
         logging.error(f"Error fetching current price for pattern: {pattern} at time: {time} in option file: {option_file} - {e}")
         return None
 
-def save_position_to_file(position_dict, month_name, position_file):
-    try:
-        # logging.debug(f"Saving position to file: {position_file}")
-
-        # Load existing data if the file exists
-        if Path(position_file).exists():
-            with open(position_file, 'r') as f:
-                data = json.load(f)
-        else:
-            data = {}
-
-        # Add each position with a unique key
-        for key, new_pos in position_dict.items():
-            unique_key = f"{key}"
-            data.setdefault(month_name, {})[unique_key] = new_pos
-
-        # Save the updated data back to the JSON file
-        with open(position_file, 'w') as f:
-            json.dump(data, f, indent=4)
-
-        # logging.info(f"Saved position to file: {position_file} for month: {month_name}")
-    except Exception as e:
-        logging.error(f"Error saving position to file: {position_file} for month: {month_name} - {e}")
+def day_index_files(index_dir, option_dir, month_name, catalog=None):
+    # {option file name: index file} for the month's days, matched on the date that ends both file names
+    if catalog is not None:
+        return {Path(entry['option_file']).name: Path(entry['index_file'])
+                for _, entry in catalog.month_days(month_name) if entry['option_file'] and entry['index_file']}
+    index_files = {index_file.stem.split('_')[-1]: index_file for index_file in (Path(index_dir) / month_name).glob('*.csv')}
+    return {option_file.name: index_files[option_file.stem.split('_')[-1]]
+            for option_file in find_all_matching_option_files(option_dir, month_name) if option_file.stem.split('_')[-1] in index_files}
 
 def find_all_matching_option_files(option_dir, month):
     try:
@@ -189,173 +228,296 @@ def find_all_matching_option_files(option_dir, month):
 
 
 
-def monitor_positions(option_df, option_file, ce_buy_strike, pe_buy_strike, ce_sell_strike, pe_sell_strike, expiry_date, month_name, position_file, output_dir):
-    global position_dict
-    try:
-        # logging.debug(f"Monitoring positions from 09:20:59 to 15:30:59 for option file: {option_file}.")
-        pos_id = len(position_dict)  # Start pos_id based on the existing position length
-
-        # Filter option_df to only include rows with strikes in position_dict
-        relevant_strikes = {str(pos['strike']) for pos in position_dict.values()}  # Convert strikes to strings
-        option_df_filtered = option_df[(option_df['Ticker'].str.contains('|'.join(relevant_strikes))) & (option_df['Time'] <= pd.to_datetime('15:29:59').time())]
-
+def log_gap_stats(leg_grid, seconds, expiry_date, option_file, config=DEFAULT_CONFIG):
+    # Per-day gap report of the processed bars: fills are counted, legs left without a price are logged
+    stats = leg_grid.gap_stats(seconds)
+    INSTRUMENTS.event('gap_stats', "Gap stats for %s: %s", option_file, stats)
+    for leg, leg_stats in stats.items():
+        INSTRUMENTS.count('stale_quotes', leg_stats['filled'])
+        if leg_stats['missing']:
+            INSTRUMENTS.count('forward_fill_misses', leg_stats['missing'])
+            logging.error(f"No matching data found for pattern: {config.underlying}{expiry_date}{leg}.NFO within {config.forward_fill_minutes} minutes at {leg_stats['missing']} processed times in option file: {option_file}. Skipping those price updates.")
+    return stats
+
+
+def close_at_mark(position_book, position_journal, row, date, time_str):
+    # Close a position at its current mark, moving it into the realized ledger
+    price = None if np.isnan(position_book.current[row]) else float(position_book.current[row])
+    position_book.close(row, price, date, time_str)
+    position_journal.close_position(position_book.keys[row], date, time_str, price, position_book)
+    INSTRUMENTS.count('positions_closed')
+
+
+def square_off(position_book, position_journal, option_type, date, time_str):
+    # Close the stopped CE / PE sell and its hedge before the re-hedge opens the next pair
+    for row in (position_book.latest_sell(option_type), position_book.latest_buy(option_type)):
+        if row is not None and not position_book.closed[row]:
+            close_at_mark(position_book, position_journal, row, date, time_str)
+
+
+class IronFlyCore:
+    # The iron fly's per-bar logic as an event-driven state machine, shared by the loop engine
+    # (monitor_positions) and the replay / live feeds in live_trading.py. A bar is one minute:
+    # its date, time and a quote per leg (CE sell, PE sell, CE buy, PE buy; None when the leg
+    # has no price). on_bar marks the positions, applies the stop-loss / re-hedge rules, records
+    # the minute's PnL and returns what it decided:
+    #   'hold'            - no stop-loss; PnL recorded
+    #   'hedge_ce' / '_pe' - stop-loss hit, a new sell and its hedge were opened (after squaring
+    #                        off the stopped pair when config.square_off_on_stop is set)
+    #   'stop_ce' / '_pe'  - stop-loss hit but the buy leg had no price, nothing opened
+    # Each new date starts a new day; bars outside the entry / exit window or not later than
+    # the last processed bar of the day are ignored (see is_new_bar).
+
+    def __init__(self, position_book, strikes, position_journal, pnl_recorder, config=DEFAULT_CONFIG):
+        self.position_book = position_book
+        self.strikes = strikes
+        self.position_journal = position_journal
+        self.pnl_recorder = pnl_recorder
+        self.config = config
+        # Legs in the order positions are matched against them: CE sell, PE sell, CE buy, PE buy
+        self.legs = [(strikes['ce_sell'], 'CE'), (strikes['pe_sell'], 'PE'), (strikes['ce_buy'], 'CE'), (strikes['pe_buy'], 'PE')]
+        self.entry_time = datetime.strptime(config.entry_time, '%H:%M:%S').time()
+        self.exit_time = datetime.strptime(config.exit_time, '%H:%M:%S').time()
+        self.start_day(None)
+
+    def start_day(self, date):
+        self.date = date
         # Track the last processed time to prevent reprocessing
-        last_processed_time = None
-
-        # Iterate directly over the filtered dataframe
-        for _, row in option_df_filtered.iterrows():
-            time = row['Time']
-
-            # Skip the row if it has already been processed
-            if last_processed_time is not None and time <= last_processed_time:
-                # logging.debug(f"Skipping already processed time: {time.strftime('%H:%M:%S')}")
+        self.last_processed_time = None
+        self.pos_id = len(self.position_book)  # Start pos_id based on the existing position length
+        self.position_book.assign_legs(self.legs)
+
+    def is_new_bar(self, date, time):
+        if date != self.date:
+            self.start_day(date)
+        if time < self.entry_time or time > self.exit_time:
+            return False
+        # Skip the row if it has already been processed
+        if self.last_processed_time is not None and time <= self.last_processed_time:
+            INSTRUMENTS.count('rows_skipped')
+            return False
+        return True
+
+    def open_hedged(self, date, time, sell_strike, sell_price, buy_strike, buy_price, option_type):
+        prefix = option_type.lower()
+        new_position = create_position_dict(date, time, sell_strike, float(sell_price), option_type, self.config.qty)
+        self.position_book.add(f'{prefix}_sell_pos_{self.pos_id}', new_position)
+        self.position_journal.open_position(f'{prefix}_sell_pos_{self.pos_id}', new_position)
+        self.pos_id += 1
+
+        # Create the hedge position on the buy leg
+        hedge = create_position_dict(date, time, buy_strike, buy_price, option_type, self.config.qty)
+        self.position_book.add(f'{prefix}_buy_pos_{self.pos_id}', hedge)
+        self.position_journal.open_position(f'{prefix}_buy_pos_{self.pos_id}', hedge, self.position_book)
+        self.pos_id += 1
+        INSTRUMENTS.count('hedges_opened')
+
+    def on_bar(self, date, time, quotes):
+        # quotes: one price per leg in self.legs order, None for a leg without a price
+        position_book = self.position_book
+        self.last_processed_time = time
+        time_str = time.strftime('%H:%M:%S')
+        INSTRUMENTS.count('bars')
+
+        # Update current price of every position on each leg
+        current_price_ce_sell, current_price_pe_sell, current_price_ce_buy, current_price_pe_buy = quotes
+        position_book.mark([np.nan if price is None else price for price in quotes])
+
+        # Journal only the leg prices that changed this minute instead of rewriting every position
+        self.position_journal.mark(date, time_str, dict(zip(self.legs, quotes)), position_book)
+
+        # Latest CE Sell and PE Sell positions, tracked by the book as positions are added
+        ce_sell_row = position_book.latest_sell('CE')
+        pe_sell_row = position_book.latest_sell('PE')
+        ce_sell_price = position_book.current[ce_sell_row]
+        pe_sell_price = position_book.current[pe_sell_row]
+
+        # Check for stop-loss on CE Sell (a missing price is NaN and never compares true)
+        if ce_sell_price and ce_sell_price <= position_book.entry[ce_sell_row] * self.config.stop_loss_factor:
+            INSTRUMENTS.count('stop_loss_ce')
+            INSTRUMENTS.event('stop_loss', "CE sell hit stop-loss at %s %s: %s vs entry %s", date, time_str, ce_sell_price, position_book.entry[ce_sell_row])
+            if current_price_ce_buy is None:
+                INSTRUMENTS.count('stop_loss_unhedged')
+                return 'stop_ce'
+            if self.config.square_off_on_stop:
+                square_off(position_book, self.position_journal, 'CE', date, time_str)
+            self.open_hedged(date, time, self.strikes['ce_sell'], ce_sell_price, self.strikes['ce_buy'], current_price_ce_buy, 'CE')
+            return 'hedge_ce'  # No PnL row for this minute; positions are re-evaluated on the next bar
+
+        # Check for stop-loss on PE Sell
+        if pe_sell_price and pe_sell_price < position_book.entry[pe_sell_row] * self.config.stop_loss_factor:
+            INSTRUMENTS.count('stop_loss_pe')
+            INSTRUMENTS.event('stop_loss', "PE sell hit stop-loss at %s %s: %s vs entry %s", date, time_str, pe_sell_price, position_book.entry[pe_sell_row])
+            if current_price_pe_buy is None:
+                INSTRUMENTS.count('stop_loss_unhedged')
+                return 'stop_pe'
+            if self.config.square_off_on_stop:
+                square_off(position_book, self.position_journal, 'PE', date, time_str)
+            self.open_hedged(date, time, self.strikes['pe_sell'], pe_sell_price, self.strikes['pe_buy'], current_price_pe_buy, 'PE')
+            return 'hedge_pe'
+
+        # Calculate PnL and update output
+        try:
+            # Sell: (entry_price - current_price) * qty, buy: (current_price - entry_price) * qty,
+            # summed over every position with a price
+            total_pnl = position_book.total_pnl()
+
+            # Buffered in memory; the recorder writes the report in bulk at day / month end
+            self.pnl_recorder.record(date, time_str, total_pnl)
+        except Exception as e:
+            logging.error(f"Error calculating PnL for {date} {time_str} - {e}")
+        return 'hold'
+
+
+def monitor_positions(position_book, option_df, option_file, ce_buy_strike, pe_buy_strike, ce_sell_strike, pe_sell_strike, expiry_date, month_name, position_journal, pnl_recorder, config=DEFAULT_CONFIG, option_chain=None):
+    try:
+        INSTRUMENTS.event('monitor_day', "Monitoring %s positions in option file: %s", len(position_book), option_file)
+
+        # Filter option_df to only include rows of the fly's legs
+        strikes = {'ce_sell': ce_sell_strike, 'pe_sell': pe_sell_strike, 'ce_buy': ce_buy_strike, 'pe_buy': pe_buy_strike}
+        option_df_filtered = leg_rows(option_df, fly_tickers(strikes, expiry_date, config.underlying), config.exit_time)
+
+        # Index the day's chain once; all price lookups below go through it
+        # (a sweep passes in one index shared by every config)
+        if option_chain is None:
+            option_chain = OptionChainIndex(option_df_filtered, config.underlying)
+
+        core = IronFlyCore(position_book, strikes, position_journal, pnl_recorder, config)
+        if option_df_filtered.empty:
+            return
+
+        # The legs' prices for every minute of the day, filled once up front
+        seconds = frame_seconds(option_df_filtered)
+        leg_grid = LegGrid(option_chain, expiry_date, core.legs, seconds.min(), seconds.max(), config.forward_fill_minutes)
+
+        # Iterate directly over the filtered dataframe, one bar per new minute
+        processed = []
+        for row_seconds, row in zip(seconds, option_df_filtered.itertuples(index=False)):
+            time = row.Time
+            if not core.is_new_bar(row.Date, time):
                 continue
+            processed.append(row_seconds)
+            quotes = leg_grid.quotes(row_seconds)
+            INSTRUMENTS.count('price_lookups', len(quotes))
+            core.on_bar(row.Date, time, quotes)
+        log_gap_stats(leg_grid, processed, expiry_date, option_file, config)
 
-            time_str = time.strftime('%H:%M:%S')
-            # logging.debug(f"Processing time: {time_str}")
-
-            # Update last processed time
-            last_processed_time = time
-
-          
-             # Update current price for matching positions
-            for key, pos in position_dict.items():
-                        if pos['strike'] == ce_sell_strike and pos['option_type'] == 'CE':
-                            current_price_ce_sell = get_current_price(option_df_filtered, ce_sell_strike, 'CE', expiry_date, time, option_file)
-                            if current_price_ce_sell is not None:   
-                                position_dict[key]['current_price'] = current_price_ce_sell
-                            # logging.debug(f"Updated current price for {key} (Type: {pos['option_type']}): {current_price_ce_sell}")
-                        elif pos['strike'] == pe_sell_strike and pos['option_type'] == 'PE':
-                            current_price_pe_sell = get_current_price(option_df_filtered, pe_sell_strike, 'PE', expiry_date, time, option_file)
-                            if current_price_pe_sell is not None: 
-                                position_dict[key]['current_price'] = current_price_pe_sell
-                            # logging.debug(f"Updated current price for {key} (Type: {pos['option_type']}): {current_price_pe_sell}")
-                        elif pos['strike'] == ce_buy_strike and pos['option_type'] == 'CE':
-                            current_price_ce_buy = get_current_price(option_df_filtered, ce_buy_strike, 'CE', expiry_date, time, option_file)
-                            if current_price_ce_buy is not None: 
-                                position_dict[key]['current_price'] = current_price_ce_buy
-                            # logging.debug(f"Updated current price for {key} (Type: {pos['option_type']}): {current_price_ce_buy}")
-                        elif pos['strike'] == pe_buy_strike and pos['option_type'] == 'PE':
-                            current_price_pe_buy = get_current_price(option_df_filtered, pe_buy_strike, 'PE', expiry_date, time, option_file)
-                            if current_price_pe_buy is not None: 
-                                position_dict[key]['current_price'] = current_price_pe_buy
-                            # logging.debug(f"Updated current price for {key} (Type: {pos['option_type']}): {current_price_pe_buy}")
-                        else:
-                            # logging.debug(f"No matching position to update their current price.")
-                            pass
-            
-
-
-         
-            # Save the final state of position_dict to the JSON file after processing
-            with open(position_file, 'w') as f:
-                json.dump(position_dict, f, indent=4)
-
-            # Re-calculate the highest CE Sell and PE Sell positions after every update
-            highest_ce_sell_key = max([k for k in position_dict if k.startswith('ce_sell_pos_')], key=lambda k: int(k.split('_')[-1]))
-            highest_pe_sell_key = max([k for k in position_dict if k.startswith('pe_sell_pos_')], key=lambda k: int(k.split('_')[-1]))
-
-            # logging.debug(f"Highest CE Sell Key: {highest_ce_sell_key}, Highest PE Sell Key: {highest_pe_sell_key}")
-
-            # Check for stop-loss on CE Sell
-            if  position_dict[highest_ce_sell_key]['current_price'] and position_dict[highest_ce_sell_key]['current_price'] <= position_dict[highest_ce_sell_key]['entry_price'] * 0.9:
-                # logging.debug("CE Sell strike hit stop-loss, creating a new hedge position.")
-                if position_dict[highest_ce_sell_key]['current_price'] is not None and current_price_ce_buy is not None :
-                    new_position = create_position_dict(row['Date'], time, ce_sell_strike, position_dict[highest_ce_sell_key]['current_price'], 'CE')
-                    position_dict[f'ce_sell_pos_{pos_id}'] = new_position
-            
-                    pos_id += 1
-
-                    # Create hedge position for CE Buy
-                    hedge_ce_buy = create_position_dict(row['Date'], time, ce_buy_strike, current_price_ce_buy, 'CE')
-                    position_dict[f'ce_buy_pos_{pos_id}'] = hedge_ce_buy
-                 
-                    pos_id += 1
-
-
-
-                
-
-                    # logging.info(f"Updated position with hedge for CE Sell at time {time_str}")
-                    save_position_to_file(position_dict, month_name, position_file)
-
-                continue  # Continue the loop to re-evaluate positions
-
-            # Check for stop-loss on PE Sell
-            if position_dict[highest_pe_sell_key]['current_price'] and position_dict[highest_pe_sell_key]['current_price'] < position_dict[highest_pe_sell_key]['entry_price'] * 0.9:
-                # logging.debug("PE Sell strike hit stop-loss, creating a new hedge position.")
-                if position_dict[highest_pe_sell_key]['current_price'] is not None and current_price_pe_buy is not None :
-                    new_position = create_position_dict(row['Date'], time, pe_sell_strike, position_dict[highest_pe_sell_key]['current_price'], 'PE')
-                    position_dict[f'pe_sell_pos_{pos_id}'] = new_position
-                 
-                    pos_id += 1
-
-                    # Create hedge position for PE Buy
-                    hedge_pe_buy = create_position_dict(row['Date'], time, pe_buy_strike, current_price_pe_buy, 'PE')
-                    position_dict[f'pe_buy_pos_{pos_id}'] = hedge_pe_buy
-         
-                    pos_id += 1
-
-                    # logging.info(f"Updated position with hedge for PE Sell at time {time_str}")
-                    save_position_to_file(position_dict, month_name, position_file)
-
-                continue  # Continue the loop to re-evaluate positions
-
-
-
-
-     
-            # Calculate PnL and update output
-            try:
-                total_pnl = 0  # Initialize total PnL
-
-                for key, pos in position_dict.items():
-                    # Skip if current_price is None
-                    if pos['current_price'] is None:
-                        # logging.warning(f"Skipping PnL update for position {key} as current_price is None.")
-                        continue
-
-                    if 'sell' in key and pos['current_price'] is not None and pos['entry_price'] is not None:
-                        # For sell positions, calculate as (entry_price - current_price) * qty
-                        # logging.debug(f"pos['entry_price']{pos['entry_price']}")
-                        # logging.debug(f"pos['current_price']{pos['current_price']}")
-                        pnl = (pos['entry_price'] - pos['current_price']) * pos['qty']
-                        # logging.debug(f"PnL for {key}: Sell position: {pnl}")
-
-                    elif 'buy' in key and pos['current_price'] is not None and pos['entry_price'] is not None:
-                        # For buy positions, calculate as (current_price - entry_price) * qty
-                        # logging.debug(f"pos['entry_price']{pos['entry_price']}")
-                        # logging.debug(f"pos['current_price']{pos['current_price']}")
-                        pnl = (pos['current_price'] - pos['entry_price']) * pos['qty']
-                        # logging.debug(f"PnL for {key}: Buy position: {pnl}")
-                    else:
-                        # logging.debug(f"Position {key} is neither sell nor buy; skipping.")
-                        pnl = 0
-
-                    total_pnl += pnl  # Accumulate the PnL for all positions
-
-                data = {'Date': [row['Date']], 'Time': [time_str], 'PnL': [total_pnl]}
-                df = pd.DataFrame(data)
-                output_path = Path(output_dir) / f"{month_name}.xlsx"
-
-                # logging.debug(f"Ensuring directory exists for output: {output_path.parent}")
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-
-                if not output_path.exists():
-                    df.to_excel(output_path, index=False)
-                else:
-                    with pd.ExcelWriter(output_path, mode='a', if_sheet_exists='overlay') as writer:
-                        df.to_excel(writer, index=False, header=False, startrow=writer.sheets['Sheet1'].max_row)
-                        # logging.debug(f"========EXCEL UPDATE ON DATE TIME {row['Date'] }{time_str}")
+    except Exception as e:
+        logging.error(f"Error monitoring positions for month: {month_name} - {e}")
 
+def monitor_positions_vectorized(position_book, option_df, option_file, ce_buy_strike, pe_buy_strike, ce_sell_strike, pe_sell_strike, expiry_date, month_name, position_journal, pnl_recorder, config=DEFAULT_CONFIG, option_chain=None):
+    # Same stop-loss / re-hedge semantics as monitor_positions, but the day's prices are pivoted into a
+    # minute x leg matrix up front and PnL is computed for whole stretches of minutes at once.
+    # Python only steps through the minutes where a stop-loss creates new positions.
+    try:
+        pos_id = len(position_book)
+
+        strikes = {'ce_sell': ce_sell_strike, 'pe_sell': pe_sell_strike, 'ce_buy': ce_buy_strike, 'pe_buy': pe_buy_strike}
+        option_df_filtered = leg_rows(option_df, fly_tickers(strikes, expiry_date, config.underlying), config.exit_time)
+        if option_df_filtered.empty:
+            return
+
+        if option_chain is None:
+            option_chain = OptionChainIndex(option_df_filtered, config.underlying)
+
+        # The loop processes a row only when its time is later than every row before it
+        seconds = frame_seconds(option_df_filtered)
+        processed = np.ones(len(seconds), dtype=bool)
+        processed[1:] = seconds[1:] > np.maximum.accumulate(seconds)[:-1]
+        rows = np.flatnonzero(processed)
+        minutes = seconds[rows]
+        dates = option_df_filtered['Date'].to_numpy()[rows]
+        times = option_df_filtered['Time'].to_numpy()[rows]
+
+        # Legs in the order monitor_positions matches them: CE sell, PE sell, CE buy, PE buy
+        legs = [(ce_sell_strike, 'CE'), (pe_sell_strike, 'PE'), (ce_buy_strike, 'CE'), (pe_buy_strike, 'PE')]
+        leg_grid = LegGrid(option_chain, expiry_date, legs, seconds.min(), seconds.max(), config.forward_fill_minutes)
+        quotes = leg_grid.quotes_many(minutes)
+        INSTRUMENTS.count('bars', len(minutes))
+        INSTRUMENTS.count('rows_skipped', len(seconds) - len(minutes))
+        INSTRUMENTS.count('price_lookups', quotes.size)
+        log_gap_stats(leg_grid, minutes, expiry_date, option_file, config)
+
+        # Leg each position is marked against (-1 for positions that match none of the legs)
+        position_book.assign_legs(legs)
+
+        # Carry the last known price forward, starting from the positions' current prices
+        marks = np.full(quotes.shape, np.nan)
+        start_prices = position_book.leg_start_prices()
+        for leg in range(len(legs)):
+            start_price = start_prices[leg]
+            column = quotes[:, leg]
+            last_seen = np.where(~np.isnan(column), np.arange(len(column)), -1)
+            last_seen = np.maximum.accumulate(last_seen)
+            marks[:, leg] = np.where(last_seen >= 0, column[np.maximum(last_seen, 0)], start_price)
+
+        def mark_positions(i):
+            position_book.mark(marks[i])
+            prices = {leg: marks[i, n] for n, leg in enumerate(legs) if not np.isnan(marks[i, n])}
+            position_journal.mark(dates[i], times[i].strftime('%H:%M:%S'), prices, position_book)
+
+        pnl_dates, pnl_times, pnl_values = [], [], []
+        start = 0
+        while start < len(minutes):
+            ce_entry = position_book.entry[position_book.latest_sell('CE')]
+            pe_entry = position_book.entry[position_book.latest_sell('PE')]
+            ce_mark = marks[start:, 0]
+            pe_mark = marks[start:, 1]
+
+            # A zero / missing price never triggers, matching the truthiness check in the loop
+            with np.errstate(invalid='ignore'):
+                ce_hit = (np.nan_to_num(ce_mark) != 0) & (ce_mark <= ce_entry * config.stop_loss_factor)
+                pe_hit = ~ce_hit & (np.nan_to_num(pe_mark) != 0) & (pe_mark < pe_entry * config.stop_loss_factor)
+            hedged = (ce_hit & ~np.isnan(quotes[start:, 2])) | (pe_hit & ~np.isnan(quotes[start:, 3]))
+            end = start + int(np.argmax(hedged)) if hedged.any() else len(minutes)
+
+            # Stops that fired before the hedge minute found no buy price to hedge with
+            INSTRUMENTS.count('stop_loss_ce', int(ce_hit[:end - start].sum()))
+            INSTRUMENTS.count('stop_loss_pe', int(pe_hit[:end - start].sum()))
+            INSTRUMENTS.count('stop_loss_unhedged', int((ce_hit | pe_hit)[:end - start].sum()))
+
+            # Mark-to-market PnL for every minute up to the next hedge, skipping minutes where a stop-loss fired
+            recorded = ~(ce_hit | pe_hit)[:end - start]
+            if recorded.any():
+                total_pnl = position_book.pnl_series(marks[start:end])
+                pnl_dates.extend(dates[start:end][recorded])
+                pnl_times.extend(t.strftime('%H:%M:%S') for t in times[start:end][recorded])
+                pnl_values.extend(total_pnl[recorded])
+
+            if end == len(minutes):
+                break
+
+            # Mark every position at the hedge minute, then open the new sell and its hedge
+            mark_positions(end)
+            side = 'CE' if ce_hit[end - start] else 'PE'
+            INSTRUMENTS.count(f'stop_loss_{side.lower()}')
+            INSTRUMENTS.count('hedges_opened')
+            INSTRUMENTS.event('stop_loss', "%s sell hit stop-loss at %s %s: %s", side, dates[end], times[end], marks[end, 0 if side == 'CE' else 1])
+            if config.square_off_on_stop:
+                square_off(position_book, position_journal, side, dates[end], times[end].strftime('%H:%M:%S'))
+            if ce_hit[end - start]:
+                opened = [
+                    (f'ce_sell_pos_{pos_id}', create_position_dict(dates[end], times[end], ce_sell_strike, marks[end, 0], 'CE', config.qty)),
+                    (f'ce_buy_pos_{pos_id + 1}', create_position_dict(dates[end], times[end], ce_buy_strike, quotes[end, 2], 'CE', config.qty)),
+                ]
+            else:
+                opened = [
+                    (f'pe_sell_pos_{pos_id}', create_position_dict(dates[end], times[end], pe_sell_strike, marks[end, 1], 'PE', config.qty)),
+                    (f'pe_buy_pos_{pos_id + 1}', create_position_dict(dates[end], times[end], pe_buy_strike, quotes[end, 3], 'PE', config.qty)),
+                ]
+            for key, position in opened:
+                position_book.add(key, position)
+                position_journal.open_position(key, position, position_book)
+                pos_id += 1
+            start = end + 1
 
-                # logging.info(f"Recorded PnL for {row['Date']} {time_str}: {pnl}")
+        # Leave every position marked at the day's last processed minute
+        mark_positions(len(minutes) - 1)
 
-            except Exception as e:
-                logging.error(f"Error calculating PnL for {row['Date']} {time_str} - {e}")
+        pnl_recorder.record_many(pnl_dates, pnl_times, pnl_values)
 
     except Exception as e:
-        logging.error(f"Error monitoring positions for month: {month_name} - {e}")
+        logging.error(f"Error monitoring positions (vectorized) for month: {month_name} - {e}")
 
 def find_first_matching_csv(index_dir, option_dir, month):
     try:
@@ -391,138 +553,593 @@ def find_first_matching_csv(index_dir, option_dir, month):
 
 
 
-def process_month_folder(index_dir, option_dir, month_name, expiry_date, output_dir):
-    global position_dict
-    try:
-        # logging.debug(f"Processing month folder for month: {month_name}")
-        position_file = Path(output_dir) / f"{month_name}_positions.json"
-        
-        # Use index file once to set up initial positions
-        index_file, first_option_file = find_first_matching_csv(index_dir, option_dir, month_name)
-        
-        if index_file and first_option_file:
-            # logging.info(f"Processing index file: {index_file}")
-            index_df = load_and_preprocess(index_file, '09:20:59')
-
-            if not index_df.empty:
-                atm = round_to_nearest_50(index_df.iloc[0]['Close'])
-                # logging.info(f'==ATM before strike prices calculated {atm}')
-                ce_sell_strike, pe_sell_strike, ce_buy_strike, pe_buy_strike = find_strike_prices(atm)
-                
-                option_df = load_and_preprocess(first_option_file,'09:20:59')
-
-                                # Define the time as a datetime.time object
-                time_to_search = datetime.strptime('09:20:59', '%H:%M:%S').time()
+def nearest_listed_strike(strike, strike_grid):
+    # The listed strike closest to `strike`; ties go to the lower strike
+    return int(strike_grid[np.argmin(np.abs(np.asarray(strike_grid) - strike))])
 
-                # Call the function with the time parameter
-                option_prices = extract_option_prices(option_df, ce_sell_strike, pe_sell_strike, ce_buy_strike, pe_buy_strike, expiry_date, time_to_search)
-                #option_prices = extract_option_prices(option_df, ce_sell_strike, pe_sell_strike, ce_buy_strike, pe_buy_strike, expiry_date)
 
-                # Initialize positions based on the first file
-                position_dict = {
-                    f'ce_sell_pos_0': create_position_dict(index_df.iloc[0]['Date'], index_df.iloc[0]['Time'], ce_sell_strike,option_prices['ce_sell'], 'CE'),
-                    f'pe_sell_pos_1': create_position_dict(index_df.iloc[0]['Date'], index_df.iloc[0]['Time'], pe_sell_strike,option_prices['pe_sell'], 'PE'),
-                    f'ce_buy_pos_2': create_position_dict(index_df.iloc[0]['Date'], index_df.iloc[0]['Time'], ce_buy_strike, option_prices['ce_buy'], 'CE'),
-                    f'pe_buy_pos_3': create_position_dict(index_df.iloc[0]['Date'], index_df.iloc[0]['Time'], pe_buy_strike, option_prices['pe_buy'], 'PE'),
-                }
+def iron_fly_strikes(index_close, config=DEFAULT_CONFIG, strike_grid=None):
+    # ATM straddle strikes and the wings around it. With the expiry's listed strikes (see
+    # dataset_catalog.py) each strike snaps to the nearest one actually traded.
+    atm = round_to_step(index_close, UNDERLYINGS[config.underlying].strike_step)
+    # logging.info(f'==ATM before strike prices calculated {atm}')
+    ce_sell_strike, pe_sell_strike, ce_buy_strike, pe_buy_strike = find_strike_prices(atm, config.wing_width)
+    strikes = {'ce_sell': ce_sell_strike, 'pe_sell': pe_sell_strike, 'ce_buy': ce_buy_strike, 'pe_buy': pe_buy_strike}
+    if strike_grid is not None and len(strike_grid):
+        strikes = {leg: nearest_listed_strike(strike, strike_grid) for leg, strike in strikes.items()}
+    return strikes
 
-            
-      
-           
-
-
-                try:
-                    total_pnl = 0  # Initialize total PnL
-
-                    for key, pos in position_dict.items():
-                        # Skip if current_price is None
-                        if pos['current_price'] is None:
-                            # logging.warning(f"Skipping PnL update for position {key} as current_price is None.")
-                            continue
 
-                        if 'sell' in key and pos['current_price'] is not None and pos['entry_price'] is not None:
-                            # For sell positions, calculate as (entry_price - current_price) * qty
-                            # logging.debug(f"pos['entry_price']{pos['entry_price']}")
-                            # logging.debug(f"pos['current_price']{pos['current_price']}")
-                            pnl = (pos['entry_price'] - pos['current_price']) * pos['qty']
-                            # logging.debug(f"PnL for {key}: Sell position: {pnl}")
+def iron_fly_book(entry_date, entry_time, strikes, option_prices, config=DEFAULT_CONFIG):
+    # The four opening positions; option_prices as returned by extract_option_prices
+    return PositionBook.from_dict({
+        f'ce_sell_pos_0': create_position_dict(entry_date, entry_time, strikes['ce_sell'], option_prices['ce_sell'], 'CE', config.qty),
+        f'pe_sell_pos_1': create_position_dict(entry_date, entry_time, strikes['pe_sell'], option_prices['pe_sell'], 'PE', config.qty),
+        f'ce_buy_pos_2': create_position_dict(entry_date, entry_time, strikes['ce_buy'], option_prices['ce_buy'], 'CE', config.qty),
+        f'pe_buy_pos_3': create_position_dict(entry_date, entry_time, strikes['pe_buy'], option_prices['pe_buy'], 'PE', config.qty),
+    })
 
-                        elif 'buy' in key and pos['current_price'] is not None and pos['entry_price'] is not None:
-                            # For buy positions, calculate as (current_price - entry_price) * qty
-                            # logging.debug(f"pos['entry_price']{pos['entry_price']}")
-                            # logging.debug(f"pos['current_price']{pos['current_price']}")
-                            pnl = (pos['current_price'] - pos['entry_price']) * pos['qty']
-                            # logging.debug(f"PnL for {key}: Buy position: {pnl}")
-                        else:
-                            # logging.debug(f"Position {key} is neither sell nor buy; skipping.")
-                            pnl = 0
 
-                        total_pnl += pnl  # Accumulate the PnL for all positions
+def underlying_index_rows(index_df, underlying='NIFTY'):
+    # The underlying's rows of an index file. NIFTY files without a recognised ticker are
+    # taken whole, as they always were.
+    if 'Ticker' in index_df:
+        rows = index_df[index_df['Ticker'].isin(UNDERLYINGS[underlying].index_tickers)]
+        if not rows.empty or underlying != 'NIFTY':
+            return rows
+    return index_df if underlying == 'NIFTY' else index_df.iloc[:0]
 
-                    data = {'Date': [index_df.iloc[0]['Date']], 'Time': [index_df.iloc[0]['Time']], 'PnL': [total_pnl]}
-                    df = pd.DataFrame(data)
-                    output_path = Path(output_dir) / f"{month_name}.xlsx"
 
-                    # logging.debug(f"Ensuring directory exists for output: {output_path.parent}")
-                    output_path.parent.mkdir(parents=True, exist_ok=True)
+def entry_spot(index_df, option_chain, expiry_date, config=DEFAULT_CONFIG):
+    # Spot at the first index bar: the underlying's index close, or when the index files do not
+    # carry the underlying, the put-call parity spot of its options at that bar
+    rows = underlying_index_rows(index_df, config.underlying)
+    if not rows.empty:
+        return rows.iloc[0]['Close']
+    time = index_df.iloc[0]['Time']
+    return option_chain.parity_spot(expiry_date, time.hour * 3600 + time.minute * 60 + time.second, config.forward_fill_minutes)
 
-                    if not output_path.exists():
-                        df.to_excel(output_path, index=False)
-                    else:
-                        with pd.ExcelWriter(output_path, mode='a', if_sheet_exists='overlay') as writer:
-                            df.to_excel(writer, index=False, header=False, startrow=writer.sheets['Sheet1'].max_row)
-           
-
-
-                
 
-                except Exception as e:
-                    logging.error(f"Error calculating PnL for {row['Date']} {time_str} - {e}")
+def is_expiry_day(options_file, expiry_date):
+    # Whether a day file (named ..._ddmmyyyy.csv) is the expiry day of expiry_date (e.g. 28MAR24)
+    return is_expiry_date(Path(options_file).stem.split('_')[-1], expiry_date, '%d%m%Y')
 
 
+def file_date(options_file):
+    # A day file's date as the data writes it (dd/mm/yyyy), from its name
+    return datetime.strptime(Path(options_file).stem.split('_')[-1], '%d%m%Y').strftime('%d/%m/%Y')
 
 
+def is_expiry_date(date, expiry_date, date_format='%d/%m/%Y'):
+    try:
+        return datetime.strptime(date, date_format).date() == datetime.strptime(expiry_date, '%d%b%y').date()
+    except ValueError:
+        return False
+
+
+def settlement_spot(index_df, option_chain, expiry_date, config=DEFAULT_CONFIG):
+    # Spot the expiring positions settle against: the underlying's index close at the last bar
+    # up to the exit time, or when the index files do not carry the underlying, the put-call
+    # parity spot of its options at the exit time, else at the last bar before it with both a
+    # call and a put of a strike. option_chain=None settles on the index only.
+    exit_time = datetime.strptime(config.exit_time, '%H:%M:%S').time()
+    exit_seconds = exit_time.hour * 3600 + exit_time.minute * 60 + exit_time.second
+    if index_df is not None:
+        rows = underlying_index_rows(index_df, config.underlying)
+        rows = rows[rows['Time'] <= exit_time]
+        if not rows.empty:
+            return float(spot_at(rows, [exit_seconds])[0])
+    if option_chain is None:
+        return None
+    spot = option_chain.parity_spot(expiry_date, exit_seconds, config.forward_fill_minutes)
+    if spot is None:
+        spot = option_chain.last_parity_spot(expiry_date, exit_seconds)
+    return spot
+
+
+def day_settlement_spot(options_file, index_file, expiry_date, config=DEFAULT_CONFIG, day_loader=None):
+    # settlement_spot of an expiry day file. Parity needs the whole chain of the expiry, not just
+    # the fly's legs (their strikes may have no bar near the exit), so the day file is read whole
+    # only when the index does not settle it.
+    index_df = load_and_preprocess(index_file) if index_file else None
+    spot = settlement_spot(index_df, None, expiry_date, config)
+    if spot is None:
+        day_loader = day_loader or DayLoader(None, (config.underlying,))
+        option_df = day_loader.load(options_file, config.entry_time)
+        if option_df is not None:
+            option_df = option_df[option_df['Time'] <= datetime.strptime(config.exit_time, '%H:%M:%S').time()]
+        spot = settlement_spot(None, OptionChainIndex(option_df, config.underlying), expiry_date, config)
+    return spot
+
+
+def settle_expiry(position_book, spot, date, position_journal, pnl_recorder):
+    # Close every open position at its intrinsic value (to the 0.01 tick of the price data) and
+    # record the settled PnL
+    rows = list(position_book.open_rows)
+    prices = [round(float(max(spot - position_book.strike[row], 0.0) if position_book.option_types[row] == 'CE' else max(position_book.strike[row] - spot, 0.0)), 2)
+              for row in rows]
+    position_book.close_many(rows, prices, date, SETTLEMENT_TIME)
+    for row, intrinsic in zip(rows, prices):
+        position_journal.close_position(position_book.keys[row], date, SETTLEMENT_TIME, intrinsic, position_book)
+        INSTRUMENTS.count('positions_settled')
+    pnl_recorder.record(date, SETTLEMENT_TIME, position_book.total_pnl())
+
+
+def open_iron_fly(index_df, option_chain, expiry_date, config=DEFAULT_CONFIG, strike_grid=None):
+    # Sell the ATM straddle and buy the wings, priced at the entry bar of the first option file
+    spot = entry_spot(index_df, option_chain, expiry_date, config)
+    if spot is None:
+        logging.error(f"No {config.underlying} spot at the entry bar")
+        return None, None
+    strikes = iron_fly_strikes(spot, config, strike_grid)
+
+    # Define the time as a datetime.time object
+    time_to_search = datetime.strptime(config.entry_time, '%H:%M:%S').time()
+    option_prices = extract_option_prices(option_chain, strikes['ce_sell'], strikes['pe_sell'], strikes['ce_buy'], strikes['pe_buy'], expiry_date, time_to_search, config.forward_fill_minutes)
+    if not option_prices:
+        # No entry price for some leg even after the fill; there is nothing to open
+        return None, strikes
+
+    # Entry is stamped with the first index bar, whichever underlying is traded
+    entry_date, entry_time = index_df.iloc[0]['Date'], index_df.iloc[0]['Time']
+    return iron_fly_book(entry_date, entry_time, strikes, option_prices, config), strikes
+
+
+def open_month(month_name, index_file, first_option_file, expiry_date, config=DEFAULT_CONFIG, cache_dir=None, result_cache=None, strike_grid=None, day_loader=None):
+    # Open the iron fly from the month's first index / option files. Returns (position_book,
+    # strikes, initial PnL row) or None if the index file fails to load. With a result cache,
+    # an opening whose files and config are unchanged is replayed without loading anything.
+    open_key = None
+    if result_cache is not None:
+        open_key = result_cache.key('open', index=result_cache.file_digest(index_file), day=result_cache.file_digest(first_option_file),
+                                    config=config.to_dict(), expiry=expiry_date, cached_load=cache_dir is not None,
+                                    strike_grid=None if strike_grid is None else [int(strike) for strike in strike_grid])
+        cached = result_cache.get(open_key)
+        if cached is not None:
+            return PositionBook.from_dict(cached['positions']), cached['strikes'], cached['initial']
+
+    index_df = load_and_preprocess(index_file, config.entry_time)
+    if index_df.empty:
+        logging.error(f"Index file {index_file} is empty or failed to load.")
+        return None
+    day_loader = day_loader or DayLoader(cache_dir, (config.underlying,))
+    option_df = day_loader.load(first_option_file, config.entry_time)
+    if option_df is None:
+        logging.error(f"Option file {first_option_file} failed to load; {month_name} not opened")
+        return None
+    option_chain = OptionChainIndex(option_df, config.underlying)
 
-                # pnl = (position_dict['ce_sell_pos_0']['current_price']*25 + position_dict['pe_sell_pos_1']['current_price'])*25 - (position_dict['ce_buy_pos_2']['current_price']*25 + position_dict['pe_buy_pos_3']['current_price']*25)
+    # Initialize positions based on the first file
+    position_book, strikes = open_iron_fly(index_df, option_chain, expiry_date, config, strike_grid)
+    if position_book is None:
+        logging.error(f"Could not price the iron fly entry for {month_name} in {first_option_file}; month not opened")
+        return None
 
-                # data = {'Date': [index_df.iloc[0]['Date']], 'Time': [index_df.iloc[0]['Time']], 'PnL': [pnl]}
-                # df = pd.DataFrame(data)
-                # output_path = Path(output_dir) / f"{month_name}.xlsx"
-                
-                # # logging.debug(f"Ensuring output directory exists: {output_path.parent}")
-                # output_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                # if not output_path.exists():
-                #     df.to_excel(output_path, index=False)
-                # else:
-                #     with pd.ExcelWriter(output_path, mode='a', if_sheet_exists='overlay') as writer:
-                #         df.to_excel(writer, index=False, header=False, startrow=writer.sheets['Sheet1'].max_row)
-                    
-                # logging.info(f"Initial PnL calculated and recorded for {index_df.iloc[0]['Date']} {index_df.iloc[0]['Time']}: {pnl}")
-
-                # Save initial position to the JSON file
-                save_position_to_file(position_dict, month_name, position_file)
-
-                # Continue processing the rest of the option files in the month
-                all_option_files = find_all_matching_option_files(option_dir, month_name)
-                
-                for options_file in all_option_files:
-                    # logging.info(f"===Processing option file=== {options_file}")
-                    options_df = load_and_preprocess(options_file,'09:20:59')
-                    monitor_positions(options_df, options_file, ce_buy_strike, pe_buy_strike, ce_sell_strike, pe_sell_strike, expiry_date, month_name, position_file, output_dir)
+    initial = None
+    try:
+        # Initial PnL of the freshly opened fly
+        initial = [index_df.iloc[0]['Date'], index_df.iloc[0]['Time'].strftime('%H:%M:%S'), position_book.total_pnl()]
+    except Exception as e:
+        logging.error(f"Error calculating initial PnL for {month_name} - {e}")
+
+    if open_key is not None and initial is not None:
+        result_cache.put(open_key, {'positions': position_book.to_dict(), 'strikes': strikes, 'initial': initial})
+    return position_book, strikes, initial
+
+
+def replay_cached_day(position_book, entry, position_journal, pnl_recorder):
+    # Apply a result cache entry as if the day had been monitored: open the positions it
+    # added, close the ones it closed, take its end-of-day prices and record its PnL rows
+    positions = entry['positions']
+    for key in list(positions)[len(position_book):]:
+        position = {name: value for name, value in positions[key].items() if not name.startswith('exit_')}
+        position_book.add(key, position)
+        position_journal.open_position(key, position, position_book)
+    for row, key in enumerate(position_book.keys):
+        position = positions[key]
+        if 'exit_price' in position and not position_book.closed[row]:
+            position_book.close(row, position['exit_price'], position['exit_date'], position['exit_time'])
+            position_journal.close_position(key, position['exit_date'], position['exit_time'], position['exit_price'], position_book)
+    for row in position_book.open_rows:
+        price = positions[position_book.keys[row]]['current_price']
+        position_book.current[row] = np.nan if price is None else price
+    pnl_recorder.record_many(*entry['pnl'])
+
+
+class DayLoader:
+    # Loads the option day files of a month for one or more runs. The most recent file is kept,
+    # so when several underlyings step through the same days each file is parsed once. A load
+    # for given tickers streams just their rows (load_day_rows); runs sharing the loader
+    # register their tickers up front (want) so one read covers all of them. A file that failed
+    # to load gives None; an empty frame is a day that loaded but has no rows for the tickers.
+
+    def __init__(self, cache_dir=None, underlyings=('NIFTY',)):
+        self.cache_dir = cache_dir
+        self.underlyings = tuple(underlyings)
+        self.wanted = set()
+        self.key = None
+        self.tickers = None
+        self.frame = None
+
+    def want(self, tickers):
+        self.wanted.update(tickers)
+
+    def load(self, options_file, time_filter=None, tickers=None):
+        key = (str(options_file), time_filter)
+        tickers = None if tickers is None else set(tickers)
+        # The kept frame serves any load it has every row for: a whole file, or a superset of the tickers
+        if key != self.key or (self.tickers is not None and (tickers is None or not tickers <= self.tickers)):
+            self.frame, self.tickers = self.read(options_file, time_filter, None if tickers is None else tickers | self.wanted)
+            self.key = key
+        if self.frame is None or tickers is None or tickers == self.tickers or self.frame.empty:
+            return self.frame
+        return self.frame[self.frame['Ticker'].isin(tickers)]
+
+    def read(self, options_file, time_filter, tickers):
+        # Returns (frame, tickers it holds the rows of; None for the whole file)
+        cache_dir = self.day_cache_dir(options_file)
+        with INSTRUMENTS.timer('load_day'):
+            if tickers is None:
+                frame = load_and_preprocess(options_file, time_filter, cache_dir, self.underlyings)
+            else:
+                frame = load_day_rows(options_file, tickers, time_filter, cache_dir, self.underlyings)
+        INSTRUMENTS.count('rows_loaded', len(frame))
+        # The loaders log a failure and return a frame without columns; a read with no rows
+        # still has its columns
+        if frame.columns.empty:
+            return None, tickers
+        return frame, tickers
+
+    def day_cache_dir(self, options_file):
+        return self.cache_dir
+
+
+class PrefetchingDayLoader(DayLoader):
+    # A DayLoader whose next day files are read on a background thread while the engine
+    # simulates the current one, so CSV parsing overlaps with monitoring and a month takes
+    # about max(I/O, compute) rather than their sum. prefetch() hands the thread the files
+    # still to run, in order, and the tickers to read them for. Backpressure: the thread waits
+    # while `depth` files or `memory_mb` of frames are queued ahead of the engine (one file is
+    # always allowed), so at most one file more than the cap is held. A load the queue cannot
+    # serve (another time filter, more tickers, a file outside the plan) is read as usual.
+
+    def __init__(self, cache_dir=None, underlyings=('NIFTY',), depth=PREFETCH_DEPTH, memory_mb=PREFETCH_MEMORY_MB):
+        super().__init__(cache_dir, underlyings)
+        self.depth = depth
+        self.memory_cap = memory_mb * 1024 * 1024
+        self.changed = threading.Condition()
+        self.thread = None
+        self.reset([])
+
+    def reset(self, plan):
+        self.plan = plan
+        self.ready = collections.deque()   # (plan index, time filter, tickers, frame, bytes)
+        self.ready_bytes = 0
+        self.consumed = 0                  # plan index of the engine: files before it are not read
+        self.done = False
+        self.stopped = False
+
+    def prefetch(self, options_files, time_filter=None, tickers=None):
+        # Start reading options_files ahead (for tickers; None reads whole files), replacing any
+        # earlier plan. The file the loader keeps already is not read again.
+        self.close()
+        plan = [str(options_file) for options_file in options_files if (str(options_file), time_filter) != self.key]
+        if self.depth <= 0 or not plan:
+            return
+        self.reset(plan)
+        tickers = None if tickers is None else set(tickers)
+        self.thread = threading.Thread(target=self.produce, args=(time_filter, tickers), name='day-prefetch', daemon=True)
+        self.thread.start()
+
+    def produce(self, time_filter, tickers):
+        try:
+            for index, options_file in enumerate(self.plan):
+                with self.changed:
+                    self.changed.wait_for(lambda: self.stopped or not self.ready or (len(self.ready) < self.depth and self.ready_bytes < self.memory_cap))
+                    if self.stopped:
+                        return
+                    if index < self.consumed:
+                        # The engine moved past it without a load (e.g. a result cache hit)
+                        continue
+                frame, read = DayLoader.read(self, Path(options_file), time_filter, tickers)
+                size = 0 if frame is None else int(frame.memory_usage(deep=True).sum())
+                with self.changed:
+                    self.ready.append((index, time_filter, read, frame, size))
+                    self.ready_bytes += size
+                    self.changed.notify_all()
+        except Exception as e:
+            logging.error(f"Error prefetching day files - {e}")
+        finally:
+            with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+    def take(self, options_file):
+        # The queued item of options_file, dropping the files before it the engine skipped;
+        # None when it is not in the plan (any more)
+        name = str(options_file)
+        with self.changed:
+            if name not in self.plan[self.consumed:]:
+                return None
+            target = self.plan.index(name, self.consumed)
+            self.consumed = target + 1
+            with INSTRUMENTS.timer('prefetch_wait'):
+                while True:
+                    while self.ready and self.ready[0][0] < target:
+                        self.ready_bytes -= self.ready.popleft()[4]
+                        self.changed.notify_all()
+                    if self.ready and self.ready[0][0] == target:
+                        item = self.ready.popleft()
+                        self.ready_bytes -= item[4]
+                        self.changed.notify_all()
+                        return item
+                    if self.done:
+                        return None
+                    self.changed.wait()
+
+    def read(self, options_file, time_filter, tickers):
+        item = self.take(options_file) if self.thread is not None else None
+        if item is not None:
+            _, read_filter, read, frame, _ = item
+            if read_filter == time_filter and (read is None or (tickers is not None and tickers <= read)):
+                INSTRUMENTS.count('prefetch_hits')
+                return frame, read
+        return super().read(options_file, time_filter, tickers)
+
+    def close(self):
+        if self.thread is None:
+            return
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+        self.thread.join()
+        self.thread = None
+        self.reset([])
+
+
+class MonthRun:
+    # One underlying's month in progress: its positions, journal and PnL report, advanced one
+    # option day file at a time (run_day) and written out by finish. On the expiry day the
+    # positions still open settle at intrinsic value (the spot taken from index_files), and
+    # with a GreeksRecorder the book's Greeks are reported for every PnL row.
+
+    def __init__(self, position_book, strikes, expiry_date, month_name, position_file, position_journal, pnl_recorder, engine='loop', completed_files=(), cache_dir=None, config=DEFAULT_CONFIG, result_cache=None, greeks=None, index_files=None):
+        self.position_book = position_book
+        self.strikes = strikes
+        self.expiry_date = expiry_date
+        self.month_name = month_name
+        self.position_file = position_file
+        self.position_journal = position_journal
+        self.pnl_recorder = pnl_recorder
+        self.engine = engine
+        self.completed_files = list(completed_files)
+        self.cache_dir = cache_dir
+        self.config = config
+        self.result_cache = result_cache
+        self.greeks = greeks
+        self.index_files = index_files or {}
+        # The only rows of a day file the month's positions are marked against
+        self.tickers = fly_tickers(strikes, expiry_date, config.underlying)
+
+    def run_day(self, options_file, day_loader):
+        if options_file.name in self.completed_files:
+            # Already covered by the checkpoint this run resumed from
+            return
+        position_book, strikes, config, result_cache = self.position_book, self.strikes, self.config, self.result_cache
+        legs = [strikes['ce_sell'], strikes['pe_sell'], strikes['ce_buy'], strikes['pe_buy']]
+        settles = is_expiry_day(options_file, self.expiry_date)
+        index_file = self.index_files.get(options_file.name)
+        with INSTRUMENTS.timer('day_file'):
+            # A day's result depends only on its file, the positions carried in and the config
+            # (and on the expiry day, the index file the positions settle against)
+            cached = None
+            if result_cache is not None:
+                day_key = result_cache.key('day', day=result_cache.file_digest(options_file), state=position_book.to_dict(), config=config.to_dict(),
+                                           expiry=self.expiry_date, legs=legs, engine=self.engine, cached_load=self.cache_dir is not None,
+                                           settle=result_cache.file_digest(index_file) if settles and index_file else settles)
+                cached = result_cache.get(day_key)
+
+            if cached is not None:
+                INSTRUMENTS.count('result_cache_hits')
+                replay_cached_day(position_book, cached, self.position_journal, self.pnl_recorder)
+            else:
+                first_row = len(self.pnl_recorder.pnls)
+                options_df = day_loader.load(options_file, config.entry_time, self.tickers)
+                loaded = options_df is not None
+                # Only open positions are monitored; a settled book has nothing left to mark. A
+                # day whose legs have no rows loaded fine: it records nothing, but still settles
+                # and is cached.
+                if loaded and len(position_book.open_rows):
+                    monitor = monitor_positions_vectorized if self.engine == 'vectorized' else monitor_positions
+                    monitor(position_book, options_df, options_file, strikes['ce_buy'], strikes['pe_buy'], strikes['ce_sell'], strikes['pe_sell'], self.expiry_date, self.month_name, self.position_journal, self.pnl_recorder, config)
+                if loaded and settles and len(position_book.open_rows):
+                    self.settle(options_file, day_loader, index_file)
+                # A day that failed to load is not cached, so it is retried next run
+                if result_cache is not None and loaded:
+                    INSTRUMENTS.count('result_cache_misses')
+                    result_cache.put(day_key, {
+                        'positions': position_book.to_dict(),
+                        'pnl': [self.pnl_recorder.dates[first_row:], self.pnl_recorder.times[first_row:], self.pnl_recorder.pnls[first_row:]],
+                    })
+        INSTRUMENTS.event('day_done', "Finished %s with %s %s positions", options_file.name, len(position_book), config.underlying)
+
+        if self.greeks is not None:
+            self.record_greeks(options_file, day_loader)
+
+        # Day end: persist the day's PnL rows, then checkpoint the positions
+        self.pnl_recorder.flush()
+        if self.greeks is not None:
+            self.greeks.flush()
+        self.completed_files.append(options_file.name)
+        self.position_journal.snapshot(position_book, checkpoint={'completed_files': self.completed_files, 'pnl_rows': len(self.pnl_recorder)})
+
+    def settle(self, options_file, day_loader, index_file):
+        config = self.config
+        spot = day_settlement_spot(options_file, index_file, self.expiry_date, config, day_loader)
+        if spot is None:
+            logging.error(f"No {config.underlying} settlement spot in {options_file.name}; positions left open")
+            return
+        INSTRUMENTS.event('settle', "Settling %s %s positions at spot %s", len(self.position_book.open_rows), config.underlying, spot)
+        settle_expiry(self.position_book, spot, file_date(options_file), self.position_journal, self.pnl_recorder)
+
+    def record_greeks(self, options_file, day_loader):
+        # Portfolio Greeks for the PnL rows recorded since the last flush (the day's rows, plus
+        # the opening row on the first day)
+        config, strikes = self.config, self.strikes
+        with INSTRUMENTS.timer('greeks'):
+            option_chain = OptionChainIndex(day_loader.load(options_file, config.entry_time, self.tickers), config.underlying)
+            index_file = self.index_files.get(options_file.name)
+            index_df = underlying_index_rows(load_and_preprocess(index_file), config.underlying) if index_file else None
+            legs = [(strikes['ce_sell'], 'CE'), (strikes['pe_sell'], 'PE'), (strikes['ce_buy'], 'CE'), (strikes['pe_buy'], 'PE')]
+            self.greeks.record_day(self.position_book, option_chain, self.expiry_date, legs, self.pnl_recorder.dates, self.pnl_recorder.times,
+                                   index_df, config.forward_fill_minutes)
+
+    def finish(self):
+        # Write the month's PnL report (a single write for xlsx / parquet)
+        self.pnl_recorder.close()
+
+        # Save the final state of the positions to the JSON file after processing
+        with open(self.position_file, 'w') as f:
+            json.dump(self.position_book.to_dict(), f, indent=4)
+        self.position_journal.close()
+
+        # The realized ledger of squared-off and settled positions, when there are any
+        ledger = self.position_book.ledger()
+        if ledger:
+            pd.DataFrame(ledger).to_csv(Path(self.position_file).with_name(f"{self.month_name}_realized.csv"), index=False)
+
+        # logging.info(f"Final position_dict saved to file: {position_file}")
+
+
+def run_option_files(position_book, option_dir, month_name, ce_buy_strike, pe_buy_strike, ce_sell_strike, pe_sell_strike, expiry_date, position_file, position_journal, pnl_recorder, engine='loop', completed_files=(), cache_dir=None, config=DEFAULT_CONFIG, result_cache=None, option_files=None):
+    strikes = {'ce_sell': ce_sell_strike, 'pe_sell': pe_sell_strike, 'ce_buy': ce_buy_strike, 'pe_buy': pe_buy_strike}
+    run = MonthRun(position_book, strikes, expiry_date, month_name, position_file, position_journal, pnl_recorder, engine, completed_files, cache_dir, config, result_cache)
+    # The month's day files, from the dataset catalog when the caller has one
+    all_option_files = option_files if option_files is not None else find_all_matching_option_files(option_dir, month_name)
+    day_loader = DayLoader(cache_dir, (config.underlying,))
+    for options_file in all_option_files:
+        run.run_day(options_file, day_loader)
+    run.finish()
+
+
+def start_month(index_dir, option_dir, month_name, expiry_date, output_dir, engine='loop', pnl_format='xlsx', resume=False, cache_dir=None, config=DEFAULT_CONFIG, result_cache=None, catalog=None, day_loader=None, greeks=False):
+    # Open (or resume) one underlying's month: returns its MonthRun, or None if it cannot be opened
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    position_file = Path(output_dir) / f"{month_name}_positions.json"
+    journal_path = Path(output_dir) / f"{month_name}_positions.journal.jsonl"
+    pnl_path = Path(output_dir) / f"{month_name}.{pnl_format}"
+    day_loader = day_loader or DayLoader(cache_dir, (config.underlying,))
+    # Each day's index file: the settlement spot on the expiry day and, with greeks, the spot of
+    # the per-bar Greeks that go next to the PnL report as <month>.greeks.csv
+    index_files = day_index_files(index_dir, option_dir, month_name, catalog)
+
+    # Pick up from the last day-end checkpoint of an interrupted run
+    if resume and journal_path.exists():
+        checkpoint_positions, journal_state = load_positions(journal_path, checkpoint_only=True)
+        if 'checkpoint' in journal_state and 'start' in journal_state:
+            position_book = PositionBook.from_dict(checkpoint_positions)
+            checkpoint = journal_state['checkpoint']
+            strikes = journal_state['start']['strikes']
+            # Journals written before a config field existed have its default
+            if journal_state['start'].get('config') is not None and StrategyConfig.from_dict(journal_state['start']['config']) != config:
+                logging.warning(f"Resuming {month_name} with a different strategy config than the interrupted run")
+            logging.info(f"Resuming {month_name} after {len(checkpoint['completed_files'])} completed option files")
+            position_journal = PositionJournal(journal_path, truncate_at=journal_state['offset'])
+            pnl_recorder = PnlRecorder(pnl_path, resume_rows=checkpoint['pnl_rows'])
+            greeks_recorder = GreeksRecorder(greeks_path(pnl_path), resume_rows=checkpoint['pnl_rows']) if greeks else None
+            return MonthRun(position_book, strikes, expiry_date, month_name, position_file, position_journal, pnl_recorder, engine, checkpoint['completed_files'], cache_dir, config, result_cache,
+                            greeks_recorder, index_files)
+
+    # Use index file once to set up initial positions; with a dataset catalog the month's files
+    # and listed strikes are looked up, not globbed
+    if catalog is not None:
+        index_file, first_option_file = catalog.first_files(month_name)
+        strike_grid = catalog.strike_grid(month_name, expiry_date, config.underlying)
+    else:
+        index_file, first_option_file = find_first_matching_csv(index_dir, option_dir, month_name)
+        strike_grid = None
+    if not (index_file and first_option_file):
+        logging.error(f"No matching files found for month: {month_name}")
+        return None
 
-                # Save the final state of position_dict to the JSON file after processing
-                with open(position_file, 'w') as f:
-                    json.dump(position_dict, f, indent=4)
+    opened = open_month(month_name, index_file, first_option_file, expiry_date, config, cache_dir, result_cache, strike_grid, day_loader)
+    if opened is None:
+        return None
+    position_book, strikes, initial = opened
+    pnl_recorder = PnlRecorder(pnl_path)
+    if initial is not None:
+        pnl_recorder.record(*initial)
+
+    # Start the position journal with the initial positions
+    position_journal = PositionJournal(journal_path)
+    position_journal.start(month_name, expiry_date, strikes, config.to_dict())
+    for key, pos in position_book.to_dict().items():
+        position_journal.open_position(key, pos)
+    greeks_recorder = GreeksRecorder(greeks_path(pnl_path)) if greeks else None
+    return MonthRun(position_book, strikes, expiry_date, month_name, position_file, position_journal, pnl_recorder, engine, (), cache_dir, config, result_cache,
+                    greeks_recorder, index_files)
+
+
+def process_month_folder(index_dir, option_dir, month_name, expiry_date, output_dir, engine='loop', pnl_format='xlsx', resume=False, cache_dir=None, config=DEFAULT_CONFIG, result_cache=None, catalog=None, greeks=False,
+                         prefetch=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MEMORY_MB):
+    day_loader = None
+    try:
+        # logging.debug(f"Processing month folder for month: {month_name}")
+        month_cache_dir = Path(cache_dir) / month_name if cache_dir is not None else None
+        day_loader = PrefetchingDayLoader(month_cache_dir, (config.underlying,), prefetch, prefetch_mb)
+        run = start_month(index_dir, option_dir, month_name, expiry_date, output_dir, engine, pnl_format, resume, month_cache_dir, config, result_cache, catalog, day_loader, greeks)
+        if run is None:
+            return None
+
+        # Continue processing the rest of the option files in the month, the next ones read
+        # ahead (for the fly's legs only) while the current one is monitored
+        option_files = catalog.option_files(month_name) if catalog is not None else find_all_matching_option_files(option_dir, month_name)
+        day_loader.want(run.tickers)
+        day_loader.prefetch([f for f in option_files if f.name not in run.completed_files], config.entry_time, day_loader.wanted)
+        for options_file in option_files:
+            run.run_day(options_file, day_loader)
+        run.finish()
+        return run.position_book
+    except Exception as e:
+        logging.error(f"Error processing month folder: {month_name} - {e}")
+    finally:
+        if day_loader is not None:
+            day_loader.close()
 
-                # logging.info(f"Final position_dict saved to file: {position_file}")
 
-            else:
-                logging.error(f"Index file {index_file} is empty or failed to load.")
-        else:
-            logging.error(f"No matching files found for month: {month_name}")
+def process_month_underlyings(index_dir, option_dir, month_name, runs, engine='loop', pnl_format='xlsx', resume=False, cache_dir=None, result_cache=None, catalog=None, greeks=False,
+                              prefetch=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MEMORY_MB):
+    # Several underlyings' months at once from a single parse of each day file: runs is
+    # {underlying: (expiry_date, output_dir, config)}. Returns {underlying: position_book}.
+    day_loader = None
+    try:
+        month_cache_dir = Path(cache_dir) / month_name if cache_dir is not None else None
+        day_loader = PrefetchingDayLoader(month_cache_dir, tuple(runs), prefetch, prefetch_mb)
+        month_runs = {}
+        for underlying, (expiry_date, output_dir, config) in runs.items():
+            run = start_month(index_dir, option_dir, month_name, expiry_date, output_dir, engine, pnl_format, resume, month_cache_dir, config, result_cache, catalog, day_loader, greeks)
+            if run is not None:
+                month_runs[underlying] = run
+                day_loader.want(run.tickers)
+
+        option_files = catalog.option_files(month_name) if catalog is not None else find_all_matching_option_files(option_dir, month_name)
+        if month_runs:
+            # Read ahead for every run's legs; days all runs completed before a resume are skipped
+            completed = set.intersection(*(set(run.completed_files) for run in month_runs.values()))
+            entry_time = next(iter(month_runs.values())).config.entry_time
+            day_loader.prefetch([f for f in option_files if f.name not in completed], entry_time, day_loader.wanted)
+        for options_file in option_files:
+            for run in month_runs.values():
+                run.run_day(options_file, day_loader)
+        for run in month_runs.values():
+            run.finish()
+        return {underlying: run.position_book for underlying, run in month_runs.items()}
     except Exception as e:
         logging.error(f"Error processing month folder: {month_name} - {e}")
+        return {}
+    finally:
+        if day_loader is not None:
+            day_loader.close()
 
 
 
@@ -533,11 +1150,14 @@ index_dir = '/Users/pranaygaurav/Downloads/AlgoTrading/1.Kredent_Strategy_And_Ta
 output_dir = '/Users/pranaygaurav/Downloads/AlgoTrading/1.Kredent_Strategy_And_Tasks/mohit_iron_fly_startegy/pnl_reports'
 
 
-# # List of expiry dates passed by the user
-# expiry_dates = ['27APR23', '25MAY23','29JUN23', '27JUL23','31AUG23', '28SEP23', '26OCT23', '30NOV23', '28DEC23','25JAN24', '29FEB24','28MAR24']
-# Run for APR_2023 only with the specified expiry date pattern (e.g., '27APR23')
-expiry_date = '28MAR24'
-process_month_folder(index_dir, option_dir, 'MAR_2024', expiry_date, output_dir)
+# List of expiry dates passed by the user; run_backtest.py runs all of them in parallel
+expiry_dates = ['27APR23', '25MAY23','29JUN23', '27JUL23','31AUG23', '28SEP23', '26OCT23', '30NOV23', '28DEC23','25JAN24', '29FEB24','28MAR24']
+
+if __name__ == '__main__':
+    setup_logging()
+    # Run for a single month with the specified expiry date pattern (e.g., '27APR23')
+    expiry_date = '28MAR24'
+    process_month_folder(index_dir, option_dir, 'MAR_2024', expiry_date, output_dir, engine='vectorized')
 
 
 
@@ -0,0 +1,33 @@
+import itertools
+from dataclasses import asdict, dataclass, fields, replace
+
+
+@dataclass(frozen=True)
+class StrategyConfig:
+    # Iron fly parameters that used to be hard-coded in single_month_backtest_copy2.py
+    wing_width: int = 700            # buy strikes at atm +/- wing_width
+    stop_loss_factor: float = 0.9    # re-hedge when the latest sell trades at entry_price * factor
+    entry_time: str = '09:20:59'     # first bar used to pick the ATM and open the fly
+    exit_time: str = '15:29:59'      # last bar monitored each day
+    qty: int = 25                    # lot size per leg
+    forward_fill_minutes: int = 5    # how far ahead a missing bar is looked up
+    underlying: str = 'NIFTY'        # index whose options are traded (see underlyings.py)
+    square_off_on_stop: bool = False # close the stopped sell and its hedge before re-hedging
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, values):
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in values.items() if k in names})
+
+
+DEFAULT_CONFIG = StrategyConfig()
+
+
+def config_grid(**param_values):
+    # Cartesian product of parameter lists, e.g. config_grid(wing_width=[500, 700], stop_loss_factor=[0.8, 0.9])
+    names = list(param_values)
+    return [replace(DEFAULT_CONFIG, **dict(zip(names, values)))
+            for values in itertools.product(*(param_values[name] for name in names))]
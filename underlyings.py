@@ -0,0 +1,28 @@
+from dataclasses import dataclass, replace
+
+from strategy_config import DEFAULT_CONFIG
+
+
+@dataclass(frozen=True)
+class Underlying:
+    # Contract specs of an index whose options are in the day files
+    name: str
+    strike_step: int       # ATM is rounded to this strike spacing
+    lot_size: int          # qty per leg
+    wing_width: int        # default distance of the bought wings from the ATM
+    index_tickers: tuple   # Ticker values of the spot index in the index files
+
+
+UNDERLYINGS = {
+    'NIFTY': Underlying('NIFTY', strike_step=50, lot_size=25, wing_width=700, index_tickers=('NIFTY', 'NIFTY 50')),
+    'BANKNIFTY': Underlying('BANKNIFTY', strike_step=100, lot_size=15, wing_width=1500, index_tickers=('BANKNIFTY', 'NIFTY BANK')),
+}
+
+
+def config_for(underlying, config=DEFAULT_CONFIG):
+    # The strategy config for trading `underlying`: a config written for it is used as is, any
+    # other keeps its stop-loss / timing rules and takes the underlying's lot size and wing width
+    if config.underlying == underlying:
+        return config
+    spec = UNDERLYINGS[underlying]
+    return replace(config, underlying=underlying, qty=spec.lot_size, wing_width=spec.wing_width)